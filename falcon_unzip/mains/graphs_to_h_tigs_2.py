@@ -5,6 +5,8 @@ I think this has implicit dependencies:
 * 2-falcon/sg_edges
 * 3-unzip/2-hasm/sg_edges
 """
+from .. import rid_to_phase
+from .. import sg_edges_list
 from ..proto import (cigartools, execute, sam2m4, haplotig as Haplotig)
 from ..proto.haplotig import Haplotig
 from ..tasks import top
@@ -46,6 +48,10 @@ global LOG
 global falcon_p_ctg_fa_obj
 LOG = logging.getLogger() # root, to inherit from sub-loggers
 
+# Per contig, in the bundle_dir of each unit of work (see write_bundle).
+BUNDLE_FN = 'bundle.json'
+BUNDLE_SG_EDGES_FN = 'sg_edges_list.bin'
+
 """
 aln = aln_dict[htig_name]
 qname, tname = aln[0:2]
@@ -58,7 +64,7 @@ tstrand, tstart, tend, tlen = aln[8:12]
 ### The main method for processing a single ctg_id. ###
 #######################################################
 def run_generate_haplotigs_for_ctg(input_):
-    ctg_id, proto_dir, out_dir, base_dir, allow_multiple_primaries, min_query_span, min_target_span = input_
+    ctg_id, proto_dir, out_dir, base_dir, allow_multiple_primaries, min_query_span, min_target_span, bundle_dir = input_
     LOG.info('Entering generate_haplotigs_for_ctg(ctg_id={!r}, out_dir={!r}, base_dir={!r}'.format(
         ctg_id, out_dir, base_dir))
     mkdir(out_dir)
@@ -73,13 +79,7 @@ def run_generate_haplotigs_for_ctg(input_):
     hdlr.setLevel(logging.DEBUG) # Set to INFO someday?
 
     try:
-        global all_haplotigs_for_ctg
-        global sg_edges
-        global p_ctg_tiling_paths
-
-        p_ctg_seq = falcon_p_ctg_fa_obj.fetch(ctg_id)
-        p_ctg_tiling_path = p_ctg_tiling_paths[ctg_id]
-        snp_haplotigs = all_haplotigs_for_ctg.get(ctg_id, {})
+        p_ctg_seq, p_ctg_tiling_path, snp_haplotigs, sg_edges = load_bundle(bundle_dir, ctg_id)
         return generate_haplotigs_for_ctg(ctg_id, p_ctg_seq, p_ctg_tiling_path, sg_edges,
                                             snp_haplotigs, allow_multiple_primaries,
                                             out_dir, proto_dir, min_query_span, min_target_span, logger)
@@ -101,8 +101,9 @@ def generate_haplotigs_for_ctg(ctg_id, p_ctg_seq, p_ctg_tiling_path, sg_edges,
     ctg_id              - string
     p_ctg_seq           - string, primary contig from 2-asm-falcon/p_ctg.fasta
     p_ctg_tiling_path   - List of tiling path edges from 2-asm-falcon/p_ctg_tiling_path for this particular ctg_id.
-    sg_edges            - List of all SG edges for this particular contig, from 3-unzip/1-hasm/sg_edges_list. Needs
+    sg_edges            - SgEdges of the SG edges, from 3-unzip/1-hasm/sg_edges_list(.bin), by (v, w). Needs
                           to contain reverse edges too (the main reason this is needed).
+                          The bundle of the contig has just the reverse edges of the snp_haplotigs paths.
     snp_haplotigs       - Dict of: snp_haplotigs[htig.name] = Haplotig(...), loaded from 3-unzip/1-hasm/p_ctg.fasta,
                           and marked with the correct phase.
     allow_multiple_primaries    - True or False. Will raise if False and there are multiple graph
@@ -127,7 +128,7 @@ def generate_haplotigs_for_ctg(ctg_id, p_ctg_seq, p_ctg_tiling_path, sg_edges,
 
     #########################################################
     # First, write out some data needed for reproducibility.
-    # These are extracted in define_globals from larger files.
+    # These are extracted from larger files in define_globals, and bundled per contig by cmd_split.
     # In case an outside user runs into a crash, we can't
     # really ask them to share gigabytes of
     # 3-unzip/1-hasm/* of data.
@@ -1370,16 +1371,45 @@ def get_rid2proto_dir(gath_fn):
     return result
 
 def load_sg_edges(sg_edges_list_fn):
-    sg_edges = {}
-    with io.open_progress(sg_edges_list_fn, 'r') as fp:
-        for line in fp:
-            sl = line.strip().split()
-            #THIS IS OKAY FOR NOW... TRs might be needed somewhere (zk)
-            #Most of the data is TR (transitively reduced) and loading it all takes GB++
-            if "TR" in sl[7]:
-                continue
-            sg_edges[(sl[0], sl[1])] = sl
-    return sg_edges
+    """Return the SgEdges of sg_edges_list_fn, which looks up the split line of an edge (v, w) by bisection,
+    memory-mapped if it is sg_edges_list.bin, so each apply chunk reads only the edges it reverses.
+    (TR edges are kept now, since they cost nothing until looked up.)
+    """
+    return sg_edges_list.load(sg_edges_list_fn, check=False)
+
+def write_bundle(bundle_dir, ctg_id):
+    """
+    Write the inputs of generate_haplotigs_for_ctg for ctg_id, from the globals of define_globals,
+    so that each apply chunk loads only those of its own contigs:
+        bundle_dir/bundle.json       - p_ctg_seq, the split lines of p_ctg_tiling_path, and the snp_haplotigs,
+                                       which carry the phase of their reads
+        bundle_dir/sg_edges_list.bin - the SG edges which reverse those of the haplotig paths (see reverse_sg_path)
+    """
+    mkdir(bundle_dir)
+    snp_haplotigs = all_haplotigs_for_ctg.get(ctg_id, {})
+    bundle = dict(
+        p_ctg_seq=falcon_p_ctg_fa_obj.fetch(ctg_id),
+        p_ctg_tiling_path=p_ctg_tiling_paths[ctg_id].dump_as_split_lines(),
+        snp_haplotigs=[htig.__dict__ for htig in snp_haplotigs.values()],
+    )
+    io.serialize(os.path.join(bundle_dir, BUNDLE_FN), bundle)
+    reverse_edges = [(sg_edges_list.node_id(reverse_end(edge[2])), sg_edges_list.node_id(reverse_end(edge[1])))
+                     for htig in snp_haplotigs.values() for edge in htig.path]
+    sg_edges_list.write_binary(os.path.join(bundle_dir, BUNDLE_SG_EDGES_FN),
+                               sg_edges_list.subset(sg_edges, reverse_edges))
+
+def load_bundle(bundle_dir, ctg_id):
+    """Return p_ctg_seq, p_ctg_tiling_path, snp_haplotigs, sg_edges, as written by write_bundle."""
+    bundle = io.deserialize(os.path.join(bundle_dir, BUNDLE_FN))
+    p_ctg_seq = bundle['p_ctg_seq']
+    p_ctg_tiling_path = tiling_path.load_tiling_paths_from_split_lines(
+            bundle['p_ctg_tiling_path'], contig_lens={ctg_id: len(p_ctg_seq)}, whitelist_seqs=None)[ctg_id]
+    snp_haplotigs = collections.OrderedDict()
+    for htig in bundle['snp_haplotigs']:
+        htig['phase'] = tuple(htig['phase']) # The json module converts a tuple to list.
+        snp_haplotigs[htig['name']] = Haplotig(**htig)
+    sg_edges = load_sg_edges(os.path.join(bundle_dir, BUNDLE_SG_EDGES_FN))
+    return p_ctg_seq, p_ctg_tiling_path, snp_haplotigs, sg_edges
 
 def define_globals(args):
     # make life easier for now. will refactor it out if possible
@@ -1400,17 +1430,11 @@ def define_globals(args):
 
     LOG.info('Loading phasing info and making the read ID sets.')
 
-    all_rid_to_phase = {}
-    all_flat_rid_to_phase = {}
-    with io.open_progress(args.rid_phase_map) as f:
-        for row in f:
-            row = row.strip().split()
-            # TODO - it is not clear if this is safe, but if it is we should do it
-            #if int(row[2]) == -1:
-            #    continue
-            all_rid_to_phase.setdefault(row[1], {})
-            all_rid_to_phase[row[1]][row[0]] = (int(row[2]), int(row[3]))
-            all_flat_rid_to_phase[row[0]] = (row[1], int(row[2]), int(row[3]))
+    # all_flat_rid_to_phase[rid] = (ctg_id, phase_blk_id, phase_id), memory-mapped if the map is binary.
+    # all_rid_to_phase is just the set of contigs which have phased reads.
+    # TODO - it is not clear if this is safe, but if it is we should skip the reads with block -1.
+    all_flat_rid_to_phase = rid_to_phase.load(args.rid_phase_map)
+    all_rid_to_phase = all_flat_rid_to_phase.contigs()
 
     # Load the primary contig sequences.
     LOG.info('Loading the 2-asm-falcon primary contigs.')
@@ -1439,7 +1463,9 @@ def define_globals(args):
 
     # Load all sg_edges_list so that haplotig paths can be reversed if needed.
     LOG.info('Loading sg_edges_list.')
-    sg_edges_list_fn = os.path.join(fc_hasm_path, 'sg_edges_list')
+    sg_edges_list_fn = os.path.join(fc_hasm_path, 'sg_edges_list.bin')
+    if not os.path.exists(sg_edges_list_fn):
+        sg_edges_list_fn = os.path.join(fc_hasm_path, 'sg_edges_list')
     sg_edges = load_sg_edges(sg_edges_list_fn)
     LOG.info('Done loading sg_edges_list.')
 
@@ -1458,32 +1484,25 @@ def cmd_apply(args):
         if os.path.isabs(path):
             return path
         return os.path.normpath(os.path.join(units_of_work_dn, path))
-    uow = units_of_work[0] # Get the common args from the first UOW.
-    sub_args = lambda: None # for attribute storage
-    sub_args.fc_asm_path = fixpath(uow['input']['fc_asm_path'])
-    sub_args.fc_hasm_path = fixpath(uow['input']['fc_hasm_path'])
-    sub_args.base_dir = fixpath(uow['input']['base_dir'])
-    sub_args.fasta = fixpath(uow['input']['fasta_fn'])
-    sub_args.rid_phase_map = fixpath(uow['input']['rid_phase_map'])
-
     min_query_span = args.min_query_span
     min_target_span = args.min_target_span
 
-    define_globals(sub_args)
-
+    # Each unit of work has its own bundle of inputs (see write_bundle), so we skip define_globals.
     exe_list = list()
     for i, uow in enumerate(units_of_work):
         ctg_id = uow['params']['ctg_id']
         proto_dir = uow['params']['proto_dir']
         out_dir = os.path.join('.', 'uow-{}'.format(ctg_id))
-        base_dir = sub_args.base_dir
+        base_dir = fixpath(uow['input']['base_dir'])
+        bundle_dir = fixpath(uow['input']['bundle_dir'])
 
-        exe_list.append((ctg_id, proto_dir, out_dir, base_dir, False, min_query_span, min_target_span))
+        exe_list.append((ctg_id, proto_dir, out_dir, base_dir, False, min_query_span, min_target_span, bundle_dir))
 
     LOG.info('Running {} units of work.'.format(len(exe_list)))
 
     results = list()
     for i, exe in enumerate(exe_list):
+        ctg_id = exe[0]
         out_dir = exe[2] # See prior for-loop. # TODO: with cd(out_dir)
 
         LOG.info('UOW #{} of {} ...'.format(i, len(exe_list)))
@@ -1526,6 +1545,8 @@ def cmd_split(args):
     ctg_id_list = list(pnames)
 
     LOG.info('Creating units-of-work for ctg_id_list (though many will be skipped): {}'.format(ctg_id_list))
+    # The bundles are next to the split-file, by absolute path, since the units of work are copied elsewhere.
+    bundles_dn = os.path.join(os.path.dirname(os.path.abspath(split_fn)), 'bundles')
 
     uows = []
     for ctg_id in ctg_id_list:
@@ -1534,6 +1555,8 @@ def cmd_split(args):
         if ctg_id not in all_rid_to_phase:
             continue
         proto_dir = rid2proto_dir[ctg_id]
+        bundle_dir = os.path.join(bundles_dn, ctg_id)
+        write_bundle(bundle_dir, ctg_id)
         uow = dict(
                 input=dict(
                     # common inputs:
@@ -1542,6 +1565,8 @@ def cmd_split(args):
                     base_dir = args.base_dir,
                     fasta_fn = args.fasta,
                     rid_phase_map = args.rid_phase_map,
+                    # this contig's inputs, from those:
+                    bundle_dir = bundle_dir,
                 ),
                 params=dict(
                     ctg_id=ctg_id,
@@ -1636,7 +1661,7 @@ def parse_args(argv):
 
     parser_split.add_argument(
         '--split-fn', required=True,
-        help='Output: JSON list of all units of work.')
+        help='Output: JSON list of all units of work. The inputs of each contig are bundled in bundles/{ctg_id}/ beside it.')
     parser_split.add_argument(
         '--bash-template-fn', required=True,
         help='Output: bash script to run a unit-of-work, given a record from JSON split-file.')
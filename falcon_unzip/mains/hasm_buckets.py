@@ -0,0 +1,178 @@
+"""Run the phased assembly of 1-hasm per contig.
+
+'ovlp_filter_with_phase --bucket-dir' keeps only overlaps between reads phased on the same
+primary contig, so the string graph is a disjoint union of one graph per contig. Here we
+  split: make one unit of work per contig bucket,
+  apply: run phased_ovlp_to_graph on each bucket, in its own directory,
+  merge: combine the graph files of all buckets, as if from one run of phased_ovlp_to_graph,
+so that graph_to_contig can write the usual p_ctg.fasta and tiling paths.
+"""
+import contextlib
+import logging
+import os
+import sys
+from .. import io
+from .. import sg_edges_list
+from . import phased_ovlp_to_graph
+
+LOG = logging.getLogger(__name__)
+
+# Written by phased_ovlp_to_graph. (utg_data0 is only for debugging.)
+# The contigs in ctg_paths are numbered, so we renumber them.
+GRAPH_FNS = ['sg_edges_list', 'utg_data', 'c_path']
+SG_EDGES_BIN_FN = 'sg_edges_list.bin'
+CTG_PATHS_FN = 'ctg_paths'
+
+
+def cmd_split(args):
+    bucket_dir = os.path.dirname(os.path.abspath(args.buckets_fn))
+    buckets = io.deserialize(args.buckets_fn)
+    with open(args.bash_template_fn, 'w') as stream:
+        stream.write('echo hi')  # The apply-script is given to gen_parallel_tasks directly.
+    uows = []
+    for ctg_id in sorted(buckets):
+        uow = dict(
+                input=dict(
+                    p_ovl=os.path.join(bucket_dir, buckets[ctg_id]),
+                ),
+                params=dict(
+                    ctg_id=ctg_id,
+                    min_len=args.min_len,
+                ),
+                wildcards=dict(
+                    chunk_id='chunk_{}'.format(ctg_id), # for later substitution
+                ),
+        )
+        uows.append(uow)
+    LOG.info('Split {} contig buckets into {!r}'.format(len(uows), args.split_fn))
+    io.serialize(args.split_fn, uows)
+
+
+def cmd_apply(args):
+    units_of_work = io.deserialize(args.units_of_work_fn)
+    units_of_work_dn = os.path.dirname(os.path.abspath(args.units_of_work_fn))
+    results = []
+    for i, uow in enumerate(units_of_work):
+        ctg_id = uow['params']['ctg_id']
+        p_ovl_fn = uow['input']['p_ovl']
+        if not os.path.isabs(p_ovl_fn):
+            p_ovl_fn = os.path.normpath(os.path.join(units_of_work_dn, p_ovl_fn))
+        out_dir = os.path.abspath('uow-{}'.format(ctg_id))
+        LOG.info('UOW #{} of {}: phased_ovlp_to_graph for {} in {!r}'.format(
+            i, len(units_of_work), ctg_id, out_dir))
+        io.mkdirs(out_dir)
+        argv = ['phased_ovlp_to_graph', p_ovl_fn, '--min-len', str(uow['params']['min_len'])]
+        with io.cd(out_dir), open('fc.log', 'w') as log_stream, contextlib.redirect_stdout(log_stream):
+            phased_ovlp_to_graph.main(argv)
+        results.append(dict(
+                ctg_id=ctg_id,
+                graph_dir=out_dir,
+        ))
+    io.serialize(args.results_fn, results)
+
+
+def merge_ctg_paths(fns, stream):
+    """Concatenate ctg_paths files, numbering the contigs of each after those of the ones before.
+    phased_ovlp_to_graph names linear contigs '%06dF' (and '%06dR' for the reverse),
+    and circular ones '%6d', counting from 0.
+    """
+    offset = 0
+    for fn in fns:
+        n_ctgs = 0
+        with open(fn) as istream:
+            for line in istream:
+                ctg_id, rest = line.lstrip().split(' ', 1)
+                if ctg_id[-1] in 'FR':
+                    number = int(ctg_id[:-1])
+                    new_ctg_id = '%06d%s' % (number + offset, ctg_id[-1])
+                else:
+                    number = int(ctg_id)
+                    new_ctg_id = '%6d' % (number + offset)
+                n_ctgs = max(n_ctgs, number + 1)
+                stream.write(new_ctg_id + ' ' + rest)
+        offset += n_ctgs
+    return offset
+
+
+def cmd_merge(args):
+    results = io.deserialize(args.results_fn)
+    # In order of ctg_id, whatever the order of the chunks.
+    graph_dirs = [r['graph_dir'] for r in sorted(results, key=lambda r: r['ctg_id'])]
+    for fn in GRAPH_FNS:
+        with open(fn, 'w') as stream:
+            for graph_dir in graph_dirs:
+                with open(os.path.join(graph_dir, fn)) as istream:
+                    stream.write(istream.read())
+    # The binary sg_edges_list too, unless a bucket lacks it (and then none, lest it be stale).
+    bin_fns = [os.path.join(d, SG_EDGES_BIN_FN) for d in graph_dirs]
+    if bin_fns and all(os.path.exists(fn) for fn in bin_fns):
+        sg_edges_list.write_binary(SG_EDGES_BIN_FN,
+                                   sg_edges_list.concatenate([sg_edges_list.load(fn) for fn in bin_fns]))
+    elif os.path.exists(SG_EDGES_BIN_FN):
+        os.remove(SG_EDGES_BIN_FN)
+    with open(CTG_PATHS_FN, 'w') as stream:
+        n_ctgs = merge_ctg_paths([os.path.join(d, CTG_PATHS_FN) for d in graph_dirs], stream)
+    LOG.info('Merged the graphs of {} contig buckets, with {} contigs.'.format(len(graph_dirs), n_ctgs))
+
+
+######
+import argparse
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Run phased_ovlp_to_graph per contig bucket, and merge the results.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    subparsers = parser.add_subparsers(help='sub-command help')
+    help_split = 'Split the buckets of "ovlp_filter_with_phase --bucket-dir" into units of work.'
+    help_apply = 'Apply "phased_ovlp_to_graph" to a subset of one or more units-of-work, serially.'
+    help_merge = 'Merge the graph files of each application into the current directory, for graph_to_contig.'
+    parser_split = subparsers.add_parser('split',
+            description=help_split,
+            help=help_split)
+    parser_apply = subparsers.add_parser('apply',
+            description=help_apply,
+            help=help_apply)
+    parser_merge = subparsers.add_parser('merge',
+            description=help_merge,
+            epilog='Writes: {}'.format(' '.join(GRAPH_FNS + [SG_EDGES_BIN_FN, CTG_PATHS_FN])),
+            help=help_merge)
+
+    parser_split.add_argument(
+        '--buckets-fn', required=True,
+        help='Input: buckets.json from "ovlp_filter_with_phase --bucket-dir".')
+    parser_split.add_argument(
+        '--min-len', type=int, default=2500,
+        help='Passed to phased_ovlp_to_graph.')
+    parser_split.add_argument(
+        '--split-fn', required=True,
+        help='Output: JSON list of all units of work.')
+    parser_split.add_argument(
+        '--bash-template-fn', required=True,
+        help='Output: dummy bash script.')
+    parser_split.set_defaults(func=cmd_split)
+
+    parser_apply.add_argument(
+        '--units-of-work-fn', required=True,
+        help='Input: JSON list of units of work. This can be one, several, or all of the list from subcommand "split".')
+    parser_apply.add_argument(
+        '--results-fn', required=True,
+        help='Output: JSON list of results, one record per unit-of-work.')
+    parser_apply.set_defaults(func=cmd_apply)
+
+    parser_merge.add_argument(
+        '--results-fn', required=True,
+        help='Input: JSON list of results, one record per unit-of-work, as gathered from "apply".')
+    parser_merge.set_defaults(func=cmd_merge)
+    args = parser.parse_args(argv[1:])
+    return args
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    args.func(args)
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -1,12 +1,16 @@
 from multiprocessing import Pool
-import subprocess
-import shlex
 import os
-import re
+import shutil
+import tempfile
+
+import numpy as np
+
 from .. import io
+from .. import overlaps
+from .. import rid_to_phase
 
 STRICTNESS = 0
-arid2phase = {}
+arid2phase = rid_to_phase.from_rows([])
 
 # TODO: Kill all threads gracefully if one encounters an error.
 """This whole program can hang with something like this:
@@ -25,286 +29,230 @@ But the most typical cause of error is a missing input, so just check that early
 """
 
 
+def get_phased_overlaps(db_fn, fn, las_reader):
+    """Decode the LAS file fn, and return the overlaps between reads
+    of the same contig which are not in opposite phases of the same block.
+    (No stage looks at any other overlap.)
+    """
+    ovls = overlaps.decode_las(db_fn, fn, proper_only=True, reader=las_reader)
+    q_ctg, q_blk, q_ph = arid2phase.lookup(ovls['q_id'])
+    t_ctg, t_blk, t_ph = arid2phase.lookup(ovls['t_id'])
+    kept = (q_ctg >= 0) & (q_ctg == t_ctg) & ~((q_blk == t_blk) & (q_ph != t_ph))
+    return ovls[kept]
+
+
+def phases(ovls):
+    """Return the (ctg, block, phase) arrays of q_id, then of t_id, for each overlap.
+    """
+    return arid2phase.lookup(ovls['q_id']) + arid2phase.lookup(ovls['t_id'])
+
+
+def is_good(ovls, min_len):
+    """Return the mask of overlaps which every stage considers:
+    identity at least 90%, and both reads at least min_len long.
+    """
+    return (ovls['idt'] >= 90) & (ovls['q_l'] >= min_len) & (ovls['t_l'] >= min_len)
+
+
+def is_same_phase(ovls):
+    """Return the mask of overlaps between reads of exactly the same (non -1) phase block and phase,
+    which is all that strictness > 0 keeps.
+    """
+    _, q_blk, q_ph, _, t_blk, t_ph = phases(ovls)
+    return (q_blk == t_blk) & (q_ph == t_ph) & (q_blk != -1)
+
+
+def write_id_bitmap(fn, ids):
+    """Write the set of read ids as a bitmap over the pread id space (bit i of byte i//8 for read i),
+    as .npy, so each worker can memory-map it instead of unpickling a set for every task.
+    It is written under a temporary name and renamed, like the overlap cache.
+    """
+    ids = np.fromiter(ids, dtype=np.int64, count=len(ids))
+    mask = np.zeros(int(ids.max()) + 1 if len(ids) else 0, dtype=bool)
+    mask[ids] = True
+    tmp_fn = fn + '.tmp.npy'
+    np.save(tmp_fn, np.packbits(mask, bitorder='little'))
+    os.rename(tmp_fn, fn)
+
+
+def load_id_bitmap(fn):
+    return np.load(fn, mmap_mode='r')
+
+
+def is_in(ids, bitmap):
+    """Return the mask of ids which are set in bitmap (from write_id_bitmap).
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    byte = ids >> 3
+    inside = np.flatnonzero(byte < len(bitmap))
+    found = np.zeros(len(ids), dtype=bool)
+    found[inside] = (bitmap[byte[inside]] >> (ids[inside] & 7)) & 1
+    return found
+
+
+def get_run_starts(ids):
+    """Return the index of the first row of each run of equal ids.
+    Overlaps are grouped by q_id this way, as consecutive rows, like the LAS file.
+    """
+    if len(ids) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(([0], np.flatnonzero(ids[1:] != ids[:-1]) + 1))
+
+
 def filter_stage1(input_):
-    db_fn, fn, max_diff, max_ovlp, min_ovlp, min_len = input_
+    """Decode fn once, caching its phased overlaps in cache_fn for the later stages.
+    Return the q_ids to ignore, for their 5' and 3' coverage.
+    """
+    db_fn, fn, las_reader, cache_fn, max_diff, max_ovlp, min_ovlp, min_len = input_
     try:
-        ignore_rtn = []
-        current_q_id = None
-        ave_idt = 0.0
-        all_over_len = 0.0
-        overlap_data = {"5p": 0, "3p": 0}
-        overlap_phase = {"5p": set(), "3p": set()}
-        q_id = None
-
-        for l in subprocess.check_output(shlex.split("LA4Falcon -mo %s %s" % (db_fn, fn)), encoding='ascii').splitlines():
-            l = l.strip().split()
-            q_id, t_id = l[:2]
-
-            if q_id not in arid2phase:
-                continue
-            if t_id not in arid2phase:
-                continue
-            if arid2phase[t_id][0] != arid2phase[q_id][0]:
-                continue
-
-            if arid2phase[t_id][1] == arid2phase[q_id][1] and arid2phase[t_id][2] != arid2phase[q_id][2]:
-                continue
-
-            if q_id != None and q_id != current_q_id:
-
-                left_count = overlap_data["5p"]
-                right_count = overlap_data["3p"]
-
-                if (left_count == 0 and min_ovlp <= right_count <= max_ovlp) or \
-                    (min_ovlp <= left_count <= max_ovlp and right_count == 0):
-                    # This is a good case. When a query has 0-count on one end
-                    # it's actually the left-most or right-most read sequenced
-                    # from a linear chromosome.
-                    pass
-
-                else:
-                    if abs(left_count - right_count) > max_diff:
-                        ignore_rtn.append(current_q_id)
-                    elif left_count > max_ovlp or right_count > max_ovlp:
-                        ignore_rtn.append(current_q_id)
-                    elif left_count < min_ovlp or right_count < min_ovlp:
-                        ignore_rtn.append(current_q_id)
-
-                # remove unphased reads if they are sandwiched by the reads from the same phase
-                if current_q_id not in arid2phase:
-                    left_set = overlap_phase["5p"]
-                    right_set = overlap_phase["3p"]
-                    if len(left_set & right_set) > 0:
-                        ignore_rtn.append(current_q_id)
-
-                overlap_data = {"5p": 0, "3p": 0}
-                overlap_phase = {"5p": set(), "3p": set()}
-                current_q_id = q_id
-                ave_idt = 0.0
-                all_over_len = 0.0
-
-            overlap_len = -int(l[2])
-            idt = float(l[3])
-            q_s, q_e, q_l = int(l[5]), int(l[6]), int(l[7])
-            t_s, t_e, t_l = int(l[9]), int(l[10]), int(l[11])
-
-            if idt < 90:
-                continue
-
-            if q_l < min_len or t_l < min_len:
-                continue
-
-            if l[-1] in ("contains", "overlap"):
-                ave_idt += idt * overlap_len
-                all_over_len += overlap_len
-            if q_s == 0:
-                overlap_data["5p"] += 1
-                if t_id in arid2phase:
-                    overlap_phase["5p"].add(arid2phase[t_id])
-            if q_e == q_l:
-                overlap_data["3p"] += 1
-                if t_id in arid2phase:
-                    overlap_phase["3p"].add(arid2phase[t_id])
-
-        if q_id != None:
-            left_count = overlap_data["5p"]
-            right_count = overlap_data["3p"]
-
-            if (left_count == 0 and min_ovlp <= right_count <= max_ovlp) or \
-                (min_ovlp <= left_count <= max_ovlp and right_count == 0):
-                # This is a good case. When a query has 0-count on one end
-                # it's actually the left-most or right-most read sequenced
-                # from a linear chromosome.
-                pass
-
-            else:
-
-                if abs(left_count - right_count) > max_diff:
-                    ignore_rtn.append(current_q_id)
-                elif left_count > max_ovlp or right_count > max_ovlp:
-                    ignore_rtn.append(current_q_id)
-                elif left_count < min_ovlp or right_count < min_ovlp:
-                    ignore_rtn.append(current_q_id)
-
-            # remove unphased reads if they are sandwiched by the reads from the same phase
-            if current_q_id not in arid2phase:
-                left_set = overlap_phase["5p"]
-                right_set = overlap_phase["3p"]
-                if len(left_set & right_set) > 0:
-                    ignore_rtn.append(current_q_id)
-
-        return fn, ignore_rtn
+        ovls = get_phased_overlaps(db_fn, fn, las_reader)
+        overlaps.write_cache(cache_fn, ovls)
+        if len(ovls) == 0:
+            return fn, []
+
+        starts = get_run_starts(ovls['q_id'])
+        good = is_good(ovls, min_len)
+        left_count = np.add.reduceat((good & (ovls['q_s'] == 0)).astype(np.int64), starts)
+        right_count = np.add.reduceat((good & (ovls['q_e'] == ovls['q_l'])).astype(np.int64), starts)
+
+        # When a query has 0-count on one end, it's actually the left-most or
+        # right-most read sequenced from a linear chromosome, so that is fine.
+        linear_end = ((left_count == 0) & (min_ovlp <= right_count) & (right_count <= max_ovlp)) | \
+            ((min_ovlp <= left_count) & (left_count <= max_ovlp) & (right_count == 0))
+        ignored = ~linear_end & (
+            (np.abs(left_count - right_count) > max_diff) |
+            (left_count > max_ovlp) | (right_count > max_ovlp) |
+            (left_count < min_ovlp) | (right_count < min_ovlp))
+        # (We used to also remove unphased reads sandwiched by reads of the same phase,
+        # but get_phased_overlaps keeps only the overlaps of phased reads.)
+        return fn, ovls['q_id'][starts][ignored].tolist()
 
     except (KeyboardInterrupt, SystemExit):
         return
 
 
 def filter_stage2(input_):
-    db_fn, fn, max_diff, max_ovlp, min_ovlp, min_len, ignore_set, strictness = input_
+    """Return the reads contained by another, among the good overlaps of reads not ignored.
+    """
+    fn, cache_fn, ignore_fn, min_len, strictness = input_
     try:
-        contained_id = set()
-        for l in subprocess.check_output(shlex.split("LA4Falcon -mo %s %s" % (db_fn, fn)), encoding='ascii').splitlines():
-            l = l.strip().split()
-            q_id, t_id = l[:2]
-
-            if q_id not in arid2phase:
-                continue
-            if t_id not in arid2phase:
-                continue
-
-            if arid2phase[t_id][0] != arid2phase[q_id][0]:
-                continue
-            if arid2phase[t_id][1] == arid2phase[q_id][1] and arid2phase[t_id][2] != arid2phase[q_id][2]:
-                continue
-
-            if strictness > 0:
-                ###############################################
-                # Added a couple more of strict filters:
-                # The phase needs to match exactly to add a read to contained list:
-                ###############################################
-                if arid2phase[t_id][1] != arid2phase[q_id][1] or arid2phase[t_id][2] != arid2phase[q_id][2]:
-                    continue
-                # If one of the reads is unphased, do not consider this "containment" call:
-                if arid2phase[t_id][1] == "-1" or arid2phase[q_id][1] == "-1":
-                    continue
-                ###############################################
-
-            q_s, q_e, q_l = int(l[5]), int(l[6]), int(l[7])
-            t_s, t_e, t_l = int(l[9]), int(l[10]), int(l[11])
-
-            idt = float(l[3])
-            if idt < 90:
-                continue
-
-            if q_l < min_len or t_l < min_len:
-                continue
-
-            if q_id in ignore_set:
-                continue
-            if t_id in ignore_set:
-                continue
-            if l[-1] == "contained":
-                contained_id.add(q_id)
-            if l[-1] == "contains":
-                contained_id.add(t_id)
+        ovls = overlaps.load_cache(cache_fn)
+        ignored = load_id_bitmap(ignore_fn)
+        kept = is_good(ovls, min_len) & ~is_in(ovls['q_id'], ignored) & ~is_in(ovls['t_id'], ignored)
+        if strictness > 0:
+            # The phase needs to match exactly to add a read to contained list,
+            # and if one of the reads is unphased, do not consider this "containment" call.
+            kept &= is_same_phase(ovls)
+        contained_id = set(ovls['q_id'][kept & (ovls['type'] == overlaps.OVERLAP_TYPE_CODE['contained'])].tolist())
+        contained_id.update(ovls['t_id'][kept & (ovls['type'] == overlaps.OVERLAP_TYPE_CODE['contains'])].tolist())
         return fn, contained_id
 
     except (KeyboardInterrupt, SystemExit):
         return
 
 
-def filter_stage3(input_):
+def format_phase(ctg, blk, ph):
+    return '{}.{}.{}'.format(arid2phase.ctg_names[ctg], blk, ph)
 
-    db_fn, fn, max_diff, max_ovlp, min_ovlp, min_len, ignore_set, contained_set, bestn, strictness = input_
 
-    overlap_data = {"5p": [], "3p": []}
+def format_p_ovl(ovls):
+    """Return the fields of a line of preads.p_ovl for each overlap:
+    the M4 fields, then the phases of q_id and t_id.
+    """
+    q_ctg, q_blk, q_ph, t_ctg, t_blk, t_ph = (a.tolist() for a in phases(ovls))
+    return [overlaps.format_m4(ovl) + [format_phase(q_ctg[i], q_blk[i], q_ph[i]),
+                                       format_phase(t_ctg[i], t_blk[i], t_ph[i])]
+            for i, ovl in enumerate(ovls)]
+
+
+def get_tied_ranges(keys):
+    """For rows sorted by keys (one key per row of the 2-d array),
+    yield the (start, stop) of each range of rows tied on all keys.
+    """
+    tied = np.flatnonzero((keys[:, 1:] == keys[:, :-1]).all(axis=0))
+    if len(tied) == 0:
+        return
+    breaks = np.flatnonzero(np.diff(tied) != 1)
+    firsts = tied[np.concatenate(([0], breaks + 1))]
+    lasts = tied[np.concatenate((breaks, [len(tied) - 1]))]
+    for first, last in zip(firsts.tolist(), lasts.tolist()):
+        yield first, last + 2
+
+
+def filter_stage3(input_):
+    """Write the best overlaps on each end of each read to out_fn, our shard of preads.p_ovl,
+    and return the number of lines. If by_contig, the lines are grouped by the contig of
+    their reads, and we also return the (ctg_id, number of bytes) of each group.
+
+    The overlaps of a q_id (a run of consecutive rows) are split into those on its 5' end
+    (q_s == 0) and the others on its 3' end, and each end is sorted:
+    in phase first, then longest, then with the least overhang (m_range) of t_id,
+    then by the fields of the line. We keep at least bestn overlaps of each end,
+    up to the first one with an overhang of more than 1000.
+    """
+    fn, cache_fn, ignore_fn, contained_fn, out_fn, min_len, bestn, strictness, by_contig = input_
     try:
-        ovlp_output = []
-        current_q_id = None
-        for l in subprocess.check_output(shlex.split("LA4Falcon -mo %s %s" % (db_fn, fn)), encoding='ascii').splitlines():
-            l = l.strip().split()
-            q_id, t_id = l[:2]
-
-            if q_id not in arid2phase:
-                continue
-            if t_id not in arid2phase:
-                continue
-
-            if arid2phase[t_id][0] != arid2phase[q_id][0]:
-                continue
-            if arid2phase[t_id][1] == arid2phase[q_id][1] and arid2phase[t_id][2] != arid2phase[q_id][2]:
-                continue
-
-            if strictness > 0:
-                # if arid2phase[t_id][1] == "-1" or arid2phase[q_id][1] == "-1":
-                #     continue
-                ###############################################
-                # Added a couple more of strict filters:
-                # The phase needs to match exactly, skip this overlap.
-                ###############################################
-                if arid2phase[t_id][1] != arid2phase[q_id][1] or arid2phase[t_id][2] != arid2phase[q_id][2]:
+        ovls = overlaps.load_cache(cache_fn)
+        if strictness > 0:
+            # The phase needs to match exactly, and if one of the reads is unphased,
+            # do not consider this overlap. (Such rows do not even separate the runs of a q_id.)
+            ovls = ovls[is_same_phase(ovls)]
+        run = np.zeros(len(ovls), dtype=np.int64)
+        run[get_run_starts(ovls['q_id'])[1:]] = 1
+        run = np.cumsum(run)
+
+        kept = is_good(ovls, min_len) & ((ovls['q_s'] == 0) | (ovls['q_e'] == ovls['q_l']))
+        for bitmap_fn in (contained_fn, ignore_fn):
+            bitmap = load_id_bitmap(bitmap_fn)
+            kept &= ~is_in(ovls['q_id'], bitmap) & ~is_in(ovls['t_id'], bitmap)
+        kept = np.flatnonzero(kept)
+        ovls, run = ovls[kept], run[kept]
+
+        # Both reads are in arid2phase (see get_phased_overlaps), on the same contig.
+        _, q_blk, q_ph, _, t_blk, t_ph = phases(ovls)
+        end = (ovls['q_s'] != 0).astype(np.int64)  # 5' before 3'
+        inphase = ((q_blk == t_blk) & (q_ph == t_ph)).astype(np.int64)
+        m_range = ovls['t_l'] - (ovls['t_e'] - ovls['t_s'])
+        # score is -(overlap length).
+        order = np.lexsort((m_range, ovls['score'], -inphase, end, run))
+        keys = np.stack([run, end, -inphase, ovls['score'], m_range])[:, order]
+        # Break the (rare) ties by the fields of the line, as a sort of tuples would.
+        for start, stop in get_tied_ranges(keys):
+            rows = order[start:stop]
+            order[start:stop] = [k for _, k in sorted(zip(format_p_ovl(ovls[rows]), rows.tolist()))]
+
+        # Position of each overlap within its end of its read.
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (keys[0, 1:] != keys[0, :-1]) | (keys[1, 1:] != keys[1, :-1])
+        block_starts = np.flatnonzero(first)
+        block = np.cumsum(first) - 1
+        pos = np.arange(len(order)) - block_starts[block]
+        # Keep each overlap up to and including the first one past bestn with m_range > 1000.
+        stop = ((pos >= bestn) & (keys[4] > 1000)).astype(np.int64)
+        stops_before = np.cumsum(stop) - stop
+        stops_before -= stops_before[block_starts][block]
+        selected = order[stops_before == 0]
+        groups = []
+        ctg_ids = []
+        if by_contig:
+            # Both reads are on the same contig. Keep the order within each contig.
+            q_ctg = arid2phase.lookup(ovls['q_id'][selected])[0]
+            selected = selected[np.argsort(q_ctg, kind='stable')]
+            ctg_ids = [arid2phase.ctg_names[c] for c in np.sort(q_ctg).tolist()]
+        ovlp_output = format_p_ovl(ovls[selected])
+        tmp_fn = out_fn + '.tmp'
+        with open(tmp_fn, 'w') as stream:
+            for k, l in enumerate(ovlp_output):
+                line = ' '.join(l) + '\n'
+                stream.write(line)
+                if not by_contig:
                     continue
-                # If one of the reads is unphased, do not consider this overlap.
-                if arid2phase[t_id][1] == "-1" or arid2phase[q_id][1] == "-1":
-                    continue
-                ###############################################
-
-            if current_q_id == None:
-                current_q_id = q_id
-                overlap_data = {"5p": [], "3p": []}
-
-            elif q_id != current_q_id:
-                left = overlap_data["5p"]
-                right = overlap_data["3p"]
-                left.sort()
-                right.sort()
-
-                for i in range(len(left)):
-                    inphase, score, m_range, ovlp = left[i]
-                    ovlp_output.append(ovlp)
-                    # print " ".join(ovlp), read_end_data[current_q_id]
-                    if i >= bestn and m_range > 1000:
-                        break
-
-                for i in range(len(right)):
-                    inphase, score, m_range, ovlp = right[i]
-                    ovlp_output.append(ovlp)
-                    # print " ".join(ovlp), read_end_data[current_q_id]
-                    if i >= bestn and m_range > 1000:
-                        break
-
-                overlap_data = {"5p": [], "3p": []}
-                current_q_id = q_id
-
-            if q_id in contained_set:
-                continue
-            if t_id in contained_set:
-                continue
-            if q_id in ignore_set:
-                continue
-            if t_id in ignore_set:
-                continue
-
-            overlap_len = -int(l[2])
-            idt = float(l[3])
-            q_s, q_e, q_l = int(l[5]), int(l[6]), int(l[7])
-            t_s, t_e, t_l = int(l[9]), int(l[10]), int(l[11])
-
-            if idt < 90:
-                continue
-            if q_l < min_len or t_l < min_len:
-                continue
-            if q_s == 0:
-                l.extend([".".join(arid2phase.get(current_q_id, "NA")), ".".join(arid2phase.get(t_id, "NA"))])
-                inphase = 1 if arid2phase.get(current_q_id, "NA") == arid2phase.get(t_id, "NA") else 0
-                #nphase = 1 if arid2phase[current_q_id] == arid2phase[t_id] else 0
-                overlap_data["5p"].append((-inphase, -overlap_len,  t_l - (t_e - t_s),  l))
-            elif q_e == q_l:
-                l.extend([".".join(arid2phase.get(current_q_id, "NA")), ".".join(arid2phase.get(t_id, "NA"))])
-                inphase = 1 if arid2phase.get(current_q_id, "NA") == arid2phase.get(t_id, "NA") else 0
-                #inphase = 1 if arid2phase[current_q_id] == arid2phase[t_id] else 0
-                overlap_data["3p"].append((-inphase, -overlap_len, t_l - (t_e - t_s), l))
-
-        left = overlap_data["5p"]
-        right = overlap_data["3p"]
-        left.sort()
-        right.sort()
-
-        for i in range(len(left)):
-            inphase, score, m_range, ovlp = left[i]
-            ovlp_output.append(ovlp)
-            # print " ".join(ovlp), read_end_data[current_q_id]
-            if i >= bestn and m_range > 1000:
-                break
-
-        for i in range(len(right)):
-            inphase, score, m_range, ovlp = right[i]
-            ovlp_output.append(ovlp)
-            # print " ".join(ovlp), read_end_data[current_q_id]
-            if i >= bestn and m_range > 1000:
-                break
-
-        return fn, ovlp_output
+                if groups and groups[-1][0] == ctg_ids[k]:
+                    groups[-1][1] += len(line)
+                else:
+                    groups.append([ctg_ids[k], len(line)])
+        os.rename(tmp_fn, out_fn)
+        return fn, len(ovlp_output), groups
     except (KeyboardInterrupt, SystemExit):
         return
 
@@ -316,52 +264,100 @@ def assert_exists(fn):
 
 
 def run(args):
+    db_fn = args.db
+
+    assert_exists(db_fn)
+
+    global arid2phase
+    assert_exists(args.rid_phase_map)
+    # Load it before the Pool forks, so the workers share it.
+    arid2phase = rid_to_phase.load(args.rid_phase_map)  # ctg_id, phase_blk_id, phase_id
+    assert len(arid2phase), 'Empty rid_phase_map: {!r}'.format(args.rid_phase_map)
+
+    if args.cache_dir:
+        cache_dir = args.cache_dir
+        io.mkdirs(cache_dir)
+    else:
+        cache_dir = tempfile.mkdtemp(prefix='ovlp_cache.', dir='.')
+    try:
+        filter_all(args, db_fn, cache_dir)
+    finally:
+        if not args.cache_dir:
+            shutil.rmtree(cache_dir)
+
+
+def filter_all(args, db_fn, cache_dir):
     max_diff = args.max_diff
     max_cov = args.max_cov
     min_cov = args.min_cov
     min_len = args.min_len
     bestn = args.bestn
-    db_fn = args.db
     strictness = args.strictness
-
-    assert_exists(db_fn)
-
-    with open(args.rid_phase_map) as f:
-        for row in f:
-            row = row.strip().split()
-            arid2phase[row[0]] = (row[1], row[2], row[3])  # ctg_id, phase_blk_id, phase_id
-    assert arid2phase, 'Empty rid_phase_map: {!r}'.format(args.rid_phase_map)
     exe_pool = Pool(args.n_core)
 
     file_list = list(io.yield_abspath_from_fofn(args.fofn))
+    cache_fns = {}
+    out_fns = {}
     inputs = []
-    for fn in file_list:
+    for i, fn in enumerate(file_list):
         assert_exists(fn)
-        inputs.append((db_fn, fn, max_diff, max_cov, min_cov, min_len))
+        cache_fns[fn] = os.path.join(cache_dir, '{:06d}.{}.npy'.format(i, os.path.basename(fn)))
+        out_fns[fn] = os.path.join(cache_dir, '{:06d}.{}.p_ovl'.format(i, os.path.basename(fn)))
+        inputs.append((db_fn, fn, args.las_reader, cache_fns[fn], max_diff, max_cov, min_cov, min_len))
 
-    ignore_all = []
+    ignore_all = set()
     for res in exe_pool.imap(filter_stage1, inputs):
-        ignore_all.extend(res[1])
+        ignore_all.update(res[1])
+    # The later stages get these sets as bitmap files, not in each task.
+    ignore_fn = os.path.join(cache_dir, 'ignore.bitmap.npy')
+    write_id_bitmap(ignore_fn, ignore_all)
 
     inputs = []
-    ignore_all = set(ignore_all)
     for fn in file_list:
         if len(fn) != 0:
-            inputs.append((db_fn, fn, max_diff, max_cov, min_cov, min_len, ignore_all, strictness))
+            inputs.append((fn, cache_fns[fn], ignore_fn, min_len, strictness))
     contained = set()
     for res in exe_pool.imap(filter_stage2, inputs):
         contained.update(res[1])
-        # print res[0], len(res[1]), len(contained)
+    contained_fn = os.path.join(cache_dir, 'contained.bitmap.npy')
+    write_id_bitmap(contained_fn, contained)
 
-    # print "all", len(contained)
     inputs = []
-    ignore_all = set(ignore_all)
     for fn in file_list:
         if len(fn) != 0:
-            inputs.append((db_fn, fn, max_diff, max_cov, min_cov, min_len, ignore_all, contained, bestn, strictness))
-    for res in exe_pool.imap(filter_stage3, inputs):
-        for l in res[1]:
-            print(" ".join(l))
+            inputs.append((fn, cache_fns[fn], ignore_fn, contained_fn, out_fns[fn], min_len, bestn, strictness,
+                           bool(args.bucket_dir)))
+    # Each worker writes its own shard. imap() returns in order, so we can stream
+    # each shard out as soon as it (and every one before it) is done.
+    n_lines = 0
+    buckets = {}
+    for fn, n, groups in exe_pool.imap(filter_stage3, inputs):
+        with open(out_fns[fn]) as stream:
+            if not args.bucket_dir:
+                shutil.copyfileobj(stream, sys.stdout)
+            for ctg_id, size in groups:
+                write_bucket(args.bucket_dir, buckets, ctg_id, stream.read(size))
+        n_lines += n
+    sys.stdout.flush()
+    if args.bucket_dir:
+        io.mkdirs(args.bucket_dir)  # even with no buckets
+        io.serialize(os.path.join(args.bucket_dir, 'buckets.json'), buckets)
+    return n_lines
+
+
+def write_bucket(bucket_dir, buckets, ctg_id, text):
+    """Append text to the preads.p_ovl of ctg_id in bucket_dir,
+    recording its path (relative to bucket_dir) in buckets the first time.
+    """
+    fn = os.path.join(ctg_id, 'preads.p_ovl')
+    if ctg_id not in buckets:
+        io.mkdirs(os.path.join(bucket_dir, ctg_id))
+        buckets[ctg_id] = fn
+        mode = 'w'
+    else:
+        mode = 'a'
+    with open(os.path.join(bucket_dir, fn), mode) as stream:
+        stream.write(text)
 
 
 ######
@@ -393,7 +389,20 @@ def parse_args(argv):
         help="output at least best n overlaps on 5' or 3' ends if possible")
     parser.add_argument(
         '--rid-phase-map', type=str,
-        help="the file that encode the relationship of the read id to phase blocks", required=True)
+        help="the file that encode the relationship of the read id to phase blocks "
+        "(text, or binary from phasing_gather --rid-to-phase-bin-fn)", required=True)
+    parser.add_argument(
+        '--las-reader', choices=overlaps.READERS, default='la4falcon',
+        help='read the .las files directly, or through LA4Falcon, or both, to check that they agree')
+    parser.add_argument(
+        '--cache-dir', type=str, default='',
+        help='directory for the overlaps decoded from each LAS file in stage 1 and re-read by stages 2 and 3; '
+        'if not given, a temporary directory here, removed at the end')
+    parser.add_argument(
+        '--bucket-dir', type=str, default='',
+        help='instead of writing to stdout, write the lines of each contig to BUCKET_DIR/<ctg_id>/preads.p_ovl '
+        '(in the same order), and the dict of ctg_id to path (relative to BUCKET_DIR) to BUCKET_DIR/buckets.json. '
+        'Every overlap we keep is between reads phased on the same contig.')
     parser.add_argument(
         '--strictness', type=int, default=STRICTNESS,
         help='If >0, keep *only* the edges which have both nodes of the same phase. Unphased edges are considered dangereous here and removed.')
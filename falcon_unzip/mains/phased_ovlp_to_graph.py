@@ -1,450 +1,487 @@
-import networkx as nx
+from .. import sg_edges_list
+from multiprocessing import Pool
+import array
+import collections
+import numpy as np
 import os
 import shlex
 
 DEBUG_LOG_LEVEL = 0
 
 
-class SGNode(object):
-    """
-    class representing a node in the string graph
-    """
-
-    def __init__(self, node_name):
-        self.name = node_name
-        self.out_edges = []
-        self.in_edges = []
-
-    def add_out_edge(self, out_edge):
-        self.out_edges.append(out_edge)
-
-    def del_out_edge(self, out_edge):
-        self.out_edges.remove(out_edge)
-
-    def add_in_edge(self, in_edge):
-        self.in_edges.append(in_edge)
-
-    def del_in_edge(self, in_edge):
-        self.in_edges.remove(in_edge)
-
-
-class SGEdge(object):
-    """
-    class representing an edge in the string graph
-    """
-
-    def __init__(self, in_node, out_node):
-        self.in_node = in_node
-        self.out_node = out_node
-        self.attr = {}
-
-    def set_attribute(self, attr, value):
-        self.attr[attr] = value
-
-
 def reverse_end(node_id):
     node_id, end = node_id.split(":")
     new_end = "B" if end == "E" else "E"
     return node_id + ":" + new_end
 
 
+# n_mark of mark_tr_edges
+VACANT, INPLAY, ELIMINATED = 0, 1, 2
+
+
 class StringGraph(object):
     """
-    class representing the string graph
+    class representing the string graph, in arrays
+
+    Node v is the end v & 1 (0 for B, 1 for E) of read v >> 1, whose name is read_names[v >> 1].
+    So the reverse of node v is v ^ 1, and that of edge (v, w) is (w ^ 1, v ^ 1).
+    Edges are numbered in the order they were added, and edge e goes from src[e] to dst[e],
+    with its attributes in parallel arrays: length, score, identity, and the label
+    (label_rid, label_b, label_e), i.e. read label_rid from label_b to label_e.
+    removed[e] is set by remove_cross_phase_edges(), and e_reduce[e] by the mark_*() methods.
+
+    remove_cross_phase_edges() also indexes the other edges, as the adjacency arrays:
+    the out-edges of v are out_edge[out_ptr[v]:out_ptr[v + 1]], sorted by length (then number),
+    the in-edges of v are in_edge[in_ptr[v]:in_ptr[v + 1]], by number,
+    and edge e has the reverse edge rev[e].
+    Nodes get their names only for output, from node_name().
     """
 
     def __init__(self):
-        self.nodes = {}
-        self.edges = {}
-        self.n_mark = {}
-        self.e_reduce = {}
-        self.repeat_overlap = {}
-
-    def add_node(self, node_name):
+        self.read_names = []
+        self.read_index = {}
+        # Until indexed, the edges are appended to compact arrays.
+        self._added = dict((k, array.array('q')) for k in ('src', 'dst'))
+        self._added.update((k, array.array('i')) for k in (
+            'length', 'score', 'label_rid', 'label_b', 'label_e', 'phase_src', 'phase_dst'))
+        self._added['identity'] = array.array('d')
+        self.n_edges = 0
+
+    @property
+    def n_nodes(self):
+        return 2 * len(self.read_names)
+
+    def add_read(self, read_name):
         """
-        add a node into the graph by given a node name
+        add a read by name, and return its index (so its nodes are 2 * index and 2 * index + 1)
         """
-        if node_name not in self.nodes:
-            self.nodes[node_name] = SGNode(node_name)
+        index = self.read_index.get(read_name)
+        if index is None:
+            index = self.read_index[read_name] = len(self.read_names)
+            self.read_names.append(read_name)
+        return index
 
-    def add_edge(self, in_node_name, out_node_name, **attributes):
+    def add_edge(self, in_node, out_node, label, length, score, identity, phase):
         """
-        add an edge into the graph by given a pair of nodes
+        add an edge by its pair of nodes.
+        label is (read index, begin, end), and phase is the (interned) phases of the pair.
+        Each pair of nodes must be added once, and each edge with its reverse.
         """
-        if (in_node_name, out_node_name) not in self.edges:
+        added = self._added
+        added['src'].append(in_node)
+        added['dst'].append(out_node)
+        added['label_rid'].append(label[0])
+        added['label_b'].append(label[1])
+        added['label_e'].append(label[2])
+        added['length'].append(length)
+        added['score'].append(score)
+        added['identity'].append(identity)
+        added['phase_src'].append(phase[0])
+        added['phase_dst'].append(phase[1])
+        self.n_edges += 1
+
+    def add_edges(self, src, dst, label_rid, label_b, label_e, length, score, identity, phase_src, phase_dst):
+        """
+        add edges from arrays of their attributes, as add_edge() adds one
+        """
+        added = self._added
+        for key, values in (('src', src), ('dst', dst), ('label_rid', label_rid), ('label_b', label_b),
+                            ('label_e', label_e), ('length', length), ('score', score), ('identity', identity),
+                            ('phase_src', phase_src), ('phase_dst', phase_dst)):
+            added[key].frombytes(np.ascontiguousarray(values, dtype=added[key].typecode).tobytes())
+        self.n_edges += len(src)
 
-            self.add_node(in_node_name)
-            self.add_node(out_node_name)
-            in_node = self.nodes[in_node_name]
-            out_node = self.nodes[out_node_name]
+    def node_name(self, v):
+        return "%s:%s" % (self.read_names[v >> 1], "E" if v & 1 else "B")
 
-            edge = SGEdge(in_node, out_node)
-            self.edges[(in_node_name, out_node_name)] = edge
-            in_node.add_out_edge(edge)
-            out_node.add_in_edge(edge)
-        edge = self.edges[(in_node_name, out_node_name)]
-        for k, v in attributes.items():
-            edge.attr[k] = v
+    def node_id(self, node_name):
+        read_name, end = node_name.split(":")
+        return 2 * self.read_index[read_name] + (1 if end == "E" else 0)
 
     def remove_cross_phase_edges(self):
-        to_remove = {}
-
-        for k, e in self.edges.items():
-            if e.attr["phase"][0] != e.attr["phase"][1]:
-                to_remove[k] = e
+        """
+        remove the edges between reads of different phases, index the others,
+        and return the numbers of the removed edges
+        """
+        added = self._added
+        del self._added
+
+        def column(key, dtype):
+            values = added.pop(key)
+            return np.frombuffer(values, dtype=values.typecode).astype(dtype)
+
+        self.src = column('src', np.int64)
+        self.dst = column('dst', np.int64)
+        self.length = column('length', np.int32)
+        self.score = column('score', np.int32)
+        self.identity = column('identity', np.float64)
+        self.label_rid = column('label_rid', np.int32)
+        self.label_b = column('label_b', np.int32)
+        self.label_e = column('label_e', np.int32)
+        self.removed = column('phase_src', np.int32) != column('phase_dst', np.int32)
+        self.e_reduce = np.zeros(self.n_edges, dtype=bool)
+        self._index()
+        return np.flatnonzero(self.removed)
+
+    def _index(self):
+        n_nodes = self.n_nodes
+        kept = np.flatnonzero(~self.removed)
+        src = self.src[kept]
+        dst = self.dst[kept]
+
+        self.out_edge = kept[np.lexsort((kept, self.length[kept], src))]
+        self.out_ptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(src, minlength=n_nodes), out=self.out_ptr[1:])
+        self.in_edge = kept[np.argsort(dst, kind='stable')]
+        self.in_ptr = np.zeros(n_nodes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(dst, minlength=n_nodes), out=self.in_ptr[1:])
+
+        keys = src * n_nodes + dst
+        order = np.argsort(keys)
+        sorted_keys = keys[order]
+        rev_keys = (dst ^ 1) * n_nodes + (src ^ 1)
+        pos = np.minimum(np.searchsorted(sorted_keys, rev_keys), max(len(kept) - 1, 0))
+        if len(kept) and not np.array_equal(sorted_keys[pos], rev_keys):
+            raise Exception('Some edges were added without their reverse edges.')
+        self.rev = np.full(self.n_edges, -1, dtype=np.int64)
+        self.rev[kept] = kept[order[pos]]
 
-        for k, e in to_remove.items():
-            in_node_name, out_node_name = k
-            in_node = self.nodes[in_node_name]
-            out_node = self.nodes[out_node_name]
-            in_node.del_out_edge(e)
-            out_node.del_in_edge(e)
-            del self.edges[k]
+    def init_reduce_dict(self):
+        self.e_reduce[:] = False
 
-        return to_remove
+    def out_degrees(self, reduced=True):
+        """
+        return the out-degree of each node, counting the reduced edges only if reduced
+        """
+        if reduced:
+            return np.diff(self.out_ptr)
+        live = self.out_edge[~self.e_reduce[self.out_edge]]
+        return np.bincount(self.src[live], minlength=self.n_nodes)
 
-    def init_reduce_dict(self):
-        for e in self.edges:
-            self.e_reduce[e] = False
+    def in_degrees(self, reduced=True):
+        if reduced:
+            return np.diff(self.in_ptr)
+        live = self.in_edge[~self.e_reduce[self.in_edge]]
+        return np.bincount(self.dst[live], minlength=self.n_nodes)
 
     def bfs_nodes(self, n, exclude=None, depth=5):
+        out_ptr = memoryview(self.out_ptr)
+        out_edge = memoryview(self.out_edge)
+        dst = memoryview(self.dst)
         all_nodes = set()
         all_nodes.add(n)
-        candidate_nodes = set()
-        candidate_nodes.add(n)
+        candidate_nodes = collections.deque()
+        candidate_nodes.append(n)
         dp = 1
         while dp < depth and len(candidate_nodes) > 0:
-            v = candidate_nodes.pop()
-            for e in v.out_edges:
-                w = e.out_node
+            v = candidate_nodes.popleft()
+            for i in range(out_ptr[v], out_ptr[v + 1]):
+                w = dst[out_edge[i]]
                 if w == exclude:
                     continue
                 if w not in all_nodes:
                     all_nodes.add(w)
-                    if len(w.out_edges) > 0:
-                        candidate_nodes.add(w)
+                    if out_ptr[w + 1] > out_ptr[w]:
+                        candidate_nodes.append(w)
             dp += 1
 
         return all_nodes
 
     def mark_chimer_edges(self):
-        multi_in_nodes = {}
-        multi_out_nodes = {}
-        for n_name in self.nodes:
-            n = self.nodes[n_name]
-            out_nodes = [e.out_node for e in n.out_edges if self.e_reduce[(e.in_node.name, e.out_node.name)] == False]
-            in_nodes = [e.in_node for e in n.in_edges if self.e_reduce[(e.in_node.name, e.out_node.name)] == False]
-
-            if len(out_nodes) >= 2:
-                multi_out_nodes[n_name] = out_nodes
-            if len(in_nodes) >= 2:
-                multi_in_nodes[n_name] = in_nodes
-
-        chimer_candidates = set()
-        out_set = set()
-        in_set = set()
-        for n_name in multi_out_nodes:
-            out_nodes = set(multi_out_nodes[n_name])
-            out_set |= out_nodes
-
-        for n_name in multi_in_nodes:
-            in_nodes = set(multi_in_nodes[n_name])
-            in_set |= in_nodes
-
-        chimer_candidates = out_set & in_set
+        src, dst, e_reduce, rev = self.src, self.dst, self.e_reduce, self.rev
+        n_nodes = self.n_nodes
+
+        # The nodes with more than one unreduced out-edge, or in-edge.
+        live = self.out_edge[~e_reduce[self.out_edge]]
+        multi_out = self.out_degrees(reduced=False) >= 2
+        multi_in = self.in_degrees(reduced=False) >= 2
+        out_set = np.zeros(n_nodes, dtype=bool)
+        out_set[dst[live[multi_out[src[live]]]]] = True
+        in_set = np.zeros(n_nodes, dtype=bool)
+        in_set[src[live[multi_in[dst[live]]]]] = True
+        chimer_candidates = np.flatnonzero(out_set & in_set).tolist()
+
+        out_ptr = memoryview(self.out_ptr)
+        out_edge = memoryview(self.out_edge)
+        in_ptr = memoryview(self.in_ptr)
+        in_edge = memoryview(self.in_edge)
+        e_reduce = memoryview(e_reduce)
+        dst = memoryview(dst)
+        src = memoryview(src)
+        rev = memoryview(rev)
 
         chimer_nodes = []
-        chimer_edges = set()
+        chimer_edges = []
         for n in chimer_candidates:
-            out_nodes = set([e.out_node for e in n.out_edges])
+            out_edges = out_edge[out_ptr[n]:out_ptr[n + 1]]
+            in_edges = in_edge[in_ptr[n]:in_ptr[n + 1]]
+            out_nodes = set(dst[e] for e in out_edges)
             test_set = set()
-            for in_node in [e.in_node for e in n.in_edges]:
-                test_set = test_set | set([e.out_node for e in in_node.out_edges])
-            test_set -= set([n])
+            for in_node in set(src[e] for e in in_edges):
+                test_set.update(dst[e] for e in out_edge[out_ptr[in_node]:out_ptr[in_node + 1]])
+            test_set.discard(n)
             if len(out_nodes & test_set) == 0:
                 flow_node1 = set()
                 flow_node2 = set()
-                for v in list(out_nodes):
+                for v in out_nodes:
                     flow_node1 |= self.bfs_nodes(v, exclude=n)
-                for v in list(test_set):
+                for v in test_set:
                     flow_node2 |= self.bfs_nodes(v, exclude=n)
                 if len(flow_node1 & flow_node2) == 0:
-                    for e in n.out_edges:
-                        v, w = e.in_node.name, e.out_node.name
-                        if self.e_reduce[(v, w)] != True:
-                            self.e_reduce[(v, w)] = True
-                            chimer_edges.add((v, w))
-                            rv = reverse_end(w)
-                            rw = reverse_end(v)
-                            self.e_reduce[(rv, rw)] = True
-                            chimer_edges.add((rv, rw))
-
-                    for e in n.in_edges:
-                        v, w = e.in_node.name, e.out_node.name
-                        if self.e_reduce[(v, w)] != True:
-                            self.e_reduce[(v, w)] = True
-                            chimer_edges.add((v, w))
-                            rv = reverse_end(w)
-                            rw = reverse_end(v)
-                            self.e_reduce[(rv, rw)] = True
-                            chimer_edges.add((rv, rw))
-                    chimer_nodes.append(n.name)
-                    chimer_nodes.append(reverse_end(n.name))
-
-        return chimer_nodes, chimer_edges
+                    for e in list(out_edges) + list(in_edges):
+                        if e_reduce[e] != True:
+                            e_reduce[e] = True
+                            e_reduce[rev[e]] = True
+                            chimer_edges.append(e)
+                            chimer_edges.append(rev[e])
+                    chimer_nodes.append(n)
+                    chimer_nodes.append(n ^ 1)
+
+        return chimer_nodes, np.unique(np.array(chimer_edges, dtype=np.int64))
+
+    def _reduce_with_reverse(self, edges):
+        """
+        mark edges and their reverse edges reduced, and return all of them
+        """
+        edges = np.union1d(edges, self.rev[edges])
+        self.e_reduce[edges] = True
+        return edges
 
     def mark_spur_edge(self):
-        removed_edges = set()
-        for v in self.nodes:
-            if len(self.nodes[v].out_edges) > 1:
-                for out_edge in self.nodes[v].out_edges:
-                    w = out_edge.out_node.name
-
-                    if len(self.nodes[w].out_edges) == 0 and self.e_reduce[(v, w)] != True:
-                        self.e_reduce[(v, w)] = True
-                        removed_edges.add((v, w))
-                        v2, w2 = reverse_end(w), reverse_end(v)
-                        self.e_reduce[(v2, w2)] = True
-                        removed_edges.add((v2, w2))
-
-            if len(self.nodes[v].in_edges) > 1:
-                for in_edge in self.nodes[v].in_edges:
-                    w = in_edge.in_node.name
-                    if len(self.nodes[w].in_edges) == 0 and self.e_reduce[(w, v)] != True:
-                        self.e_reduce[(w, v)] = True
-                        removed_edges.add((w, v))
-                        v2, w2 = reverse_end(w), reverse_end(v)
-                        self.e_reduce[(w2, v2)] = True
-                        removed_edges.add((w2, v2))
-        return removed_edges
-
-    def mark_tr_edges(self):
         """
-        transitive reduction
+        An edge is a spur if it leads to a node without out-edges from a node with others,
+        or comes from a node without in-edges to a node with others.
+        (This counts the reduced edges too.)
         """
-        n_mark = self.n_mark
-        e_reduce = self.e_reduce
-        FUZZ = 500
-        for n in self.nodes:
-            n_mark[n] = "vacant"
-
-        for n_name, node in self.nodes.items():
-
-            out_edges = node.out_edges
-            if len(out_edges) == 0:
-                continue
+        out_deg = self.out_degrees()
+        in_deg = self.in_degrees()
+        edges = self.out_edge
+        src = self.src[edges]
+        dst = self.dst[edges]
+        spur = ((out_deg[src] > 1) & (out_deg[dst] == 0)) | ((in_deg[dst] > 1) & (in_deg[src] == 0))
+        return self._reduce_with_reverse(edges[spur & ~self.e_reduce[edges]])
+
+    def mark_tr_edges(self, n_core=1):
+        """
+        transitive reduction
 
-            out_edges.sort(key=lambda x: x.attr["length"])
-
-            for e in out_edges:
-                w = e.out_node
-                n_mark[w.name] = "inplay"
-
-            max_len = out_edges[-1].attr["length"]
-
-            max_len += FUZZ
-
-            for e in out_edges:
-                e_len = e.attr["length"]
-                w = e.out_node
-                if n_mark[w.name] == "inplay":
-                    w.out_edges.sort(key=lambda x: x.attr["length"])
-                    for e2 in w.out_edges:
-                        if e2.attr["length"] + e_len < max_len:
-                            x = e2.out_node
-                            if n_mark[x.name] == "inplay":
-                                n_mark[x.name] = "eliminated"
-
-            for e in out_edges:
-                e_len = e.attr["length"]
-                w = e.out_node
-                w.out_edges.sort(key=lambda x: x.attr["length"])
-                if len(w.out_edges) > 0:
-                    x = w.out_edges[0].out_node
-                    if n_mark[x.name] == "inplay":
-                        n_mark[x.name] = "eliminated"
-                for e2 in w.out_edges:
-                    if e2.attr["length"] < FUZZ:
-                        x = e2.out_node
-                        if n_mark[x.name] == "inplay":
-                            n_mark[x.name] = "eliminated"
-
-            for out_edge in out_edges:
-                v = out_edge.in_node
-                w = out_edge.out_node
-                if n_mark[w.name] == "eliminated":
-                    e_reduce[(v.name, w.name)] = True
-                    v_name, w_name = reverse_end(w.name), reverse_end(v.name)
-                    e_reduce[(v_name, w_name)] = True
-                n_mark[w.name] = "vacant"
+        The marks of each node depend only on the graph, which stays read-only until
+        they are all found, so with n_core > 1 we split the nodes into ranges for forked workers.
+        """
+        # The out-neighbors and lengths in the order of out_edge, so each hop is a slice.
+        hops = (self.dst[self.out_edge], self.length[self.out_edge].astype(np.int64))
+        if n_core > 1:
+            global tr_graph
+            # Set it before the Pool forks, so the workers share the arrays (copy-on-write).
+            tr_graph = (self, hops)
+            try:
+                with Pool(n_core) as pool:
+                    reduced = np.concatenate(
+                        [np.zeros(0, dtype=np.int64)] +
+                        list(pool.imap(get_tr_edges_of_range, self._partition_nodes(4 * n_core))))
+            finally:
+                tr_graph = None
+        else:
+            reduced = self._get_tr_edges(0, self.n_nodes, hops)
+        self.e_reduce[reduced] = True
+        self.e_reduce[self.rev[reduced]] = True
 
-    def mark_best_overlap(self):
+    def _partition_nodes(self, n_parts):
         """
-        find the best overlapped edges
+        Return [begin, end) ranges of nodes, with about the same number of out-edges in each.
         """
+        bounds = np.searchsorted(self.out_ptr, np.linspace(0, self.out_ptr[-1], n_parts + 1))
+        bounds[0], bounds[-1] = 0, self.n_nodes
+        bounds = np.unique(bounds).tolist()
+        return list(zip(bounds[:-1], bounds[1:]))
 
-        best_edges = set()
-        removed_edges = set()
+    def _get_tr_edges(self, begin, end, hops):
+        """
+        Return the transitively redundant out-edges of the nodes in [begin, end).
 
-        for v in self.nodes:
+        This is Myers' linear expected-time algorithm: for each node n, mark its out-neighbors
+        "inplay", eliminate those reached again through another within the length of its
+        longest out-edge (+ FUZZ), and reduce the edges to the eliminated ones.
+        Out-edges are sorted by length, so each walk over a second hop can stop early.
+        n_mark is reset through the out-neighbors of n, the only nodes it touched.
+        """
+        out_ptr = memoryview(self.out_ptr)
+        out_edge = memoryview(self.out_edge)
+        out_dst, out_len = (memoryview(a) for a in hops)
+        n_mark = bytearray(self.n_nodes)  # VACANT
+        FUZZ = 500
+        reduced = []
 
-            out_edges = self.nodes[v].out_edges
-            if len(out_edges) > 0:
-                out_edges.sort(key=lambda e: -e.attr["score"])
-                for e in out_edges:
-                    if self.e_reduce[(e.in_node.name, e.out_node.name)] != True:
-                        best_edges.add((e.in_node.name, e.out_node.name))
-                        break
+        for n in range(begin, end):
+            out_b, out_e = out_ptr[n], out_ptr[n + 1]
+            if out_b == out_e:
+                continue
 
-            in_edges = self.nodes[v].in_edges
-            if len(in_edges) > 0:
-                in_edges.sort(key=lambda e: -e.attr["score"])
-                for e in in_edges:
-                    if self.e_reduce[(e.in_node.name, e.out_node.name)] != True:
-                        best_edges.add((e.in_node.name, e.out_node.name))
+            for i in range(out_b, out_e):
+                n_mark[out_dst[i]] = INPLAY
+
+            max_len = out_len[out_e - 1] + FUZZ
+
+            for i in range(out_b, out_e):
+                w = out_dst[i]
+                if n_mark[w] == INPLAY:
+                    limit = max_len - out_len[i]
+                    for j in range(out_ptr[w], out_ptr[w + 1]):
+                        if out_len[j] >= limit:
+                            break
+                        x = out_dst[j]
+                        if n_mark[x] == INPLAY:
+                            n_mark[x] = ELIMINATED
+
+            for i in range(out_b, out_e):
+                w = out_dst[i]
+                w_b, w_e = out_ptr[w], out_ptr[w + 1]
+                # The shortest out-edge of w, and any shorter than FUZZ.
+                for j in range(w_b, w_e):
+                    if j > w_b and out_len[j] >= FUZZ:
                         break
+                    x = out_dst[j]
+                    if n_mark[x] == INPLAY:
+                        n_mark[x] = ELIMINATED
 
-        if DEBUG_LOG_LEVEL > 1:
-            print("X", len(best_edges))
-
-        for e_n, e in self.edges.items():
-            v = e_n[0]
-            w = e_n[1]
-            if self.e_reduce[(v, w)] != True:
-                if (v, w) not in best_edges:
-                    self.e_reduce[(v, w)] = True
-                    removed_edges.add((v, w))
-                    v2, w2 = reverse_end(w), reverse_end(v)
-                    self.e_reduce[(v2, w2)] = True
-                    removed_edges.add((v2, w2))
-
-        return removed_edges
-
-    def resolve_repeat_edges(self):
-        edges_to_reduce = []
-        nodes_to_test = set()
-        for v_n, v in self.nodes.items():
+            for i in range(out_b, out_e):
+                w = out_dst[i]
+                if n_mark[w] == ELIMINATED:
+                    reduced.append(out_edge[i])
+                n_mark[w] = VACANT
 
-            out_nodes = []
-            for e in v.out_edges:
-                if self.e_reduce[(e.in_node.name, e.out_node.name)] == False:
-                    out_nodes.append(e.out_node.name)
+        return np.array(reduced, dtype=np.int64)
 
-            in_nodes = []
-            for e in v.in_edges:
-                if self.e_reduce[(e.in_node.name, e.out_node.name)] == False:
-                    in_nodes.append(e.in_node.name)
-
-            if len(out_nodes) == 1 and len(in_nodes) == 1:
-                nodes_to_test.add(v_n)
+    def mark_best_overlap(self):
+        """
+        find the best overlapped edges
+        """
+        src, dst, score, e_reduce = self.src, self.dst, self.score, self.e_reduce
+
+        # The best of the unreduced out-edges of each node has the highest score,
+        # then the shortest length; of the in-edges, the highest score.
+        # (Ties go to the edge added first.)
+        live = self.out_edge[~e_reduce[self.out_edge]]
+        order = np.lexsort((live, self.length[live], -score[live], src[live]))
+        best_out = live[order][get_run_starts(src[live][order])]
+        order = np.lexsort((live, -score[live], dst[live]))
+        best_in = live[order][get_run_starts(dst[live][order])]
+        best_edges = np.zeros(self.n_edges, dtype=bool)
+        best_edges[best_out] = True
+        best_edges[best_in] = True
 
-        for v_n in nodes_to_test:
+        if DEBUG_LOG_LEVEL > 1:
+            print("X", np.count_nonzero(best_edges))
 
-            v = self.nodes[v_n]
+        return self._reduce_with_reverse(live[~best_edges[live]])
 
-            out_nodes = []
-            for e in v.out_edges:
-                if self.e_reduce[(e.in_node.name, e.out_node.name)] == False:
-                    out_nodes.append(e.out_node.name)
+    def resolve_repeat_edges(self):
+        out_ptr = memoryview(self.out_ptr)
+        out_edge = memoryview(self.out_edge)
+        in_ptr = memoryview(self.in_ptr)
+        in_edge = memoryview(self.in_edge)
+        src = memoryview(self.src)
+        dst = memoryview(self.dst)
+        e_reduce = memoryview(self.e_reduce)
+        live_out_deg = self.out_degrees(reduced=False)
+        live_in_deg = self.in_degrees(reduced=False)
+
+        def live_out_node(v):
+            for e in out_edge[out_ptr[v]:out_ptr[v + 1]]:
+                if e_reduce[e] == False:
+                    return dst[e]
+
+        def live_in_node(v):
+            for e in in_edge[in_ptr[v]:in_ptr[v + 1]]:
+                if e_reduce[e] == False:
+                    return src[e]
+
+        def out_nodes(v):
+            return set(dst[e] for e in out_edge[out_ptr[v]:out_ptr[v + 1]])
+
+        def in_nodes(v):
+            return set(src[e] for e in in_edge[in_ptr[v]:in_ptr[v + 1]])
+
+        to_test = (live_out_deg == 1) & (live_in_deg == 1)
+        nodes_to_test = np.flatnonzero(to_test).tolist()
+        live_out_deg = memoryview(live_out_deg)
+        live_in_deg = memoryview(live_in_deg)
+        to_test = memoryview(to_test)
 
-            in_nodes = []
-            for e in v.in_edges:
-                if self.e_reduce[(e.in_node.name, e.out_node.name)] == False:
-                    in_nodes.append(e.in_node.name)
+        edges_to_reduce = []
+        for v in nodes_to_test:
+            in_node = live_in_node(v)
+            v_out_nodes = out_nodes(v)
+            for e in out_edge[out_ptr[in_node]:out_ptr[in_node + 1]]:
+                ww = dst[e]
+                o_overlap = len(out_nodes(ww) & v_out_nodes)
+                if ww != v and\
+                   e_reduce[e] == False and\
+                   live_in_deg[ww] > 1 and\
+                   not to_test[ww] and\
+                   o_overlap == 0:
+                    edges_to_reduce.append(e)
+
+            out_node = live_out_node(v)
+            v_in_nodes = in_nodes(v)
+            for e in in_edge[in_ptr[out_node]:in_ptr[out_node + 1]]:
+                vv = src[e]
+                i_overlap = len(in_nodes(vv) & v_in_nodes)
+                if vv != v and\
+                   e_reduce[e] == False and\
+                   live_out_deg[vv] > 1 and\
+                   not to_test[vv] and\
+                   i_overlap == 0:
+                    edges_to_reduce.append(e)
 
-            in_node_name = in_nodes[0]
+        removed_edges = np.unique(np.array(edges_to_reduce, dtype=np.int64))
+        self.e_reduce[removed_edges] = True
 
-            for out_edge in self.nodes[in_node_name].out_edges:
-                vv = out_edge.in_node.name
-                ww = out_edge.out_node.name
+        return removed_edges
 
-                ww_out = self.nodes[ww].out_edges
-                v_out = self.nodes[v_n].out_edges
-                ww_out_nodes = set([n.out_node.name for n in ww_out])
-                v_out_nodes = set([n.out_node.name for n in v_out])
-                o_overlap = len(ww_out_nodes & v_out_nodes)
+    def find_edge(self, v, w):
+        """
+        return the number of edge (v, w)
+        """
+        for e in self.out_edge[self.out_ptr[v]:self.out_ptr[v + 1]].tolist():
+            if self.dst[e] == w:
+                return e
+        raise KeyError((v, w))
 
-                ww_in_count = 0
-                for e in self.nodes[ww].in_edges:
-                    if self.e_reduce[(e.in_node.name, e.out_node.name)] == False:
-                        ww_in_count += 1
+    def get_out_edges_for_node(self, v):
+        """
+        return the unreduced out-edges of node v
+        """
+        edges = self.out_edge[self.out_ptr[v]:self.out_ptr[v + 1]]
+        return edges[~self.e_reduce[edges]]
 
-                if ww != v_n and\
-                   self.e_reduce[(vv, ww)] == False and\
-                   ww_in_count > 1 and\
-                   ww not in nodes_to_test and\
-                   o_overlap == 0:
-                    edges_to_reduce.append((vv, ww))
+    def get_in_edges_for_node(self, v):
+        edges = self.in_edge[self.in_ptr[v]:self.in_ptr[v + 1]]
+        return edges[~self.e_reduce[edges]]
 
-            out_node_name = out_nodes[0]
+    def get_best_out_edge_for_node(self, v):
+        edges = self.get_out_edges_for_node(v)
+        return edges[np.argsort(self.score[edges], kind='stable')][-1]
 
-            for in_edge in self.nodes[out_node_name].in_edges:
-                vv = in_edge.in_node.name
-                ww = in_edge.out_node.name
+    def get_best_in_edge_for_node(self, v):
+        edges = self.get_in_edges_for_node(v)
+        return edges[np.argsort(self.score[edges], kind='stable')][-1]
 
-                vv_in = self.nodes[vv].in_edges
-                v_in = self.nodes[v_n].in_edges
-                vv_in_nodes = set([n.in_node.name for n in vv_in])
-                v_in_nodes = set([n.in_node.name for n in v_in])
-                i_overlap = len(vv_in_nodes & v_in_nodes)
 
-                vv_out_count = 0
-                for e in self.nodes[vv].out_edges:
-                    if self.e_reduce[(e.in_node.name, e.out_node.name)] == False:
-                        vv_out_count += 1
+tr_graph = None  # (StringGraph, hops) for the workers of mark_tr_edges
 
-                if vv != v_n and\
-                   self.e_reduce[(vv, ww)] == False and\
-                   vv_out_count > 1 and\
-                   vv not in nodes_to_test and\
-                   i_overlap == 0:
-                    edges_to_reduce.append((vv, ww))
 
-        removed_edges = set()
-        for e in edges_to_reduce:
-            self.e_reduce[e] = True
-            removed_edges.add(e)
+def get_tr_edges_of_range(node_range):
+    sg, hops = tr_graph
+    begin, end = node_range
+    return sg._get_tr_edges(begin, end, hops)
 
-        return removed_edges
 
-    def get_out_edges_for_node(self, name, mask=True):
-        rtn = []
-        for e in self.nodes[name].out_edges:
-            v = e.in_node
-            w = e.out_node
-            if self.e_reduce[(v.name, w.name)] == False:
-                rtn.append(e)
-        return rtn
-
-    def get_in_edges_for_node(self, name, mask=True):
-        rtn = []
-        for e in self.nodes[name].in_edges:
-            v = e.in_node
-            w = e.out_node
-            if self.e_reduce[(v.name, w.name)] == False:
-                rtn.append(e)
-        return rtn
-
-    def get_best_out_edge_for_node(self, name, mask=True):
-        rtn = []
-        for e in self.nodes[name].out_edges:
-            v = e.in_node
-            w = e.out_node
-            if self.e_reduce[(v.name, w.name)] == False:
-                rtn.append(e)
-        rtn.sort(key=lambda e: e.attr["score"])
-
-        return rtn[-1]
-
-    def get_best_in_edge_for_node(self, name, mask=True):
-        rtn = []
-        for e in self.nodes[name].in_edges:
-            v = e.in_node
-            w = e.out_node
-            if self.e_reduce[(v.name, w.name)] == False:
-                rtn.append(e)
-        rtn.sort(key=lambda e: e.attr["score"])
-        return rtn[-1]
+def get_run_starts(ids):
+    """Return the index of the first of each run of equal values."""
+    if len(ids) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1])))
 
 
 RCMAP = dict(zip("ACGTacgtNn-", "TGCAtgcaNn-"))
@@ -457,11 +494,10 @@ def generate_seq_from_path(sg, seqs, path):
     count = 0
     for i in range(len(path) - 1):
         w_n, v_n = path[i:i + 2]
-        edge = sg.edges[(w_n, v_n)]
-        read_id, coor = edge.attr["label"].split(":")
-        b, e = coor.split("-")
-        b = int(b)
-        e = int(e)
+        edge = sg.find_edge(sg.node_id(w_n), sg.node_id(v_n))
+        read_id = sg.read_names[sg.label_rid[edge]]
+        b = int(sg.label_b[edge])
+        e = int(sg.label_e[edge])
         if b < e:
             subseqs.append(seqs[read_id][b:e])
         else:
@@ -480,12 +516,302 @@ def reverse_path(p):
     return [reverse_end(n) for n in p]
 
 
-def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_cutoff):
-    tips = set()
-    bundle_edges = set()
+NA = -1  # the via of a compound path
+
+
+def reverse_key(key):
+    s, t, v = key
+    return t ^ 1, s ^ 1, v ^ 1 if v != NA else NA
+
+
+class UnitigGraph(object):
+    """
+    class representing the unitig graph: the simple paths of the unreduced edges of a StringGraph,
+    and later also the compound paths over bundles of them
+
+    Unitig u has the key (src, dst, via), with nodes numbered as in the StringGraph, and via the node
+    that tells apart the unitigs between the same nodes (NA for a compound path).
+    The reverse of unitig (s, t, v) is reverse_key((s, t, v)).
+    Unitigs are numbered in the order they were added, with their attributes in parallel lists:
+    length, score, type, and path, i.e. the nodes of a simple path,
+    or the keys of the unitigs in the bundle of a compound path.
+
+    The live unitigs form the graph (without the circular ones), as ordered adjacency dicts:
+    succ[v][w] and pred[w][v] list the unitigs from v to w, with the targets of v in the order
+    they were first linked, the sources of w in node order, and the nodes in the order first linked.
+    The order decides ties, as in the networkx graph we used to keep.
+    A breadth-first search stamps the nodes it reaches, so we see the graph restricted to them
+    without a copy, and need not clear anything before the next one.
+    """
+
+    def __init__(self, sg):
+        self.sg = sg
+        self.keys = []
+        self.index = {}
+        self.length = []
+        self.score = []
+        self.path = []
+        self.type = []
+        self.live = []
+        self.nodes = []
+        self.succ = {}
+        self.pred = {}
+        self.n_in = {}
+        self.n_out = {}
+        self._stamp = [0] * sg.n_nodes
+        self._rank = [0] * sg.n_nodes
+        self._n_bfs = 0
+        self._back = {}  # node: (levels, depths) of a search by in-edges, while the graph is unchanged
+
+    def node_name(self, v):
+        return "NA" if v == NA else self.sg.node_name(v)
+
+    def add(self, s, t, via, length, score, path, type_):
+        """
+        add a unitig, or replace the data of the one with the same key, and return its number
+        """
+        key = (s, t, via)
+        u = self.index.get(key)
+        if u is None:
+            u = self.index[key] = len(self.keys)
+            self.keys.append(key)
+            self.length.append(length)
+            self.score.append(score)
+            self.path.append(path)
+            self.type.append(type_)
+            self.live.append(False)
+        else:
+            self.length[u] = length
+            self.score[u] = score
+            self.path[u] = path
+            self.type[u] = type_
+        return u
+
+    def reverse(self, u):
+        """
+        return the number of the reverse of unitig u, or None
+        """
+        return self.index.get(reverse_key(self.keys[u]))
+
+    def _add_node(self, v):
+        if v not in self.succ:
+            self.nodes.append(v)
+            self.succ[v] = {}
+            self.pred[v] = {}
+            self.n_in[v] = 0
+            self.n_out[v] = 0
+
+    def link(self, u):
+        """
+        put unitig u in the graph
+        """
+        s, t, via = self.keys[u]
+        self._back.clear()
+        self._add_node(s)
+        self._add_node(t)
+        self.succ[s].setdefault(t, []).append(u)
+        self.pred[t].setdefault(s, []).append(u)
+        self.n_out[s] += 1
+        self.n_in[t] += 1
+        self.live[u] = True
+
+    def link_all(self, unitigs):
+        """
+        put the unitigs in the graph, then list the sources of each node in node order
+        """
+        for u in unitigs:
+            self.link(u)
+        for w in self.nodes:
+            self.pred[w] = {}
+        for v in self.nodes:
+            for w, us in self.succ[v].items():
+                self.pred[w][v] = list(us)
+
+    def unlink(self, u):
+        """
+        take unitig u out of the graph
+        """
+        s, t, via = self.keys[u]
+        self._back.clear()
+        for adj, v, w in ((self.succ, s, t), (self.pred, t, s)):
+            us = adj[v][w]
+            us.remove(u)
+            if not us:
+                del adj[v][w]
+        self.n_out[s] -= 1
+        self.n_in[t] -= 1
+        self.live[u] = False
+
+    def in_degree(self, v):
+        return self.n_in[v]
+
+    def out_degree(self, v):
+        return self.n_out[v]
+
+    def out_edges(self, v):
+        return [u for us in self.succ[v].values() for u in us]
+
+    def edges(self):
+        return [u for u, live in enumerate(self.live) if live]
+
+    def start_bfs(self, n, depth):
+        """
+        start a breadth-first search from node n, to depth edges, that stamps the nodes as it reaches
+        them, going a level further only when reached() needs it
+        """
+        self._n_bfs += 1
+        self._stamp[n] = self._n_bfs
+        self._rank[n] = 0
+        self._bfs_nodes = [n]
+        self._bfs_level = [n]
+        self._bfs_depth = depth
+        self._bfs_max_depth = depth
+
+    def _bfs_next_level(self):
+        if self._bfs_depth == 0 or not self._bfs_level:
+            return False
+        self._bfs_depth -= 1
+        stamp = self._n_bfs
+        seen = self._stamp
+        rank = self._rank
+        nodes = self._bfs_nodes
+        next_level = []
+        for v in self._bfs_level:
+            for w in self.succ[v]:
+                if seen[w] != stamp:
+                    seen[w] = stamp
+                    rank[w] = len(nodes)
+                    nodes.append(w)
+                    next_level.append(w)
+        self._bfs_level = next_level
+        return True
+
+    def bfs(self, n, depth):
+        """
+        return the nodes within depth edges from node n, in breadth-first order, stamped as reached
+        """
+        self.start_bfs(n, depth)
+        while self._bfs_next_level():
+            pass
+        return self._bfs_nodes
+
+    def reached(self, v):
+        """
+        return whether the last search reaches node v
+        """
+        while self._stamp[v] != self._n_bfs:
+            if not self._bfs_next_level():
+                return False
+        return True
+
+    def in_reach(self, v):
+        """
+        return whether the last search reaches node v, meeting it halfway: we also search from v
+        by in-edges, and take a level further the side with less to do, until the two meet,
+        or their depths add up to that of the last search. The levels from v we keep for the next search.
+        """
+        stamp = self._n_bfs
+        seen = self._stamp
+        if seen[v] == stamp:
+            return True
+        back = self._back.get(v)
+        if back is None:
+            back = self._back[v] = ([[v]], {v: 0})
+        levels, back_depth = back
+        b = 0  # No node within b in-edges of v is stamped.
+        while self._bfs_max_depth - self._bfs_depth + b < self._bfs_max_depth:
+            if b + 1 < len(levels) or (levels[b] and (
+                    self._bfs_depth == 0 or len(levels[b]) < len(self._bfs_level))):
+                if b + 1 == len(levels):
+                    next_level = []
+                    for w in levels[b]:
+                        for x in self.pred[w]:
+                            if x not in back_depth:
+                                back_depth[x] = b + 1
+                                next_level.append(x)
+                    levels.append(next_level)
+                b += 1
+                for w in levels[b]:
+                    if seen[w] == stamp:
+                        return True
+            elif self._bfs_next_level():
+                for w in self._bfs_level:
+                    if back_depth.get(w, b + 1) <= b:
+                        return True
+            else:
+                break  # the search is complete
+        return False
+
+    def in_edges_from(self, v, sources):
+        """
+        return the in-edges of node v from those of sources the last search reaches, in the order reached
+        """
+        pred = self.pred[v]
+        reached = [s for s in pred if s in sources and self.reached(s)]
+        reached.sort(key=self._rank.__getitem__)
+        return [u for s in reached for u in pred[s]]
+
+    def shortest_path(self, source, target):
+        """
+        return the nodes of a shortest path from source to target, searching breadth-first from both
+        ends until they meet, as networkx.shortest_path() does, to take the same path of several
+        """
+        pred = {source: None}
+        succ = {target: None}
+        forward_fringe = [source]
+        reverse_fringe = [target]
+        meet = source if source == target else None
+        while meet is None:
+            if not forward_fringe or not reverse_fringe:
+                raise Exception('No path from {!r} to {!r}'.format(
+                    self.node_name(source), self.node_name(target)))
+            if len(forward_fringe) <= len(reverse_fringe):
+                this_level, forward_fringe = forward_fringe, []
+                for v in this_level:
+                    for w in self.succ[v]:
+                        if w not in pred:
+                            forward_fringe.append(w)
+                            pred[w] = v
+                        if w in succ:
+                            meet = w
+                            break
+                    if meet is not None:
+                        break
+            else:
+                this_level, reverse_fringe = reverse_fringe, []
+                for v in this_level:
+                    for w in self.pred[v]:
+                        if w not in succ:
+                            succ[w] = v
+                            reverse_fringe.append(w)
+                        if w in pred:
+                            meet = w
+                            break
+                    if meet is not None:
+                        break
+        path = []
+        w = meet
+        while w is not None:
+            path.append(w)
+            w = pred[w]
+        path.reverse()
+        w = succ[meet]
+        while w is not None:
+            path.append(w)
+            w = succ[w]
+        return path
+
+
+def find_bundle(ug, start_node, depth_cutoff, width_cutoff, length_cutoff):
+    tips = {}  # as an ordered set
+    bundle_edges = {}  # keys, as an ordered set
     bundle_nodes = set()
 
-    local_graph = nx.ego_graph(ug, start_node, depth_cutoff, undirected=False)
+    # The graph within depth_cutoff of start_node, in the order of a breadth-first search,
+    # which goes only as far as we look. A tip is within depth - 1 <= depth_cutoff - 1 edges
+    # of start_node, so all its out-edges are in the graph, but not all its in-edges.
+    ug.start_bfs(start_node, depth_cutoff)
+    keys = ug.keys
     length_to_node = {start_node: 0}
     score_to_node = {start_node: 0}
 
@@ -495,18 +821,14 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
     if DEBUG_LOG_LEVEL > 1:
         print()
         print()
-        print("start", start_node)
+        print("start", ug.node_name(start_node))
 
     bundle_nodes.add(v)
-    for vv, ww, kk in local_graph.out_edges(v, keys=True):
-        max_score = 0
-        max_length = 0
-
-        if (vv, ww, kk) not in bundle_edges and\
-                reverse_end(ww) not in bundle_nodes:
-
-            bundle_edges.add((vv, ww, kk))
-            tips.add(ww)
+    for u in ug.out_edges(v):
+        ww = keys[u][1]
+        if keys[u] not in bundle_edges and ww ^ 1 not in bundle_nodes:
+            bundle_edges[keys[u]] = None
+            tips[ww] = None
 
     for v in tips:
         bundle_nodes.add(v)
@@ -524,28 +846,26 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
             break
 
         if len(tips) == 1:
-            end_node = tips.pop()
+            end_node, = tips
+            tips.clear()
 
             if DEBUG_LOG_LEVEL > 1:
-                print("end", end_node)
+                print("end", ug.node_name(end_node))
 
             if end_node not in length_to_node:
                 v = end_node
                 max_score_edge = None
                 max_score = 0
-                for uu, vv, kk in local_graph.in_edges(v, keys=True):
-                    if uu not in length_to_node:
-                        continue
-
-                    score = u_edge_data[(uu, vv, kk)][1]
+                for u in ug.in_edges_from(v, length_to_node):
+                    score = ug.score[u]
 
                     if score > max_score:
 
                         max_score = score
-                        max_score_edge = (uu, vv, kk)
+                        max_score_edge = u
 
-                length_to_node[v] = length_to_node[max_score_edge[0]] + u_edge_data[max_score_edge][0]
-                score_to_node[v] = score_to_node[max_score_edge[0]] + u_edge_data[max_score_edge][1]
+                length_to_node[v] = length_to_node[keys[max_score_edge][0]] + ug.length[max_score_edge]
+                score_to_node[v] = score_to_node[keys[max_score_edge][0]] + ug.score[max_score_edge]
 
             converage = True
             break
@@ -569,37 +889,36 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
 
         for v in tips_list:
             if DEBUG_LOG_LEVEL > 1:
-                print("process", v)
+                print("process", ug.node_name(v))
 
-            if len(local_graph.out_edges(v, keys=True)) == 0:  # dead end route
-                print("no out edge", v)
+            out_edges = ug.out_edges(v)
+            if len(out_edges) == 0:  # dead end route
+                print("no out edge", ug.node_name(v))
                 continue
 
             max_score_edge = None
             max_score = 0
 
+            # The tip waits for the bundle to reach all its in-edges in the graph.
             extend_tip = True
 
-            for uu, vv, kk in local_graph.in_edges(v, keys=True):
-                if DEBUG_LOG_LEVEL > 1:
-                    print("in_edges", uu, vv, kk)
-                    print(uu, "in length_to_node",  uu in length_to_node)
-
-                if uu not in length_to_node:
+            for uu in ug.pred[v]:
+                if uu not in length_to_node and ug.in_reach(uu):
                     extend_tip = False
                     break
 
-                score = u_edge_data[(uu, vv, kk)][1]
+            if extend_tip:
 
-                if score > max_score:
+                for u in ug.in_edges_from(v, length_to_node):
+                    score = ug.score[u]
 
-                    max_score = score
-                    max_score_edge = (uu, vv, kk)
+                    if score > max_score:
 
-            if extend_tip:
+                        max_score = score
+                        max_score_edge = u
 
-                length_to_node[v] = length_to_node[max_score_edge[0]] + u_edge_data[max_score_edge][0]
-                score_to_node[v] = score_to_node[max_score_edge[0]] + u_edge_data[max_score_edge][1]
+                length_to_node[v] = length_to_node[keys[max_score_edge][0]] + ug.length[max_score_edge]
+                score_to_node[v] = score_to_node[keys[max_score_edge][0]] + ug.score[max_score_edge]
 
                 if length_to_node[v] > length_cutoff:
                     length_limit_reached = True
@@ -607,34 +926,31 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
                     break
 
                 v_updated = False
-                for vv, ww, kk in local_graph.out_edges(v, keys=True):
-
-                    if DEBUG_LOG_LEVEL > 1:
-                        print("test", vv, ww, kk)
+                for u in out_edges:
+                    ww = keys[u][1]
 
                     if ww in length_to_node:
                         loop_detect = True
                         if DEBUG_LOG_LEVEL > 1:
-                            print("loop_detect", ww)
+                            print("loop_detect", ug.node_name(ww))
                         break
 
-                    if (vv, ww, kk) not in bundle_edges and\
-                            reverse_end(ww) not in bundle_nodes:
+                    if keys[u] not in bundle_edges and ww ^ 1 not in bundle_nodes:
 
                         if DEBUG_LOG_LEVEL > 1:
-                            print("add", ww)
+                            print("add", ug.node_name(ww))
 
-                        tips.add(ww)
-                        bundle_edges.add((vv, ww, kk))
+                        tips[ww] = None
+                        bundle_edges[keys[u]] = None
                         tip_updated = True
                         v_updated = True
 
                 if v_updated:
 
                     if DEBUG_LOG_LEVEL > 1:
-                        print("remove", v)
+                        print("remove", ug.node_name(v))
 
-                    tips.remove(v)
+                    del tips[v]
 
                     if len(tips) == 1:
                         break
@@ -655,10 +971,10 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
             converage = False
             break
 
-        for v in list(tips):
+        for v in tips:
             bundle_nodes.add(v)
 
-    data = start_node, end_node, bundle_edges, length_to_node[end_node], score_to_node[end_node], depth
+    data = start_node, end_node, list(bundle_edges), length_to_node[end_node], score_to_node[end_node], depth
     data_r = None
 
     if DEBUG_LOG_LEVEL > 1:
@@ -666,206 +982,169 @@ def find_bundle(ug, u_edge_data, start_node, depth_cutoff, width_cutoff, length_
     return converage, data, data_r
 
 
-def generate_string_graph(args):
-    overlap_file = args.overlap_file
+# An overlap of reads f and g (numbered as load_overlaps() first sees them), as the two edges
+# of the string graph: by whether g is ahead of f or behind, and its direction (forward, or not),
+#         f.B         f.E                          f.B         f.E
+#      f  ----------->                      f      ----------->
+#      g         ------------->             g  ------------->
+#                g.B           g.E             g.B           g.E
+# the edges (g.B, f.B) and (f.E, g.E)       or (f.B, g.B) and (g.E, f.E),
+# with g.B and g.E swapped for g in the other direction, and the edges labelled (b1, e1) and (b2, e2)
+# along f, g (ahead) or g, f (behind). phase1 and phase2 are the phases of f and g, numbered too.
+OVERLAP_DTYPE = np.dtype([
+    ('f', np.int32), ('g', np.int32), ('score', np.int32), ('identity', np.float64),
+    ('ahead', bool), ('forward', bool),
+    ('b1', np.int32), ('e1', np.int32), ('b2', np.int32), ('e2', np.int32),
+    ('phase1', np.int32), ('phase2', np.int32)])
 
-    contained_reads = set()
-    chimer_ids = set()
-
-    filter_reads = False
+OVERLAP_CHUNK_SIZE = 1 << 20  # bytes of the overlap file to parse at a time
+EDGE_CHUNK_SIZE = 1 << 20  # overlaps to add as edges at a time
 
-    seqs = set()
 
-    # G=nx.Graph()
-    #edges =set()
-    overlap_data = []
-    #contained_reads = set()
-    #overlap_count = {}
+def load_overlaps(overlap_file, min_idt, min_len):
+    """
+    Return the overlaps of overlap_file as an array of OVERLAP_DTYPE, and the names of the reads by number.
+    Skip the self-overlaps, the non-overlaps, those below min_idt identity or with a read shorter than
+    min_len, and those with a read contained by another in the same phase.
+    Keep only the first overlap of each pair of reads.
+    """
+    read_index = {}
+    phase_index = {}
+    contained_reads = set()
+    kinds = {'overlap': 0, 'contained': 1, 'contains': 2, 'none': 3}  # and any other kinds after
+    chunks = []
 
-    # loop through the overlapping data to load the data in the a python array
+    # loop through the overlapping data to load the data in arrays
     # contained reads are identified
-
     with open(overlap_file) as f:
-        for l in f:
-            l = l.strip().split()
-
-            # work around for some ill formed data recored
-            # if len(l) != 13:
-            #    continue
-
-            f_id, g_id, score, identity = l[:4]
-
-            if f_id == g_id:  # don't need self-self overlapping
-                continue
-
-            if filter_reads:
-
-                if g_id not in seqs:
-                    continue
-
-                if f_id not in seqs:
-                    continue
-
-            phase1 = l[13]
-            phase2 = l[14]
-
-            score = int(score)
-            identity = float(identity)
-            contained = l[12]
-            if contained == "contained" and phase1 == phase2:
-                contained_reads.add(f_id)
-                continue
-            if contained == "contains" and phase1 == phase2:
-                contained_reads.add(g_id)
-                continue
-            if contained == "none":
-                continue
-
-            if identity < args.min_idt:  # only take record with >96% identity as overlapped reads
-                continue
-            f_strain, f_start, f_end, f_len = (int(c) for c in l[4:8])
-            g_strain, g_start, g_end, g_len = (int(c) for c in l[8:12])
-
+        while True:
+            lines = f.readlines(OVERLAP_CHUNK_SIZE)
+            if not lines:
+                break
+            n = len(lines)
+            fields = ''.join(lines).split()
+            if len(fields) != 15 * n:  # Split the lines one by one to find the 15 fields of each.
+                rows = [l.split() for l in lines]
+                for row in rows:
+                    if len(row) < 15:
+                        raise Exception('Too few fields in overlap record {!r}'.format(' '.join(row)))
+                fields = [field for row in rows for field in row[:15]]
+                del rows
+            del lines
+
+            def column(i, parse=int, dtype=np.int64):
+                return np.fromiter(map(parse, fields[i::15]), dtype=dtype, count=n)
+
+            def index(i, names):  # numbering each name as first seen
+                for name in dict.fromkeys(fields[i::15]):
+                    names.setdefault(name, len(names))
+                return column(i, names.__getitem__)
+
+            f_id, g_id = index(0, read_index), index(1, read_index)
+            phase1, phase2 = index(13, phase_index), index(14, phase_index)
+            kind = index(12, kinds)
+            identity = column(3, float, np.float64)
+            f_l, g_l = column(7), column(11)
+
+            same_phase = (f_id != g_id) & (phase1 == phase2)
+            contained_reads.update(f_id[same_phase & (kind == 1)].tolist())
+            contained_reads.update(g_id[same_phase & (kind == 2)].tolist())
             # only used reads longer than the 4kb for assembly
-            if f_len < args.min_len:
-                continue
-            if g_len < args.min_len:
-                continue
-
-            """
-            # double check for proper overlap
-            # this is not necessary when using DALIGNER for overlapper
-            # it may be useful if other overlappers give fuzzier alignment boundary
-            if f_start > 24 and f_len - f_end > 24:  # allow 24 base tolerance on both sides of the overlapping
-                continue
-
-            if g_start > 24 and g_len - g_end > 24:
-                continue
-
-            if g_strain == 0:
-                if f_start < 24 and g_len - g_end > 24:
-                    continue
-                if g_start < 24 and f_len - f_end > 24:
-                    continue
-            else:
-                if f_start < 24 and g_start > 24:
-                    continue
-                if g_start < 24 and f_start > 24:
-                    continue
-            """
-
-            overlap_data.append((f_id, g_id, score, identity,
-                                 f_strain, f_start, f_end, f_len,
-                                 g_strain, g_start, g_end, g_len,
-                                 phase1, phase2))
+            keep = np.flatnonzero((f_id != g_id) & ~(same_phase & ((kind == 1) | (kind == 2))) & (kind != 3) &
+                                  ~(identity < min_idt) & (f_l >= min_len) & (g_l >= min_len))
+            f_b, f_e, f_l, g_l = column(5)[keep], column(6)[keep], f_l[keep], g_l[keep]
+            # revered alignment, swapping the begin and end coordinates
+            reverse = column(8)[keep] == 1
+            g_b = np.where(reverse, column(10)[keep], column(9)[keep])
+            g_e = np.where(reverse, column(9)[keep], column(10)[keep])
+
+            chunk = np.empty(len(keep), dtype=OVERLAP_DTYPE)
+            chunk['f'], chunk['g'] = f_id[keep], g_id[keep]
+            chunk['score'] = column(2)[keep]
+            chunk['identity'] = identity[keep]
+            chunk['phase1'], chunk['phase2'] = phase1[keep], phase2[keep]
+            chunk['ahead'] = ahead = f_b > 0
+            chunk['forward'] = forward = g_b < g_e
+            chunk['b1'] = np.where(ahead, f_b, g_b)
+            chunk['e1'] = np.where(~ahead & ~forward, g_l, 0)
+            chunk['b2'] = np.where(ahead, g_e, f_e)
+            chunk['e2'] = np.where(ahead, np.where(forward, g_l, 0), f_l)
+            chunks.append(chunk)
+            del fields
+
+    contained = np.zeros(len(read_index), dtype=bool)
+    contained[list(contained_reads)] = True
+    for k, chunk in enumerate(chunks):
+        chunks[k] = chunk[~contained[chunk['f']] & ~contained[chunk['g']]]
+    chunk = None
+
+    # don't allow duplicated records
+    pairs = np.empty(sum(len(chunk) for chunk in chunks), dtype=np.int64)
+    begin = 0
+    for chunk in chunks:
+        f, g = chunk['f'], chunk['g']
+        pairs[begin:begin + len(chunk)] = np.minimum(f, g).astype(np.int64) * len(read_index) + np.maximum(f, g)
+        begin += len(chunk)
+    first = np.zeros(len(pairs), dtype=bool)
+    first[np.unique(pairs, return_index=True)[1]] = True
+    del pairs
+
+    overlaps = np.empty(np.count_nonzero(first), dtype=OVERLAP_DTYPE)
+    begin = end = 0
+    for k in range(len(chunks)):
+        chunk = chunks[k][first[begin:begin + len(chunks[k])]]
+        begin += len(chunks[k])
+        chunks[k] = None
+        overlaps[end:end + len(chunk)] = chunk
+        end += len(chunk)
+    return overlaps, list(read_index)
+
+
+def add_overlap_edges(sg, overlaps, read_names):
+    """
+    Add to sg the reads of the overlaps (from load_overlaps()), in the order first seen,
+    and the pair of edges of each overlap, in order, but for those with an edge of no length.
+    """
+    seen = np.empty(2 * len(overlaps), dtype=np.int32)
+    seen[0::2] = overlaps['f']
+    seen[1::2] = overlaps['g']
+    reads, first_seen = np.unique(seen, return_index=True)
+    reads = reads[np.argsort(first_seen)]
+    read_id = np.zeros(len(read_names), dtype=np.int64)
+    read_id[reads] = [sg.add_read(read_names[r]) for r in reads.tolist()]
+    del seen, reads, first_seen
+
+    for begin in range(0, len(overlaps), EDGE_CHUNK_SIZE):
+        chunk = overlaps[begin:begin + EDGE_CHUNK_SIZE]
+        f, g = read_id[chunk['f']], read_id[chunk['g']]
+        b1, e1, b2, e2 = chunk['b1'], chunk['e1'], chunk['b2'], chunk['e2']
+        ahead, forward = chunk['ahead'], chunk['forward']
+        f_B, f_E = 2 * f, 2 * f + 1
+        g_to = 2 * g + forward  # g.E, or g.B for g in the other direction
+        g_from = 2 * g + ~forward
+        valid = (b1 != e1) & (b2 != e2)
+
+        def pairs(a1, a2):
+            return np.stack((a1, a2), axis=1)[valid].ravel()
+
+        score = -chunk['score']
+        identity = chunk['identity']
+        phase1 = np.where(ahead, chunk['phase2'], chunk['phase1'])
+        phase2 = np.where(ahead, chunk['phase1'], chunk['phase2'])
+        sg.add_edges(src=pairs(np.where(ahead, g_from, f_B), np.where(ahead, f_E, g_to)),
+                     dst=pairs(np.where(ahead, f_B, g_from), np.where(ahead, g_to, f_E)),
+                     label_rid=pairs(np.where(ahead, f, g), np.where(ahead, g, f)),
+                     label_b=pairs(b1, b2), label_e=pairs(e1, e2),
+                     length=pairs(np.abs(b1 - e1), np.abs(b2 - e2)),
+                     score=pairs(score, score), identity=pairs(identity, identity),
+                     phase_src=pairs(phase1, phase2), phase_dst=pairs(phase2, phase1))
 
-            #overlap_count[f_id] = overlap_count.get(f_id,0)+1
-            #overlap_count[g_id] = overlap_count.get(g_id,0)+1
 
-    overlap_set = set()
+def generate_string_graph(args):
+    overlaps, read_names = load_overlaps(args.overlap_file, args.min_idt, args.min_len)
     sg = StringGraph()
-    for od in overlap_data:
-        f_id, g_id, score, identity = od[:4]
-        if f_id in contained_reads:
-            continue
-        if g_id in contained_reads:
-            continue
-        f_s, f_b, f_e, f_l = od[4:8]
-        g_s, g_b, g_e, g_l = od[8:12]
-
-        phase1 = od[12]
-        phase2 = od[13]
-
-        overlap_pair = [f_id, g_id]
-        overlap_pair.sort()
-        overlap_pair = tuple(overlap_pair)
-        if overlap_pair in overlap_set:  # don't allow duplicated records
-            continue
-        else:
-            overlap_set.add(overlap_pair)
-
-        if g_s == 1:  # revered alignment, swapping the begin and end coordinates
-            g_b, g_e = g_e, g_b
-
-        # build the string graph edges for each overlap
-        if f_b > 0:
-            if g_b < g_e:
-                """
-                     f.B         f.E
-                  f  ----------->
-                  g         ------------->
-                            g.B           g.E
-                """
-                if f_b == 0 or g_e - g_l == 0:
-                    continue
-                sg.add_edge("%s:B" % g_id, "%s:B" % f_id, label=(f_id, f_b, 0),
-                            length=abs(f_b - 0),
-                            score=-score,
-                            identity=identity,
-                            phase=(phase2, phase1))
-                sg.add_edge("%s:E" % f_id, "%s:E" % g_id, label=(g_id, g_e, g_l),
-                            length=abs(g_e - g_l),
-                            score=-score,
-                            identity=identity,
-                            phase=(phase1, phase2))
-            else:
-                """
-                     f.B         f.E
-                  f  ----------->
-                  g         <-------------
-                            g.E           g.B
-                """
-                if f_b == 0 or g_e == 0:
-                    continue
-                sg.add_edge("%s:E" % g_id, "%s:B" % f_id, label=(f_id, f_b, 0),
-                            length=abs(f_b - 0),
-                            score=-score,
-                            identity=identity,
-                            phase=(phase2, phase1))
-                sg.add_edge("%s:E" % f_id, "%s:B" % g_id, label=(g_id, g_e, 0),
-                            length=abs(g_e - 0),
-                            score=-score,
-                            identity=identity,
-                            phase=(phase1, phase2))
-        else:
-            if g_b < g_e:
-                """
-                                    f.B         f.E
-                  f                 ----------->
-                  g         ------------->
-                            g.B           g.E
-                """
-                if g_b == 0 or f_e - f_l == 0:
-                    continue
-                sg.add_edge("%s:B" % f_id, "%s:B" % g_id, label=(g_id, g_b, 0),
-                            length=abs(g_b - 0),
-                            score=-score,
-                            identity=identity,
-                            phase=(phase1, phase2))
-                sg.add_edge("%s:E" % g_id, "%s:E" % f_id, label=(f_id, f_e, f_l),
-                            length=abs(f_e - f_l),
-                            score=-score,
-                            identity=identity,
-                            phase=(phase2, phase1))
-            else:
-                """
-                                    f.B         f.E
-                  f                 ----------->
-                  g         <-------------
-                            g.E           g.B
-                """
-                if g_b - g_l == 0 or f_e - f_l == 0:
-                    continue
-                sg.add_edge("%s:B" % f_id, "%s:E" % g_id, label=(g_id, g_b, g_l),
-                            length=abs(g_b - g_l),
-                            score=-score,
-                            identity=identity,
-                            phase=(phase1, phase2))
-                sg.add_edge("%s:B" % g_id, "%s:E" % f_id, label=(f_id, f_e, f_l),
-                            length=abs(f_e - f_l),
-                            score=-score,
-                            identity=identity,
-                            phase=(phase2, phase1))
+    add_overlap_edges(sg, overlaps, read_names)
+    del overlaps
 
     cp_edges = sg.remove_cross_phase_edges()
     sg.init_reduce_dict()
@@ -874,15 +1153,15 @@ def generate_string_graph(args):
     #    sg.mark_chimer_edges()
     # sg.mark_spur_edge()
 
-    sg.mark_tr_edges()  # mark those edges that transitive redundant
+    sg.mark_tr_edges(n_core=args.n_core)  # mark those edges that transitive redundant
 
+    kept = sg.out_edge
     if DEBUG_LOG_LEVEL > 1:
-        print(sum([1 for c in list(sg.e_reduce.values()) if c == True]))
-        print(sum([1 for c in list(sg.e_reduce.values()) if c == False]))
+        print(np.count_nonzero(sg.e_reduce[kept]))
+        print(np.count_nonzero(~sg.e_reduce[kept]))
 
     chimer_nodes, chimer_edges = sg.mark_chimer_edges()
 
-    removed_edges = set()
     if args.lfc == True:
         removed_edges = sg.resolve_repeat_edges()
     else:
@@ -891,76 +1170,158 @@ def generate_string_graph(args):
     spur_edges = sg.mark_spur_edge()
 
     if DEBUG_LOG_LEVEL > 1:
-        print(sum([1 for c in list(sg.e_reduce.values()) if c == False]))
+        print(np.count_nonzero(~sg.e_reduce[kept]))
+
+    write_sg_edges(sg, cp_edges, chimer_edges, removed_edges, spur_edges)
+    return sg
 
-    #max_score = max([ sg.edges[ e ].attr["score"] for e in sg.edges if sg.e_reduce[e] != True ])
-    nxsg = nx.DiGraph()
-    edge_data = {}
+
+def write_sg_edges(sg, cp_edges, chimer_edges, removed_edges, spur_edges):
+    """
+    Write sg_edges_list, naming the nodes, and if the reads are preads, sg_edges_list.bin,
+    indexed by the nodes (see falcon_unzip.sg_edges_list), from which we export the text.
+    """
+    # The edges in order, then those removed for crossing phases.
+    # An edge reduced for more than one reason takes the first of C, R, S, TR.
+    TYPES = sg_edges_list.TYPES
+    types = np.where(sg.e_reduce, TYPES.index("TR"), TYPES.index("G")).astype(np.uint8)
+    types[spur_edges] = TYPES.index("S")
+    types[removed_edges] = TYPES.index("R")
+    types[chimer_edges] = TYPES.index("C")
+    types[~sg.e_reduce] = TYPES.index("G")
+    types[cp_edges] = TYPES.index("CP")
+    edges = np.concatenate((np.flatnonzero(~sg.removed), cp_edges))
+
+    preads = sg_edges_list.pread_ids(sg.read_names)
+    if preads is not None:
+        src, dst = sg.src[edges], sg.dst[edges]
+        table = sg_edges_list.from_arrays(
+            2 * preads[src >> 1] + (src & 1), 2 * preads[dst >> 1] + (dst & 1), preads[sg.label_rid[edges]],
+            sg.label_b[edges], sg.label_e[edges], sg.score[edges], sg.identity[edges], types[edges])
+        sg_edges_list.write_binary("sg_edges_list.bin", table)
+        with open("sg_edges_list", "w") as out_f:
+            sg_edges_list.write_text(table, out_f)
+        return
+
+    node_name = sg.node_name
+    read_names = sg.read_names
     with open("sg_edges_list", "w") as out_f:
-        for v, w in sg.edges:
-            e = sg.edges[(v, w)]
-            rid, sp, tp = e.attr["label"]
-            score = e.attr["score"]
-            identity = e.attr["identity"]
-            length = abs(sp - tp)
-
-            if sg.e_reduce[(v, w)] != True:
-                type_ = "G"
-                label = "%s:%d-%d" % (rid, sp, tp)
-                nxsg.add_edge(v, w, label=label, length=length, score=score)
-                edge_data[(v, w)] = (rid, sp, tp, length, score, identity, type_)
-            elif (v, w) in chimer_edges:
-                type_ = "C"
-            elif (v, w) in removed_edges:
-                type_ = "R"
-            elif (v, w) in spur_edges:
-                type_ = "S"
-            elif sg.e_reduce[(v, w)] == True:
-                type_ = "TR"
-
-            print(v, w, rid, sp, tp, score, identity, type_, file=out_f)
-
-        for k, e in cp_edges.items():
-            v = k[0]
-            w = k[1]
-            rid, sp, tp = e.attr["label"]
-            score = e.attr["score"]
-            identity = e.attr["identity"]
-            length = abs(sp - tp)
-            print(v, w, rid, sp, tp, score, identity, "CP", file=out_f)
-
-    nxsg_r = nxsg.reverse()
-
-    return nxsg, nxsg_r, edge_data
-
-
-def construct_compound_paths(ug, u_edge_data):
-    source_nodes = set()
-    sink_nodes = set()
-    simple_nodes = set()
-    branch_nodes = set()
-
-    all_nodes = ug.nodes()
-    for n in all_nodes:
-        in_degree = len(ug.in_edges(n))
-        out_degree = len(ug.out_edges(n))
-        if in_degree == 0:
-            source_nodes.add(n)
-        if out_degree == 0:
-            sink_nodes.add(n)
-        if in_degree == 1 and out_degree == 1:
-            simple_nodes.add(n)
-        if in_degree > 1 or out_degree > 1:
-            branch_nodes.add(n)
-
-    # print "#", len(all_nodes),len(source_nodes), len(sink_nodes), len(simple_nodes), len(branch_nodes)
+        for e in edges.tolist():
+            v, w = node_name(int(sg.src[e])), node_name(int(sg.dst[e]))
+            rid, sp, tp = read_names[sg.label_rid[e]], int(sg.label_b[e]), int(sg.label_e[e])
+            score = int(sg.score[e])
+            identity = float(sg.identity[e])
+            print(v, w, rid, sp, tp, score, identity, TYPES[types[e]], file=out_f)
+
+
+def construct_simple_paths(sg):
+    """
+    Return the UnitigGraph of the simple paths of the unreduced edges of sg, with each path
+    followed by its reverse, in one pass over the edges: the paths start from the nodes that are not
+    simple (in- and out-degree 1) in order, then, for the circular paths, from the first edge left.
+    """
+    g_edges = np.flatnonzero(~sg.removed & ~sg.e_reduce)
+    assert not np.any(sg.e_reduce[sg.rev[g_edges]])
+    n_nodes = sg.n_nodes
+    src = sg.src[g_edges]
+    out_g = g_edges[np.argsort(src, kind='stable')]  # by number
+    out_ptr = np.zeros(n_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n_nodes), out=out_ptr[1:])
+    out_degree = np.diff(out_ptr)
+    in_degree = np.bincount(sg.dst[g_edges], minlength=n_nodes)
+    simple = (in_degree == 1) & (out_degree == 1)
+    s_nodes = np.flatnonzero(~simple & (out_degree != 0)).tolist()
+
+    free = np.zeros(sg.n_edges, dtype=bool)
+    free[g_edges] = True
+    free = bytearray(free.tobytes())
+    simple = bytearray(simple.tobytes())
+    out_g = out_g.tolist()
+    out_ptr = out_ptr.tolist()
+    dst = sg.dst.tolist()
+    rev = sg.rev.tolist()
+    length = sg.length.tolist()
+    score = sg.score.tolist()
+    g_edges = g_edges.tolist()
+
+    ug = UnitigGraph(sg)
+    n_free = len(g_edges)
+    next_s_node = 0
+    first_free = 0
+    while n_free != 0:
+        if next_s_node < len(s_nodes):
+            n = s_nodes[next_s_node]
+            next_s_node += 1
+        else:
+            while not free[g_edges[first_free]]:
+                first_free += 1
+            n = int(sg.src[g_edges[first_free]])
+
+        for e in out_g[out_ptr[n]:out_ptr[n + 1]]:
+            if not free[e]:
+                continue
+            v = v0 = n
+            w = w0 = dst[e]
+            path = [v, w]
+            path_edges = set([e])
+            path_length = length[e]
+            path_score = score[e]
+            free[e] = False
+
+            re = rev[e]
+            r_path = [v ^ 1, w ^ 1]  # need to reverse again
+            r_path_length = length[re]
+            r_path_score = score[re]
+            free[re] = False
+            n_free -= 2
+
+            while simple[w]:
+                e = out_g[out_ptr[w]]
+                if not free[e]:
+                    break
+                re = rev[e]
+                if re in path_edges:
+                    break
+                w = dst[e]
+
+                path.append(w)
+                path_edges.add(e)
+                path_length += length[e]
+                path_score += score[e]
+                free[e] = False
+
+                r_path.append(w ^ 1)
+                r_path_length += length[re]
+                r_path_score += score[re]
+                free[re] = False
+                n_free -= 2
+
+            r_path.reverse()
+            ug.add(v0, path[-1], w0, path_length, path_score, path, "simple")
+            ug.add(r_path[0], v0 ^ 1, w0 ^ 1, r_path_length, r_path_score, r_path, "simple")
+
+            if DEBUG_LOG_LEVEL > 1:
+                print(path_length, path_score, [sg.node_name(x) for x in path])
+
+    ug.circular = [u for u, (s, t, v) in enumerate(ug.keys) if s == t]
+    ug.link_all(u for u, (s, t, v) in enumerate(ug.keys) if s != t)
+    return ug
+
+
+def construct_compound_paths(ug):
+    """
+    Return the compound paths over the bundles of the live unitigs of ug (a UnitigGraph),
+    as a dict of (s, NA, t) to (width, length, score, keys of the bundled unitigs).
+    """
+    branch_nodes = [n for n in ug.nodes if ug.in_degree(n) > 1 or ug.out_degree(n) > 1]
+
     compound_paths_0 = []
-    for p in list(branch_nodes):
+    for p in branch_nodes:
         if ug.out_degree(p) > 1:
-            coverage, data, data_r = find_bundle(ug, u_edge_data, p, 48, 16, 500000)
+            coverage, data, data_r = find_bundle(ug, p, 48, 16, 500000)
             if coverage == True:
                 start_node, end_node, bundle_edges, length, score, depth = data
-                compound_paths_0.append((start_node, "NA", end_node, 1.0 *
+                compound_paths_0.append((start_node, NA, end_node, 1.0 *
                                          len(bundle_edges) / depth, length, score, bundle_edges))
 
     compound_paths_0.sort(key=lambda x: -len(x[6]))
@@ -969,41 +1330,27 @@ def construct_compound_paths(ug, u_edge_data):
     compound_paths_1 = {}
     for s, v, t, width, length, score, bundle_edges in compound_paths_0:
         if DEBUG_LOG_LEVEL > 1:
-            print("constructing utg, test ", s, v, t)
+            print("constructing utg, test ", ug.node_name(s), "NA", ug.node_name(t))
 
         overlapped = False
-        for vv, ww, kk in list(bundle_edges):
-            if (vv, ww, kk) in edge_to_cpath:
-                if DEBUG_LOG_LEVEL > 1:
-                    print("remove overlapped utg", (s, v, t), (vv, ww, kk))
+        for key in bundle_edges:
+            if key in edge_to_cpath:
                 overlapped = True
                 break
-            rvv = reverse_end(vv)
-            rww = reverse_end(ww)
-            rkk = reverse_end(kk)
-            if (rww, rvv, rkk) in edge_to_cpath:
-                if DEBUG_LOG_LEVEL > 1:
-                    print("remove overlapped r utg", (s, v, t),  (rww, rvv, rkk))
+            if reverse_key(key) in edge_to_cpath:
                 overlapped = True
                 break
 
         if not overlapped:
-            if DEBUG_LOG_LEVEL > 1:
-                print("constructing", s, v, t)
-
             bundle_edges_r = []
-            rs = reverse_end(t)
-            rt = reverse_end(s)
-
-            for vv, ww, kk in list(bundle_edges):
-                edge_to_cpath.setdefault((vv, ww, kk), set())
-                edge_to_cpath[(vv, ww, kk)].add((s, t, v))
-                rvv = reverse_end(ww)
-                rww = reverse_end(vv)
-                rkk = reverse_end(kk)
-                edge_to_cpath.setdefault((rvv, rww, rkk), set())
-                edge_to_cpath[(rvv, rww, rkk)].add((rs, rt, v))  # assert v == "NA"
-                bundle_edges_r.append((rvv, rww, rkk))
+            rs = t ^ 1
+            rt = s ^ 1
+
+            for key in bundle_edges:
+                edge_to_cpath.setdefault(key, set()).add((s, t, v))
+                r_key = reverse_key(key)
+                edge_to_cpath.setdefault(r_key, set()).add((rs, rt, v))
+                bundle_edges_r.append(r_key)
 
             compound_paths_1[(s, v, t)] = width, length, score, bundle_edges
             compound_paths_1[(rs, v, rt)] = width, length, score, bundle_edges_r
@@ -1011,310 +1358,131 @@ def construct_compound_paths(ug, u_edge_data):
     compound_paths_2 = {}
     edge_to_cpath = {}
     for s, v, t in compound_paths_1:
-        rs = reverse_end(t)
-        rt = reverse_end(s)
-        if (rs, "NA", rt) not in compound_paths_1:
+        if (t ^ 1, NA, s ^ 1) not in compound_paths_1:
             if DEBUG_LOG_LEVEL > 1:
-                print("non_compliment bundle", s, v, t, len(compound_paths_1[(s, v, t)][-1]))
+                print("non_compliment bundle", ug.node_name(s), "NA", ug.node_name(t))
             continue
         width, length, score, bundle_edges = compound_paths_1[(s, v, t)]
         compound_paths_2[(s, v, t)] = width, length, score, bundle_edges
-        for vv, ww, kk in list(bundle_edges):
-            edge_to_cpath.setdefault((vv, ww, kk), set())
-            edge_to_cpath[(vv, ww, kk)].add((s, t, v))
+        for key in bundle_edges:
+            edge_to_cpath.setdefault(key, set()).add((s, t, v))
 
     compound_paths_3 = {}
     for k, val in compound_paths_2.items():
-
-        start_node, NA, end_node = k
-        rs = reverse_end(end_node)
-        rt = reverse_end(start_node)
-        assert (rs, "NA", rt) in compound_paths_2
+        start_node, _, end_node = k
+        assert (end_node ^ 1, NA, start_node ^ 1) in compound_paths_2
 
         contained = False
-        for vv, ww, kk in ug.out_edges(start_node, keys=True):
-            if len(edge_to_cpath.get((vv, ww, kk), [])) > 1:
+        for u in ug.out_edges(start_node):
+            if len(edge_to_cpath.get(ug.keys[u], ())) > 1:
                 contained = True
 
         if not contained:
             compound_paths_3[k] = val
-            if DEBUG_LOG_LEVEL > 1:
-                print("compound", k)
 
     compound_paths = {}
     for s, v, t in compound_paths_3:
-        rs = reverse_end(t)
-        rt = reverse_end(s)
-        if (rs, "NA", rt) not in compound_paths_3:
+        if (t ^ 1, NA, s ^ 1) not in compound_paths_3:
             continue
         compound_paths[(s, v, t)] = compound_paths_3[(s, v, t)]
 
     return compound_paths
 
 
-def run(args):
-    # transitivity reduction, remove spurs, remove putative edges caused by repeats
-    sg, sg_r, edge_data = generate_string_graph(args)
-
-    simple_paths = {}
-    dual_path = {}
-
-    sg2 = nx.DiGraph()
-
-    for v, w in edge_data.keys():
-
-        assert (reverse_end(w), reverse_end(v)) in edge_data
-
-        # if (v, w) in masked_edges:
-        #    continue
+def write_utg_data(ug, fn):
+    name = ug.node_name
+    with open(fn, "w") as f:
+        for (s, t, v), length, score, path_or_edges, type_ in zip(
+                ug.keys, ug.length, ug.score, ug.path, ug.type):
+            if v == NA:
+                path_or_edges = "|".join([name(ss) + "~" + name(vv) + "~" + name(tt)
+                                          for ss, tt, vv in path_or_edges])
+            else:
+                path_or_edges = "~".join([name(n) for n in path_or_edges])
+            print(name(s), name(v), name(t), type_, length, score, path_or_edges, file=f)
 
-        rid, sp, tp, length, score, identity, type_ = edge_data[(v, w)]
-        if type_ != "G":
-            continue
 
-        label = "%s:%d-%d" % (rid, sp, tp)
-        sg2.add_edge(v, w, label=label, length=length, score=score)
+def run(args):
+    # transitivity reduction, remove spurs, remove putative edges caused by repeats
+    sg = generate_string_graph(args)
 
     # utg construction phase 1, identify all simple paths
-    s_nodes = set()
-    t_nodes = set()
-    simple_nodes = set()
-
-    all_nodes = sg2.nodes()
-    for n in all_nodes:
-        in_degree = len(sg2.in_edges(n))
-        out_degree = len(sg2.out_edges(n))
-        if in_degree == 1 and out_degree == 1:
-            simple_nodes.add(n)
-        else:
-            if out_degree != 0:
-                s_nodes.add(n)
-            if in_degree != 0:
-                t_nodes.add(n)
-
-    free_edges = set(sg2.edges())
-
-    if DEBUG_LOG_LEVEL > 1:
-        for s in list(simple_nodes):
-            print("simple_node", s)
-        for s in list(s_nodes):
-            print("s_node", s)
-        for s in list(t_nodes):
-            print("t_node", s)
-
-        for v, w in free_edges:
-            if (reverse_end(w), reverse_end(v)) not in free_edges:
-                print("bug", v, w)
-                print(reverse_end(w), reverse_end(v))
-
-    while len(free_edges) != 0:
-        if len(s_nodes) != 0:
-            n = s_nodes.pop()
-            if DEBUG_LOG_LEVEL > 1:
-                print("initial utg 1", n)
-        else:
-            e = free_edges.pop()
-            free_edges.add(e)
-            n = e[0]
-            if DEBUG_LOG_LEVEL > 1:
-                print("initial utg 2", n)
-
-        path = []
-        path_length = 0
-        path_score = 0
-        for v, w in sg2.out_edges(n):
-            if (v, w) not in free_edges:
-                continue
-            rv = reverse_end(v)
-            rw = reverse_end(w)
-
-            path_length = 0
-            path_score = 0
-            v0 = v
-            w0 = w
-            path = [v, w]
-            path_edges = set()
-            path_edges.add((v, w))
-            path_length += edge_data[(v, w)][3]
-            path_score += edge_data[(v, w)][4]
-            free_edges.remove((v, w))
-
-            r_path_length = 0
-            r_path_score = 0
-            rv0 = rv
-            rw0 = rw
-            r_path = [rv, rw]  # need to reverse again
-            r_path_edges = set()
-            r_path_edges.add((rw, rv))
-            r_path_length += edge_data[(rw, rv)][3]
-            r_path_score += edge_data[(rw, rv)][4]
-            free_edges.remove((rw, rv))
-
-            while w in simple_nodes:
-                w, w_ = list(sg2.out_edges(w))[0]
-                if (w, w_) not in free_edges:
-                    break
-                rw_, rw = reverse_end(w_), reverse_end(w)
-
-                if (rw_, rw) in path_edges:
-                    break
-
-                path.append(w_)
-                path_edges.add((w, w_))
-                path_length += edge_data[(w, w_)][3]
-                path_score += edge_data[(w, w_)][4]
-                free_edges.remove((w, w_))
-
-                r_path.append(rw_)
-                r_path_edges.add((rw_, rw))
-                r_path_length += edge_data[(rw_, rw)][3]
-                r_path_score += edge_data[(rw_, rw)][4]
-                free_edges.remove((rw_, rw))
-
-                w = w_
-
-            simple_paths[(v0, w0, path[-1])] = path_length, path_score, path
-            r_path.reverse()
-            assert r_path[0] == reverse_end(path[-1])
-            simple_paths[(r_path[0], rw0, rv0)] = r_path_length, r_path_score, r_path
-
-            if DEBUG_LOG_LEVEL > 1:
-                print(path_length, path_score, path)
-
-            dual_path[(r_path[0], rw0, rv0)] = (v0, w0, path[-1])
-            dual_path[(v0, w0, path[-1])] = (r_path[0], rw0, rv0)
-
-    ug = nx.MultiDiGraph()
-    u_edge_data = {}
-    circular_path = set()
-
-    for s, v, t in simple_paths:
-        length, score, path = simple_paths[(s, v, t)]
-        u_edge_data[(s, t, v)] = (length, score, path, "simple")
-        if s != t:
-            ug.add_edge(s, t, key=v, type_="simple", via=v, length=length, score=score)
-        else:
-            circular_path.add((s, t, v))
+    ug = construct_simple_paths(sg)
+    name = ug.node_name
+    keys = ug.keys
+    simple_edges = ug.edges()
 
     if DEBUG_LOG_LEVEL > 1:
-        with open("utg_data0", "w") as f:
-            for s, t, v in u_edge_data:
-                rs = reverse_end(t)
-                rt = reverse_end(s)
-                rv = reverse_end(v)
-                assert (rs, rt, rv) in u_edge_data
-                length, score, path_or_edges, type_ = u_edge_data[(s, t, v)]
-
-                if type_ == "compound":
-                    path_or_edges = "|".join([ss + "~" + vv + "~" + tt for ss, tt, vv in path_or_edges])
-                else:
-                    path_or_edges = "~".join(path_or_edges)
-                print(s, v, t, type_, length, score, path_or_edges, file=f)
+        for key in keys:
+            assert reverse_key(key) in ug.index
+        write_utg_data(ug, "utg_data0")
 
     # identify spurs in the utg graph
     # Currently, we use ad-hoc logic filtering out shorter utg, but we ca
     # add proper alignment comparison later to remove redundant utgs
 
-    utg_spurs = set()
-    all_nodes = ug.nodes()
+    # The candidates are the sources in the graph as built; removing spurs makes no new ones.
+    s_candidates = [v for v in ug.nodes if ug.in_degree(v) == 0]
 
-    ug2 = ug.copy()
-
-    s_candidates = set()
-    for v in ug2.nodes():
-        if ug2.in_degree(v) == 0:
-            s_candidates.add(v)
-
-    while len(s_candidates) > 0:
-        n = s_candidates.pop()
-        if ug2.in_degree(n) != 0:
-            continue
-        n_ego_graph = nx.ego_graph(ug2, n, radius=10)
-        n_ego_node_set = set(n_ego_graph.nodes())
-        for b_node in n_ego_graph.nodes():
-            if ug2.in_degree(b_node) <= 1:
+    for n in s_candidates:
+        ego_nodes = ug.bfs(n, 10)
+        for b_node in ego_nodes:
+            if ug.in_degree(b_node) <= 1:
                 continue
 
             with_extern_node = False
-            b_in_nodes = [e[0] for e in ug2.in_edges(b_node)]
-
-            if len(b_in_nodes) == 1:
-                continue
-
-            for v in b_in_nodes:
-                if v not in n_ego_node_set:
+            for v in ug.pred[b_node]:
+                if not ug.reached(v):
                     with_extern_node = True
                     break
 
             if not with_extern_node:
                 continue
 
-            s_path = nx.shortest_path(ug2, n, b_node)
-            v1 = s_path[0]
+            s_path = ug.shortest_path(n, b_node)
             total_length = 0
-            for v2 in s_path[1:]:
-                for s, t, v in ug2.out_edges(v1, keys=True):
-                    if t != v2:
-                        continue
-                    length, score, edges, type_ = u_edge_data[(s, t, v)]
-                    total_length += length
-                v1 = v2
+            for v1, v2 in zip(s_path, s_path[1:]):
+                for u in ug.succ[v1][v2]:
+                    total_length += ug.length[u]
 
             if total_length >= 50000:
                 continue
 
-            v1 = s_path[0]
-            for v2 in s_path[1:]:
-                for s, t, v in list(ug2.out_edges(v1, keys=True)):
-                    if t != v2:
+            for v1, v2 in zip(s_path, s_path[1:]):
+                for u in list(ug.succ[v1].get(v2, ())):
+                    if not ug.live[u]:
                         continue
-                    length, score, edges, type_ = u_edge_data[(s, t, v)]
-                    rs = reverse_end(t)
-                    rt = reverse_end(s)
-                    rv = reverse_end(v)
-                    try:
-                        ug2.remove_edge(s, t, key=v)
-                        ug2.remove_edge(rs, rt, key=rv)
-                        u_edge_data[(s, t, v)] = length, score, edges, "spur:2"
-                        u_edge_data[(rs, rt, rv)] = length, score, edges, "spur:2"
-                    except Exception:
-                        pass
-
-                if ug2.in_edges(v2) == 0:
-                    s_candidates.add(v2)
-                v1 = v2
+                    ug.unlink(u)
+                    ru = ug.reverse(u)
+                    if ru is None or not ug.live[ru]:
+                        continue
+                    ug.unlink(ru)
+                    # The reverse takes the data of the spur, as it always has.
+                    ug.length[ru], ug.score[ru], ug.path[ru] = ug.length[u], ug.score[u], ug.path[u]
+                    ug.type[u] = ug.type[ru] = "spur:2"
             break
 
     # phase 2, finding all "consistent" compound paths
-    compound_paths = construct_compound_paths(ug2, u_edge_data)
-    ug2_edges = set(ug2.edges(keys=True))
+    compound_paths = construct_compound_paths(ug)
     edges_to_remove = set()
     with open("c_path", "w") as compound_path_file:
         for s, v, t in compound_paths:
             width, length, score, bundle_edges = compound_paths[(s, v, t)]
-            print(s, v, t, width, length, score, "|".join(
-                [e[0] + "~" + e[2] + "~" + e[1] for e in bundle_edges]), file=compound_path_file)
-            for ss, tt, vv in bundle_edges:
-                if (ss, tt, vv) in ug2_edges:
-                    edges_to_remove.add((ss, tt, vv))
-
-        for s, t, v in edges_to_remove:
-            ug2.remove_edge(s, t, v)
-            length, score, edges, type_ = u_edge_data[(s, t, v)]
-            if type_ != "spur":
-                u_edge_data[(s, t, v)] = length, score, edges, "contained"
+            print(name(s), "NA", name(t), width, length, score, "|".join(
+                [name(e[0]) + "~" + name(e[2]) + "~" + name(e[1]) for e in bundle_edges]), file=compound_path_file)
+            for key in bundle_edges:
+                u = ug.index.get(key)
+                if u is not None and ug.live[u]:
+                    edges_to_remove.add(u)
+
+        for u in sorted(edges_to_remove):
+            ug.unlink(u)
+            ug.type[u] = "contained"
 
         for s, v, t in compound_paths:
             width, length, score, bundle_edges = compound_paths[(s, v, t)]
-            u_edge_data[(s, t, v)] = (length, score, bundle_edges, "compound")
-            ug2.add_edge(s, t, key=v, via=v, type_="compound", length=length, score=score)
-
-            assert v == "NA"
-            rs = reverse_end(t)
-            rt = reverse_end(s)
-            assert (rs, v, rt) in compound_paths
-            dual_path[(s, v, t)] = (rs, v, rt)
-            dual_path[(rs, v, rt)] = (s, v, t)
+            ug.link(ug.add(s, t, v, length, score, bundle_edges, "compound"))
+            assert (t ^ 1, v, s ^ 1) in compound_paths
 
     # remove short utg using local flow consistent rule
     """
@@ -1324,128 +1492,103 @@ def run(args):
       <____/         \_____<
     """
     ug_edge_to_remove = set()
-    for s, t, v in ug.edges(keys=True):  # pylint: disable=unexpected-keyword-arg, fixme, line-too-long
-        if ug2.in_degree(s) == 1 and ug2.out_degree(s) == 2 and \
-           ug2.in_degree(t) == 2 and ug2.out_degree(t) == 1:
-            length, score, path_or_edges, type_ = u_edge_data[(s, t, v)]
-            if length < 60000:
-                rs = reverse_end(t)
-                rt = reverse_end(s)
-                rv = reverse_end(v)
-                ug_edge_to_remove.add((s, t, v))
-                ug_edge_to_remove.add((rs, rt, rv))
-    for s, t, v in ug_edge_to_remove:
-        try:
-            ug2.remove_edge(s, t, key=v)
-        except Exception:
-            pass
-        length, score, edges, type_ = u_edge_data[(s, t, v)]
-        u_edge_data[(s, t, v)] = length, score, edges, "repeat_bridge"
-
-    ug = ug2
-
-    with open("utg_data", "w") as f:
-        for s, t, v in u_edge_data:
-            length, score, path_or_edges, type_ = u_edge_data[(s, t, v)]
-
-            if v == "NA":
-                path_or_edges = "|".join([ss + "~" + vv + "~" + tt for ss, tt, vv in path_or_edges])
-            else:
-                path_or_edges = "~".join(path_or_edges)
-            print(s, v, t, type_, length, score, path_or_edges, file=f)
+    for u in simple_edges:
+        s, t, v = keys[u]
+        if ug.in_degree(s) == 1 and ug.out_degree(s) == 2 and \
+           ug.in_degree(t) == 2 and ug.out_degree(t) == 1:
+            if ug.length[u] < 60000:
+                ug_edge_to_remove.add(u)
+                ug_edge_to_remove.add(ug.index[reverse_key(keys[u])])
+    for u in sorted(ug_edge_to_remove):
+        if ug.live[u]:
+            ug.unlink(u)
+        ug.type[u] = "repeat_bridge"
+
+    write_utg_data(ug, "utg_data")
 
     # contig construction from utgs
 
-    s_nodes = set()
-    t_nodes = set()
-    simple_nodes = set()
-    simple_out = set()
-    simple_in = set()
-
-    all_nodes = ug.nodes()
-    for n in all_nodes:
-        in_degree = len(ug.in_edges(n))
-        out_degree = len(ug.out_edges(n))
-        if in_degree == 1 and out_degree == 1:
-            simple_nodes.add(n)
-        else:
-            if out_degree != 0:
-                s_nodes.add(n)
-            if in_degree != 0:
-                t_nodes.add(n)
-        if out_degree == 1:
-            simple_out.add(n)
-        if in_degree == 1:
-            simple_in.add(n)
-
-    all_nodes = set(all_nodes)
+    s_nodes = []
+    for n in ug.nodes:
+        in_degree = ug.in_degree(n)
+        out_degree = ug.out_degree(n)
+        if not (in_degree == 1 and out_degree == 1) and out_degree != 0:
+            s_nodes.append(n)
+
     c_path = []
 
-    free_edges = set()
-    for s, t, v in ug.edges(keys=True):
-        free_edges.add((s, t, v))
+    # The nodes that are not simple in order, then, for the circular paths, the first edge left.
+    free = bytearray(len(keys))
+    live_edges = ug.edges()
+    for u in live_edges:
+        free[u] = True
+    n_free = len(live_edges)
+    next_s_node = 0
+    first_free = 0
 
-    while len(free_edges) != 0:
+    while n_free != 0:
 
-        if len(s_nodes) != 0:
-            n = s_nodes.pop()
+        if next_s_node < len(s_nodes):
+            n = s_nodes[next_s_node]
+            next_s_node += 1
         else:
-            e = free_edges.pop()
-            n = e[0]
-
-        for s, t, v in ug.out_edges(n, keys=True):
-            path_start = n
-            path_end = None
-            path_key = None
+            while not free[live_edges[first_free]]:
+                first_free += 1
+            e = live_edges[first_free]
+            free[e] = False
+            n_free -= 1
+            n = keys[e][0]
+
+        for u in ug.out_edges(n):
+            s, t, v = keys[u]
             path = []
             path_length = 0
             path_score = 0
             path_nodes = set()
             path_nodes.add(s)
             if DEBUG_LOG_LEVEL > 1:
-                print("check 1", s, t, v)
-            path_key = t
-            t0 = s
-            while t in simple_out:
+                print("check 1", name(s), name(t), name(v))
+            while ug.out_degree(t) == 1:
                 if t in path_nodes:
                     break
-                rt = reverse_end(t)
-                if rt in path_nodes:
+                if t ^ 1 in path_nodes:
                     break
 
-                path.append((t0, t, v))
+                path.append(u)
                 path_nodes.add(t)
-                length, score, path_or_edges, type_ = u_edge_data[(t0, t, v)]
-                path_length += length
-                path_score += score
-                assert len(ug.out_edges(t, keys=True)) == 1  # t is "simple_out" node
-                t0, t, v = list(ug.out_edges(t, keys=True))[0]
-
-            path.append((t0, t, v))
-            length, score, path_or_edges, type_ = u_edge_data[(t0, t, v)]
-            path_length += length
-            path_score += score
+                path_length += ug.length[u]
+                path_score += ug.score[u]
+                u, = ug.out_edges(t)  # t is "simple_out" node
+                s, t, v = keys[u]
+
+            path.append(u)
+            path_length += ug.length[u]
+            path_score += ug.score[u]
             path_nodes.add(t)
-            path_end = t
 
-            c_path.append((path_start, path_key, path_end, path_length, path_score, path, len(path)))
+            c_path.append((path_length, path))
             if DEBUG_LOG_LEVEL > 1:
-                print("c_path", path_start, path_key, path_end, path_length, path_score, len(path))
+                print("c_path", name(n), name(t), path_length, path_score, len(path))
             for e in path:
-                if e in free_edges:
-                    free_edges.remove(e)
+                if free[e]:
+                    free[e] = False
+                    n_free -= 1
 
     if DEBUG_LOG_LEVEL > 1:
-        print("left over edges:", len(free_edges))
+        print("left over edges:", n_free)
+
+    free = bytearray(len(keys))
+    for u in live_edges:
+        free[u] = True
 
-    free_edges = set()
-    for s, t, v in ug.edges(keys=True):
-        free_edges.add((s, t, v))
+    def edge_str(u):
+        s, t, v = keys[u]
+        return name(s) + "~" + name(v) + "~" + name(t)
 
     ctg_id = 0
-    c_path.sort(key=lambda x: -x[3])
+    c_path.sort(key=lambda x: -x[0])
     with open("ctg_paths", "w") as ctg_paths:
-        for path_start, path_key, path_end, p_len, p_score, path, n_edges in c_path:
+        for p_len, path in c_path:
             length = 0
             score = 0
             length_r = 0
@@ -1453,45 +1596,38 @@ def run(args):
 
             non_overlapped_path = []
             non_overlapped_path_r = []
-            for s, t, v in path:
-                if v != "NA":
-                    rs, rt, rv = reverse_end(t), reverse_end(s), reverse_end(v)
-                else:
-                    rs, rt, rv = reverse_end(t), reverse_end(s), "NA"
-                if (s, t, v) in free_edges and (rs, rt, rv) in free_edges:
-                    non_overlapped_path.append((s, t, v))
-                    non_overlapped_path_r.append((rs, rt, rv))
-                    length += u_edge_data[(s, t, v)][0]
-                    score += u_edge_data[(s, t, v)][1]
-                    length_r += u_edge_data[(rs, rt, rv)][0]
-                    score_r += u_edge_data[(rs, rt, rv)][1]
+            for u in path:
+                ru = ug.reverse(u)
+                if free[u] and ru is not None and free[ru]:
+                    non_overlapped_path.append(u)
+                    non_overlapped_path_r.append(ru)
+                    length += ug.length[u]
+                    score += ug.score[u]
+                    length_r += ug.length[ru]
+                    score_r += ug.score[ru]
                 else:
                     break
 
             if len(non_overlapped_path) == 0:
                 continue
-            s0, t0, v0 = non_overlapped_path[0]
-            end_node = non_overlapped_path[-1][1]
+            end_node = keys[non_overlapped_path[-1]][1]
 
-            print("%06dF" % ctg_id, "ctg_linear", s0 + "~" + v0 + "~" + \
-                t0, end_node, length, score, "|".join([c[0] + "~" + c[2] + "~" + c[1] for c in non_overlapped_path]), file=ctg_paths)
+            print("%06dF" % ctg_id, "ctg_linear", edge_str(non_overlapped_path[0]), name(end_node),
+                  length, score, "|".join([edge_str(u) for u in non_overlapped_path]), file=ctg_paths)
             non_overlapped_path_r.reverse()
-            s0, t0, v0 = non_overlapped_path_r[0]
-            end_node = non_overlapped_path_r[-1][1]
-            print("%06dR" % ctg_id, "ctg_linear", s0 + "~" + v0 + "~" + \
-                t0, end_node, length_r, score_r, "|".join(
-                    [c[0] + "~" + c[2] + "~" + c[1] for c in non_overlapped_path_r]), file=ctg_paths)
+            end_node = keys[non_overlapped_path_r[-1]][1]
+            print("%06dR" % ctg_id, "ctg_linear", edge_str(non_overlapped_path_r[0]), name(end_node),
+                  length_r, score_r, "|".join([edge_str(u) for u in non_overlapped_path_r]), file=ctg_paths)
             ctg_id += 1
-            for e in non_overlapped_path:
-                if e in free_edges:
-                    free_edges.remove(e)
-            for e in non_overlapped_path_r:
-                if e in free_edges:
-                    free_edges.remove(e)
-
-        for s, t, v in list(circular_path):
-            length, score, path, type_ = u_edge_data[(s, t, v)]
-            print("%6d" % ctg_id, "ctg_circular", s + "~" + v + "~" + t, t, length, score, s + "~" + v + "~" + t, file=ctg_paths)
+            for u in non_overlapped_path:
+                free[u] = False
+            for u in non_overlapped_path_r:
+                free[u] = False
+
+        for u in ug.circular:
+            s, t, v = keys[u]
+            print("%6d" % ctg_id, "ctg_circular", edge_str(u), name(t), ug.length[u], ug.score[u], edge_str(u),
+                  file=ctg_paths)
             ctg_id += 1
 
 
@@ -1510,6 +1646,7 @@ Writes:
     c_path
     ctg_paths
     sg_edges_list
+    sg_edges_list.bin
     utg_data
     utg_data0
 """
@@ -1528,6 +1665,9 @@ Writes:
     parser.add_argument(
         '--lfc', action="store_true", default=False,
         help='use local flow constraint method rather than best overlap method to resolve knots in string graph')
+    parser.add_argument(
+        '--n-core', type=int, default=1,
+        help='number of processes for the transitive reduction')
     args = parser.parse_args(argv[1:])
     return args
 
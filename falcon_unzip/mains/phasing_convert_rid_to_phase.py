@@ -0,0 +1,48 @@
+"""Convert a rid_to_phase table between the text format and the binary, memory-mappable one.
+"""
+from .. import rid_to_phase
+
+
+def convert_rid_to_phase(rid_phase_map, out_fn, fmt):
+    table = rid_to_phase.load(rid_phase_map)
+    if fmt == 'binary':
+        rid_to_phase.write_binary(out_fn, table)
+    elif out_fn == '-':
+        rid_to_phase.write_text(table, sys.stdout)
+    else:
+        with open(out_fn, 'w') as out_f:
+            rid_to_phase.write_text(table, out_f)
+
+
+######
+import argparse
+import sys
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Write a rid_to_phase table (binary or text) as binary, or as text for debugging.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '--rid-phase-map', required=True,
+        help='an input'
+    )
+    parser.add_argument(
+        '--out-fn', required=True,
+        help='an output, or "-" for stdout (text only)'
+    )
+    parser.add_argument(
+        '--fmt', choices=['binary', 'text'], default='binary',
+        help='format of the output'
+    )
+    args = parser.parse_args(argv[1:])
+    return args
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    convert_rid_to_phase(**vars(args))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -0,0 +1,42 @@
+"""Convert a binary vmap (from phasing_make_het_call) into the original text format.
+"""
+from .. import variant_map
+
+
+def export_vmap(vmap_fn, out_fn):
+    vmap = variant_map.load(vmap_fn)
+    if out_fn == '-':
+        variant_map.write_text(vmap, sys.stdout)
+    else:
+        with open(out_fn, 'w') as out_f:
+            variant_map.write_text(vmap, out_f)
+
+
+######
+import argparse
+import sys
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Write a vmap (binary or text) as text, for debugging.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '--vmap-fn', required=True,
+        help='an input'
+    )
+    parser.add_argument(
+        '--out-fn', default='-',
+        help='an output, or "-" for stdout'
+    )
+    args = parser.parse_args(argv[1:])
+    return args
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    export_vmap(**vars(args))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
@@ -3,11 +3,12 @@ import logging
 import os
 import sys
 from .. import io
+from .. import rid_to_phase
 
 LOG = logging.getLogger()
 
 
-def run(gathered_fn, rid_to_phase_all_fn):
+def run(gathered_fn, rid_to_phase_all_fn, rid_to_phase_bin_fn=''):
     gathered_dir = os.path.dirname(gathered_fn)
     out_dir = os.path.dirname(rid_to_phase_all_fn)
     rid_to_phase_all = list()
@@ -24,6 +25,10 @@ def run(gathered_fn, rid_to_phase_all_fn):
     with open(rid_to_phase_all_fn, 'w') as stream:
         stream.write('\n'.join(rid_to_phase_all))
         stream.write('\n')
+    if rid_to_phase_bin_fn:
+        LOG.info('Writing binary rid_to_phase table {!r}'.format(rid_to_phase_bin_fn))
+        rows = (line.split()[:4] for line in rid_to_phase_all if line)
+        rid_to_phase.write_binary(rid_to_phase_bin_fn, rid_to_phase.from_rows(rows))
 
 
 class HelpF(argparse.RawTextHelpFormatter, argparse.ArgumentDefaultsHelpFormatter):
@@ -46,6 +51,10 @@ def parse_args(argv):
         '--rid-to-phase-all-fn',
         help='Output: Concatenation of rid_to_phase files',
     )
+    parser.add_argument(
+        '--rid-to-phase-bin-fn', default='',
+        help='Output (optional): The same table, in the binary format indexed by pread id',
+    )
     args = parser.parse_args(argv[1:])
     return args
 
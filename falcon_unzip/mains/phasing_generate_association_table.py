@@ -1,77 +1,126 @@
-import os
-
-
-def generate_association_table(vmap_fn, atable_fn, ctg_id):
-    vmap = {}
-    v_positions = []
-
-    with open(vmap_fn) as f:
-        for l in f:
-            if l.startswith('#EOF'):  # prove file is complete
-                break
-            if l.startswith('#'):  # skip comments
-                continue
-            l = l.strip().split()
-            pos = int(l[0])
-            ref_b = l[1]
-            v_b = l[2]
-            q_id = int(l[3])
-            if (pos, ref_b) not in vmap:
-                v_positions.append((pos, ref_b))
-            vmap.setdefault((pos, ref_b), {})
-            vmap[(pos, ref_b)].setdefault(v_b, [])
-            vmap[(pos, ref_b)][v_b].append(q_id)
-        else:
-            raise Exception('No EOF found in {!r}'.format(os.path.abspath(vmap_fn)))
-
-    #xary = []
-    #yary = []
+from .. import variant_map
+import numpy as np
+
+MAX_LINK_DIST = 1 << 16  # Only pair variants this close.
+MIN_LINK_READS = 6  # Skip pairs with fewer reads covering both.
+MAX_LINKS = 500  # Stop after about this many pairs per variant.
+CHUNK_SIZE = 4 * MAX_LINK_DIST  # Default span of the variants whose links are counted together.
+
+
+def get_incidence(vmap):
+    """Return the sparse read-by-allele incidence of vmap, as parallel arrays
+    (read, site, allele) sorted by (read, site, allele), without duplicates.
+    Sites are numbered in position order; alleles are 0 and 1 in order of appearance.
+    Also return the site positions, and their bases as [(b1, b2), ...].
+    """
+    bounds = variant_map.site_bounds(vmap)
+    n_sites = len(bounds) - 1
+    site = np.repeat(np.arange(n_sites, dtype=np.int64), np.diff(bounds))
+    first_allele = vmap.allele[bounds[:-1]]
+    allele = (vmap.allele != first_allele[site]).astype(np.int64)
+
+    # Second allele of each site, and the number of distinct alleles.
+    site_allele = np.unique(site * 256 + vmap.allele)
+    n_alleles = np.bincount(site_allele // 256, minlength=n_sites)
+    second_allele = np.zeros(n_sites, dtype=np.uint8)
+    second_rows = np.flatnonzero(allele)
+    sites_with_second, first_second = np.unique(site[second_rows], return_index=True)
+    second_allele[sites_with_second] = vmap.allele[second_rows[first_second]]
+    bases = [(chr(b1), chr(b2)) for b1, b2 in zip(first_allele.tolist(), second_allele.tolist())]
+
+    _, read = np.unique(vmap.q_id, return_inverse=True)
+    key = np.unique((read.astype(np.int64) * n_sites + site) * 2 + allele)
+    inc_read = key // (2 * n_sites)
+    inc_site = (key // 2) % n_sites
+    inc_allele = key % 2
+    return key, inc_read, inc_site, inc_allele, vmap.pos[bounds[:-1]], bases, n_alleles
+
+
+def concat_ranges(starts, ends):
+    """Return the concatenation of arange(s, e) for each s, e.
+    """
+    lengths = ends - starts
+    offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+    return offsets + np.arange(lengths.sum(), dtype=np.int64)
+
+
+def iter_association_rows(vmap, max_pos=None):
+    """For each pair of het sites within MAX_LINK_DIST, count reads for each pair of alleles.
+    Yield (pos1, b11, b12, pos2, b21, b22, ct11, ct12, ct21, ct22)
+    for pairs covered by at least MIN_LINK_READS reads,
+    at most MAX_LINKS+1 per pos1.
+    If max_pos is given, only for pos1 < max_pos.
+
+    The counts are sparse products of the incidence matrix: for each read on site i1,
+    we take the read's entries on later sites within the window.
+    """
+    if not len(vmap.pos):
+        return  # A contig with no het sites links nothing.
+    key, inc_read, inc_site, inc_allele, site_pos, bases, n_alleles = get_incidence(vmap)
+    n_sites = len(site_pos)
+    # Sites [i1+1, site_end[i1]) are within MAX_LINK_DIST of i1.
+    site_end = np.searchsorted(site_pos, site_pos + MAX_LINK_DIST, side='right')
+    # Range of the entries of the same read in those sites.
+    inc_begin = np.searchsorted(key, (inc_read * n_sites + inc_site + 1) * 2)
+    inc_end = np.searchsorted(key, (inc_read * n_sites + site_end[inc_site]) * 2)
+    # Entries grouped by site.
+    by_site = np.argsort(inc_site, kind='stable')
+    site_entries = np.searchsorted(inc_site[by_site], np.arange(n_sites + 1))
+
+    n_first_sites = n_sites if max_pos is None else np.searchsorted(site_pos, max_pos)
+    site_pos = site_pos.tolist()
+    for i1 in range(n_first_sites):
+        n_pairs = site_end[i1] - i1 - 1
+        if not n_pairs:
+            continue
+        assert (n_alleles[i1:site_end[i1]] == 2).all(), 'len={}'.format(n_alleles[i1:site_end[i1]])
+        entries = by_site[site_entries[i1]:site_entries[i1 + 1]]
+        linked = concat_ranges(inc_begin[entries], inc_end[entries])
+        allele1 = np.repeat(inc_allele[entries], inc_end[entries] - inc_begin[entries])
+        code = ((inc_site[linked] - i1 - 1) * 2 + allele1) * 2 + inc_allele[linked]
+        ct = np.bincount(code, minlength=4 * n_pairs).reshape(n_pairs, 4)
+        linked_pairs = np.flatnonzero(ct.sum(axis=1) >= MIN_LINK_READS)[:MAX_LINKS + 1]
+        b11, b12 = bases[i1]
+        for k, (ct11, ct12, ct21, ct22) in zip(linked_pairs.tolist(), ct[linked_pairs].tolist()):
+            i2 = i1 + 1 + k
+            b21, b22 = bases[i2]
+            yield site_pos[i1], b11, b12, site_pos[i2], b21, b22, ct11, ct12, ct21, ct22
+
+
+def iter_association_rows_streaming(vmap, chunk_size=CHUNK_SIZE):
+    """Like iter_association_rows(), but for chunk_size bp of sites at a time,
+    together with the next MAX_LINK_DIST bp of sites that they can link to.
+    So peak memory depends on chunk_size and depth, not on contig length,
+    as long as the vmap columns are memory-mapped (i.e. the binary format).
+    """
+    pos = vmap.pos
+    n_rows = len(pos)
+    beg = 0
+    while beg < n_rows:
+        chunk_end_pos = int(pos[beg]) + chunk_size
+        end = np.searchsorted(pos, chunk_end_pos + MAX_LINK_DIST - 1, side='right')
+        chunk = variant_map.VariantMap(*(column[beg:end] for column in vmap))
+        for row in iter_association_rows(chunk, max_pos=chunk_end_pos):
+            yield row
+        beg = np.searchsorted(pos, chunk_end_pos)
+
+
+def get_association_rows(vmap, chunk_size=CHUNK_SIZE):
+    """If chunk_size > 0, stream through the vmap in chunks of that many bp.
+    """
+    if chunk_size > 0:
+        return iter_association_rows_streaming(vmap, chunk_size)
+    else:
+        return iter_association_rows(vmap)
+
+
+def generate_association_table(vmap_fn, atable_fn, ctg_id, chunk_size=CHUNK_SIZE):
+    """vmap_fn can be binary or text. See variant_map.py
+    """
+    vmap = variant_map.load(vmap_fn)
     with open(atable_fn, "w") as out_f:
-        for i1 in range(len(v_positions)):
-            link_count = 0
-            for i2 in range(i1 + 1, len(v_positions)):
-                pos1, rb1 = v_positions[i1]
-                pos2, rb2 = v_positions[i2]
-                if pos2 - pos1 > (1 << 16):
-                    continue
-                ct = {}
-                p1table = []
-                p2table = []
-                s1 = 0
-                list1 = list(vmap[(pos1, rb1)].items())
-                assert len(list1) == 2, 'len={}'.format(len(list1))
-                for b1, qids1 in list1:
-                    p1table.append((b1, len(qids1)))
-                    s1 += len(qids1)
-
-                s2 = 0
-                list2 = list(vmap[(pos2, rb2)].items())
-                assert len(list2) == 2, 'len={}'.format(len(list2))
-                for b2, qids2 in list2:
-                    p2table.append((b2, len(qids2)))
-                    s2 += len(qids2)
-
-                total_s = 0
-                for b1, qids1 in list1:
-                    for b2, qids2 in list2:
-                        s = len(set(qids1) & set(qids2))
-                        ct[(b1, b2)] = s
-                        total_s += s
-                if total_s < 6:
-                    continue
-
-                b11 = p1table[0][0]
-                b12 = p1table[1][0]
-                b21 = p2table[0][0]
-                b22 = p2table[1][0]
-                print(pos1, b11, b12, pos2, b21, b22, ct[(
-                    b11, b21)], ct[(b11, b22)], ct[(b12, b21)], ct[(b12, b22)], file=out_f)
-
-                # xary.append(pos1)
-                # yary.append(pos2)
-                link_count += 1
-                if link_count > 500:
-                    break
+        for row in get_association_rows(vmap, chunk_size):
+            print(*row, file=out_f)
 
 
 ######
@@ -94,6 +143,10 @@ def parse_args(argv):
         '--atable-fn', required=True,
         help='an output'
     )
+    parser.add_argument(
+        '--chunk-size', type=int, default=CHUNK_SIZE,
+        help='Link the variants in chunks of this many bp, to bound memory on long contigs. 0 means the whole contig at once.'
+    )
     args = parser.parse_args(argv[1:])
     return args
 
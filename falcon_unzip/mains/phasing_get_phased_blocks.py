@@ -1,215 +1,168 @@
-import os
+from .. import variant_map
+import logging
+import numpy as np
 
+LOG = logging.getLogger(__name__)
 
-def get_score(c_score, pos1, pos2, s1, s2):
-    if pos1 > pos2:
-        pos1, pos2 = pos2, pos1
-        s1, s2 = s2, s1
-    b11, b12 = s1
-    b21, b22 = s2
-    return c_score[(pos1, pos2)][(b11 + b21, b12 + b22)]
+MIN_LINK_SCORE = 6  # Skip links with |cis - trans| below this.
+MIN_VARIANT_SCORE = 10  # Leave variants out of blocks unless both side scores reach this.
+MIN_BLOCK_VARIANTS = 4
+MAX_PASSES = 10
 
 
-def get_phased_blocks(vmap_fn, atable_fn, p_variant_fn):
-    left_connect = {}
-    right_connect = {}
-
-    c_score = {}
-    states = {}
-    positions = set()
-
-    ref_base = {}
-    with open(vmap_fn) as f:
-        for l in f:
-            if l.startswith('#EOF'):  # prove file is complete
-                break
-            if l.startswith('#'):  # skip comments
-                continue
-            l = l.strip().split()
-            pos = int(l[0])
-            ref_b = l[1]
-            v_b = l[2]
-            q_id = int(l[3])
-            ref_base[pos] = ref_b
-        else:
-            raise Exception('No EOF found in {!r}'.format(os.path.abspath(vmap_fn)))
-
+def load_atable(atable_fn):
+    """Yield the rows of an association table, with the counts as ints.
+    """
     with open(atable_fn) as f:
         for l in f:
-            l = l.strip().split()
-            pos1, b11, b12, pos2, b21, b22, s11, s12, s21, s22 = l
-            s11, s12, s21, s22 = int(s11), int(s12), int(s21), int(s22)
-            if abs(s11 + s22 - s12 - s21) < 6:
-                continue
-            pos1 = int(pos1)
-            pos2 = int(pos2)
-            positions.add(pos1)
-            positions.add(pos2)
-            right_connect.setdefault(pos1, [])
-            right_connect[pos1].append(pos2)
-            left_connect.setdefault(pos2, [])
-            left_connect[pos2].append(pos1)
-            c_score[(pos1, pos2)] = {(b11 + b21, b12 + b22): s11 + s22, (b12 + b22, b11 + b21): s11 + s22,
-                                     (b12 + b21, b11 + b22): s12 + s21, (b11 + b22, b12 + b21): s12 + s21}
-
-            if pos1 not in states:
-                st1 = (b11, b12)
-                st2 = (b12, b11)
-                score1 = 0
-                score2 = 0
-                for pp in left_connect.get(pos1, []):
-                    if pp in states:
-                        st0 = states[pp]
-                    else:
-                        continue
-                    score1 += get_score(c_score, pp, pos1, st0, st1)
-                    score2 += get_score(c_score, pp, pos1, st0, st2)
-
-                for pp in right_connect.get(pos1, []):
-                    if pp in states:
-                        st0 = states[pp]
-                    else:
-                        continue
-                    score1 += get_score(c_score, pos1, pp, st1, st0)
-                    score2 += get_score(c_score, pos1, pp, st2, st0)
-
-                if score1 >= score2:
-                    states[pos1] = st1
-                else:
-                    states[pos1] = st2
-
-            if pos2 not in states:
-                st1 = (b21, b22)
-                st2 = (b22, b21)
-                score1 = 0
-                score2 = 0
-                for pp in left_connect.get(pos2, []):
-                    if pp in states:
-                        st0 = states[pp]
-                    else:
-                        continue
-                    score1 += get_score(c_score, pp, pos2, st0, st1)
-                    score2 += get_score(c_score, pp, pos2, st0, st2)
-
-                for pp in right_connect.get(pos2, []):
-                    if pp in states:
-                        st0 = states[pp]
-                    else:
-                        continue
-                    score1 += get_score(c_score, pos2, pp, st1, st0)
-                    score2 += get_score(c_score, pos2, pp, st2, st0)
-
-                if score1 >= score2:
-                    states[pos2] = st1
-                else:
-                    states[pos2] = st2
-
-    positions = list(positions)
-    positions.sort()
-
-    iter_count = 0
-    while 1:
-        iter_count += 1
-        if iter_count > 10:
-            break
-        update_count = 0
-        for p in positions:
-            b1, b2 = states[p]
-            st1 = (b1, b2)
-            st2 = (b2, b1)
-
-            score1 = 0
-            score2 = 0
-            for pp in left_connect.get(p, []):
-                st0 = states[pp]
-                score1 += get_score(c_score, pp, p, st0, st1)
-                score2 += get_score(c_score, pp, p, st0, st2)
-
-            # for pp in right_connect.get(p,[]):
-            #    st0 = states[pp]
-            #    score1 += get_score( c_score, p, pp, st1 ,st0)
-            #    score2 += get_score( c_score, p, pp, st2, st0)
-
-            if score1 >= score2:
-                states[p] = st1
-            else:
-                states[p] = st2
-                update_count += 1
-        if update_count == 0:
+            pos1, b11, b12, pos2, b21, b22, s11, s12, s21, s22 = l.strip().split()
+            yield int(pos1), b11, b12, int(pos2), b21, b22, int(s11), int(s12), int(s21), int(s22)
+
+
+def get_links(atable_rows):
+    """Return (positions, bases, a, b, d) for the rows with |cis - trans| >= MIN_LINK_SCORE.
+    Variants are dense indices into the sorted positions, and bases[i] = (b1, b2).
+    Links are parallel arrays, from variant a to variant b (a < b),
+    with d = cis - trans, where cis = s11 + s22 and trans = s12 + s21.
+    """
+    rows = list(atable_rows)
+    pos1 = np.array([r[0] for r in rows], dtype=np.int64)
+    pos2 = np.array([r[3] for r in rows], dtype=np.int64)
+    ct = np.array([r[6:10] for r in rows], dtype=np.int64).reshape(-1, 4)
+    d = (ct[:, 0] + ct[:, 3]) - (ct[:, 1] + ct[:, 2])
+    kept = np.flatnonzero(np.abs(d) >= MIN_LINK_SCORE)
+    positions, variants = np.unique(np.concatenate((pos1[kept], pos2[kept])), return_inverse=True)
+    a = variants[:len(kept)]
+    b = variants[len(kept):]
+    bases = [None] * len(positions)
+    for i, k in zip(a.tolist(), kept.tolist()):
+        bases[i] = rows[k][1:3]
+    for i, k in zip(b.tolist(), kept.tolist()):
+        bases[i] = rows[k][4:6]
+    return positions, bases, a, b, d[kept]
+
+
+def get_initial_signs(n, a, b, d):
+    """Orient each variant (+1 for (b1, b2), -1 for (b2, b1)) when its first link is read,
+    to agree with the variant already oriented on that link.
+    In link order, the first variant of a new pair is +1.
+    Those first links form a forest, so the sign of a variant is the product of
+    the link signs up to its root, which we find by pointer jumping.
+    """
+    n_links = len(d)
+    first = np.full(n, n_links, dtype=np.int64)
+    np.minimum.at(first, a, np.arange(n_links))
+    np.minimum.at(first, b, np.arange(n_links))
+    parent = np.where(b[first] == np.arange(n), a[first], b[first])
+    is_root = (a[first] == np.arange(n)) & (first[parent] == first)
+    parent[is_root] = np.flatnonzero(is_root)
+    sign = np.where(is_root, 1, np.sign(d[first])).astype(np.int64)
+    while (parent[parent] != parent).any():
+        sign = sign * sign[parent]
+        parent = parent[parent]
+    return sign
+
+
+def optimize_signs(sign, a, b, d):
+    """Make up to MAX_PASSES passes over the variants in position order,
+    flipping each one whose score from its left links is higher flipped.
+    Within a pass, the flips are applied immediately, as in a sequential sweep;
+    but we only visit the variants that need a flip.
+    Return the number of flips in each pass.
+    """
+    n = len(sign)
+    # Links grouped by left variant, for updating the right variants after a flip.
+    by_a = np.argsort(a, kind='stable')
+    a_bounds = np.searchsorted(a[by_a], np.arange(n + 1))
+    flip_counts = []
+    for _ in range(MAX_PASSES):
+        # Score of each variant's current sign, from its left links.
+        h = np.bincount(b, weights=d * sign[a], minlength=n).astype(np.int64)
+        flips = 0
+        start = 0
+        while True:
+            wrong = np.flatnonzero(sign[start:] * h[start:] < 0)
+            if not len(wrong):
+                break
+            f = start + wrong[0]
+            sign[f] = -sign[f]
+            links = by_a[a_bounds[f]:a_bounds[f + 1]]
+            np.add.at(h, b[links], 2 * d[links] * sign[f])
+            flips += 1
+            start = f + 1
+        flip_counts.append(flips)
+        if not flips:
             break
-
-    right_extent = {}
-    right_score = {}
-    left_extent = {}
-    left_score = {}
-
-    for p in positions:
-
-        left_extent[p] = p
-        left_score[p] = 0
-        if p in left_connect:
-            left = p
-            st0 = states[p]
-            st0_ = st0[1], st0[0]
-            for pp in left_connect[p]:
-                st1 = states[pp]
-                s = get_score(c_score, pp, p, st1, st0)
-                s_ = get_score(c_score, pp, p, st1, st0_)
-                left_score[p] += s - s_
-                if s - s_ > 0 and pp < left:
-                    left = pp
-            left_extent[p] = left
-
-        right_extent[p] = p
-        right_score[p] = 0
-        if p in right_connect:
-            right = p
-            st0 = states[p]
-            st0_ = st0[1], st0[0]
-            for pp in right_connect[p]:
-                st1 = states[pp]
-                s = get_score(c_score, p, pp, st0, st1)
-                s_ = get_score(c_score, p, pp, st0_, st1)
-                right_score[p] += s - s_
-                if s - s_ > 0 and pp > right:
-                    right = pp
-            right_extent[p] = right
-
-    phase_block_id = 1
-    phase_blocks = {}
-    pb = []
-
-    max_right_ext = 0
-    for p in positions:
-        if right_score[p] < 10 or left_score[p] < 10:
+    return flip_counts
+
+
+def get_phased_variants(atable_rows):
+    """Return the phase blocks, as a list of lists of
+    (pos, b1, b2, left_extent, right_extent, left_score, right_score).
+    """
+    positions, bases, a, b, d = get_links(atable_rows)
+    n = len(positions)
+    if not n:
+        return []
+    sign = get_initial_signs(n, a, b, d)
+    flip_counts = optimize_signs(sign, a, b, d)
+    LOG.info('{} variants, {} links; flips per pass: {} ({})'.format(
+        n, len(d), flip_counts, 'converged' if not flip_counts[-1] else 'stopped after {} passes'.format(MAX_PASSES)))
+
+    # How much each link agrees with the phasing.
+    agree = sign[a] * sign[b] * d
+    left_score = np.bincount(b, weights=agree, minlength=n).astype(np.int64)
+    right_score = np.bincount(a, weights=agree, minlength=n).astype(np.int64)
+    left_extent = positions.copy()
+    right_extent = positions.copy()
+    agreeing = agree > 0
+    np.minimum.at(left_extent, b[agreeing], positions[a[agreeing]])
+    np.maximum.at(right_extent, a[agreeing], positions[b[agreeing]])
+
+    # A new block starts wherever no earlier variant reaches this one's left extent.
+    kept = np.flatnonzero((left_score >= MIN_VARIANT_SCORE) & (right_score >= MIN_VARIANT_SCORE))
+    max_right_extent = np.concatenate(([0], np.maximum.accumulate(right_extent[kept])[:-1]))
+    starts = np.flatnonzero(max_right_extent < left_extent[kept]).tolist() + [len(kept)]
+
+    phase_blocks = []
+    for beg, end in zip(starts[:-1], starts[1:]):
+        if end - beg < MIN_BLOCK_VARIANTS:
             continue
-        b1, b2 = states[p]
-        if max_right_ext < left_extent[p]:
-            if len(pb) > 3:
-                phase_blocks[phase_block_id] = pb
-                phase_block_id += 1
-            pb = []
-        pb.append((p, b1, b2))
-        if right_extent[p] > max_right_ext:
-            max_right_ext = right_extent[p]
-    if len(pb) > 3:
-        phase_blocks[phase_block_id] = pb
-    else:
-        phase_block_id -= 1
+        pb = []
+        for i in kept[beg:end].tolist():
+            b1, b2 = bases[i] if sign[i] > 0 else bases[i][::-1]
+            pb.append((int(positions[i]), b1, b2, int(left_extent[i]), int(right_extent[i]),
+                       int(left_score[i]), int(right_score[i])))
+        phase_blocks.append(pb)
+    return phase_blocks
+
+
+def write_phased_variants(phase_blocks, ref_base, out_f):
+    for pid, pb in enumerate(phase_blocks, 1):
+        min_ = min([x[0] for x in pb])
+        max_ = max([x[0] for x in pb])
+
+        print("P", pid, min_, max_, max_ - \
+            min_, len(pb), 1.0 * (max_ - min_) / len(pb), file=out_f)
+        for p, b1, b2, left_extent, right_extent, left_score, right_score in pb:
+            rb = ref_base[p]
+            print("V", pid, p, "%d_%s_%s" % (p, rb, b1), "%d_%s_%s" % (
+                p, rb, b2), left_extent, right_extent, left_score, right_score, file=out_f)
 
-    with open(p_variant_fn, "w") as out_f:
-        for pid in range(1, phase_block_id + 1):
-            if len(phase_blocks[pid]) == 0:
-                continue
-            min_ = min([x[0] for x in phase_blocks[pid]])
-            max_ = max([x[0] for x in phase_blocks[pid]])
 
-            print("P", pid, min_, max_, max_ - \
-                min_, len(phase_blocks[pid]), 1.0 * (max_ - min_) / len(phase_blocks[pid]), file=out_f)
-            for p, b1, b2 in phase_blocks[pid]:
-                rb = ref_base[p]
-                print("V", pid, p, "%d_%s_%s" % (p, rb, b1), "%d_%s_%s" % (
-                    p, rb, b2), left_extent[p], right_extent[p], left_score[p], right_score[p], file=out_f)
+def get_ref_bases(vmap):
+    """Return {pos: ref_base} for a VariantMap.
+    """
+    first_rows = variant_map.site_bounds(vmap)[:-1]
+    return dict(zip(vmap.pos[first_rows].tolist(),
+                    (chr(b) for b in vmap.ref_base[first_rows].tolist())))
+
+
+def get_phased_blocks(vmap_fn, atable_fn, p_variant_fn):
+    ref_base = get_ref_bases(variant_map.load(vmap_fn))
+    phase_blocks = get_phased_variants(load_atable(atable_fn))
+    with open(p_variant_fn, "w") as out_f:
+        write_phased_variants(phase_blocks, ref_base, out_f)
 
 
 ######
@@ -239,6 +192,7 @@ def parse_args(argv):
 
 def main(argv=sys.argv):
     args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
     get_phased_blocks(**vars(args))
 
 
@@ -1,28 +1,16 @@
-from .. import io
-import os
+from .. import variant_map
+from .phasing_make_het_call import load_q_id_map
+import numpy as np
 
 
-def get_phased_reads(phased_reads_fn, q_id_map_fn, vmap_fn, p_variant_fn, ctg_id):
-    rid_map = dict(io.deserialize(q_id_map_fn))
+def parse_variant(v):
+    """'6854_A_G' -> (6854, 'A', 'G')
+    """
+    pos, ref_b, v_b = v.split('_')
+    return (int(pos), ref_b, v_b)
 
-    read_to_variants = {}
-    variant_to_reads = {}
-    with open(vmap_fn) as f:
-        for l in f:
-            if l.startswith('#EOF'):  # prove file is complete
-                break
-            if l.startswith('#'):  # skip comments
-                continue
-            l = l.strip().split()
-            variant = "_".join(l[:3])
-            read_id = int(l[3])
-            read_to_variants.setdefault(read_id, set())
-            read_to_variants[read_id].add(variant)
-            variant_to_reads.setdefault(variant, set())
-            variant_to_reads[variant].add(read_id)
-        else:
-            raise Exception('No EOF found in {!r}'.format(os.path.abspath(vmap_fn)))
 
+def load_variant_to_phase(p_variant_fn):
     variant_to_phase = {}
     with open(p_variant_fn) as f:
         for l in f:
@@ -32,25 +20,86 @@ def get_phased_reads(phased_reads_fn, q_id_map_fn, vmap_fn, p_variant_fn, ctg_id
                 # Skip P lines and comments.
                 continue
             pb_id = int(l[1])
-            variant_to_phase[l[3]] = (pb_id, 0)
-            variant_to_phase[l[4]] = (pb_id, 1)
+            variant_to_phase[parse_variant(l[3])] = (pb_id, 0)
+            variant_to_phase[parse_variant(l[4])] = (pb_id, 1)
+    return variant_to_phase
+
+
+def get_variant_to_phase(phase_blocks, ref_base):
+    """Like load_variant_to_phase(), but from phasing_get_phased_blocks.get_phased_variants().
+    """
+    variant_to_phase = {}
+    for pb_id, pb in enumerate(phase_blocks, 1):
+        for p, b1, b2 in (v[:3] for v in pb):
+            variant_to_phase[(p, ref_base[p], b1)] = (pb_id, 0)
+            variant_to_phase[(p, ref_base[p], b2)] = (pb_id, 1)
+    return variant_to_phase
+
+
+def variant_codes(pos, ref_b, v_b):
+    """Integer code of each variant (pos, ref_b, v_b), with bases as ASCII codes.
+    Arrays or scalars.
+    """
+    return (np.asarray(pos, dtype=np.int64) * 256 + ref_b) * 256 + v_b
 
+
+def get_read_votes(vmap, variant_to_phase):
+    """Count the phased variants of each read, per phase block.
+    Return parallel arrays (q_id, pb_id, n0, n1), ordered by the first appearance
+    of each read in vmap, then by pb_id. n0 and n1 count the read's distinct variants
+    in phase 0 and phase 1 of that block.
+    """
+    variants = sorted(variant_to_phase.items())
+    n_phased = len(variants)
+    if not n_phased or not len(vmap.q_id):
+        return tuple(np.zeros(0, dtype=np.int64) for _ in range(4))
+    phased_codes = variant_codes([v[0] for v, _ in variants],
+                                 np.array([ord(v[1]) for v, _ in variants], dtype=np.int64),
+                                 np.array([ord(v[2]) for v, _ in variants], dtype=np.int64))
+    phased_pb = np.array([pb for _, (pb, _) in variants], dtype=np.int64)
+    phased_phase = np.array([phase for _, (_, phase) in variants], dtype=np.int64)
+
+    # Rank the reads by first appearance.
+    q_ids, first_rows, read = np.unique(vmap.q_id, return_index=True, return_inverse=True)
+    by_first = np.argsort(first_rows, kind='stable')
+    read_rank = np.empty(len(q_ids), dtype=np.int64)
+    read_rank[by_first] = np.arange(len(q_ids))
+    rank_q_ids = q_ids[by_first]
+
+    codes = variant_codes(vmap.pos, vmap.ref_base.astype(np.int64), vmap.allele.astype(np.int64))
+    found = np.searchsorted(phased_codes, codes).clip(0, n_phased - 1)
+    hit = np.flatnonzero(phased_codes[found] == codes)
+    # Each distinct (read, variant) votes once.
+    pairs = np.unique(read_rank[read[hit]] * n_phased + found[hit])
+    rank = pairs // n_phased
+    variant = pairs % n_phased
+
+    n_pb = phased_pb.max() + 1
+    read_pb, vote = np.unique(rank * n_pb + phased_pb[variant], return_inverse=True)
+    n1 = np.bincount(vote, weights=phased_phase[variant], minlength=len(read_pb)).astype(np.int64)
+    n0 = np.bincount(vote, minlength=len(read_pb)) - n1
+    return rank_q_ids[read_pb // n_pb], read_pb % n_pb, n0, n1
+
+
+def write_phased_reads(vmap, variant_to_phase, rid_map, ctg_id, out_f):
+    """vmap is a VariantMap, and variant_to_phase is {(pos, ref_b, v_b): (pb_id, phase)}.
+    rid_map[q_id] is the read name.
+    A read is phased in a block if it has more than 1 more variant in one phase than the other.
+    """
+    q_id, pb_id, n0, n1 = get_read_votes(vmap, variant_to_phase)
+    for r, p, v0, v1 in zip(q_id.tolist(), pb_id.tolist(), n0.tolist(), n1.tolist()):
+        if v0 - v1 > 1:
+            print(r, ctg_id, p, 0, v0, v1, rid_map[r], file=out_f)
+        elif v1 - v0 > 1:
+            print(r, ctg_id, p, 1, v0, v1, rid_map[r], file=out_f)
+
+
+def get_phased_reads(phased_reads_fn, q_id_map_fn, vmap_fn, p_variant_fn, ctg_id):
+    rid_map = load_q_id_map(q_id_map_fn)
+    vmap = variant_map.load(vmap_fn)
+    variant_to_phase = load_variant_to_phase(p_variant_fn)
     with open(phased_reads_fn, "w") as out_f:
-        for r in read_to_variants:
-            vl = {}
-            pl = set()
-            for v in list(read_to_variants[r]):
-                if v in variant_to_phase:
-                    p = variant_to_phase[v]
-                    vl[p] = vl.get(p, 0) + 1
-                    pl.add(p[0])
-            pl = list(pl)
-            pl.sort()
-            for p in pl:
-                if vl.get((p, 0), 0) - vl.get((p, 1), 0) > 1:
-                    print(r, ctg_id, p, 0, vl.get((p, 0), 0), vl.get((p, 1), 0), rid_map[r], file=out_f)
-                elif vl.get((p, 1), 0) - vl.get((p, 0), 0) > 1:
-                    print(r, ctg_id, p, 1, vl.get((p, 0), 0), vl.get((p, 1), 0), rid_map[r], file=out_f)
+        write_phased_reads(vmap, variant_to_phase, rid_map, ctg_id, out_f)
 
 
 ######
@@ -75,7 +124,7 @@ def parse_args(argv):
     )
     parser.add_argument(
         '--q-id-map-fn', required=True,
-        help='an input (actually a list of pairs)'
+        help='an input (a list of read names, indexed by q_id)'
     )
     parser.add_argument(
         '--phased-reads-fn', required=True,
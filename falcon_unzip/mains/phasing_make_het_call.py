@@ -1,17 +1,33 @@
 from falcon_kit.FastaReader import FastaReader
 from .. import io
+from .. import variant_map
+from ..proto import cigartools
+from multiprocessing import Pool
+import heapq
+import itertools
 import logging
+import numpy as np
 import re
-import shlex
-import subprocess
+import zlib
 
 LOG = logging.getLogger(__name__)
 
+# Columns of the pileup count arrays. Other bases (e.g. N) are not counted.
+BASES = 'ACGT'
+BASE_TO_CODE = np.full(256, len(BASES), dtype=np.uint8)
+for _i, _b in enumerate(BASES):
+    BASE_TO_CODE[ord(_b)] = _i
 
-def make_het_call(bam_fn, fasta_fn, vmap_fn, vpos_fn, q_id_map_fn, ctg_id):
-    """samtools must be in $PATH.
-    Writes into vmap_fn, vpos_fn, q_id_map_fn.
-    """
+# Ops counted toward the alignment span, i.e. those recognized by cigar_re.
+CIGAR_SPAN_OPS = frozenset(range(len(cigartools.CIGAR_OPS)))
+CIGAR_MATCH_OPS = (cigartools.CIGAR_OP_M, cigartools.CIGAR_OP_EQ, cigartools.CIGAR_OP_X)
+
+MIN_ALN_SPAN = 2000
+MIN_HET_DEPTH = 10
+HET_THRESHOLD = 0.25
+
+
+def get_ref_seq(fasta_fn, ctg_id):
     LOG.info('Getting ref_seq for {!r} in {!r}'.format(ctg_id, fasta_fn))
     for r in FastaReader(fasta_fn):
         rid = r.name.split()[0]
@@ -22,33 +38,71 @@ def make_het_call(bam_fn, fasta_fn, vmap_fn, vpos_fn, q_id_map_fn, ctg_id):
     else:
         ref_seq = ""
     LOG.info(' Length of ref_seq: {}'.format(len(ref_seq)))
+    return ref_seq
+
 
-    cmd = "samtools view %s %s" % (bam_fn, ctg_id)
-    LOG.info('Capture `{}`'.format(cmd))
-    p = subprocess.Popen(shlex.split(cmd), stdout=subprocess.PIPE, encoding='ascii')
+def het_call(ref_seq, bam_fn, ctg_id, vmap_w, vpos_f, n_proc=1, region_size=1000000, max_depth=0):
+    """Stream into vmap_w (a variant_map writer) and vpos_f, finish vmap_w,
+    and return (q_id_map, what vmap_w.finish() returns).
+    If max_depth > 0, subsample deeper regions (see DepthCap).
+    """
+    LOG.info('Pileup of {!r} from {!r}'.format(ctg_id, bam_fn))
+    depth_cap = DepthCap(max_depth)
+    if n_proc > 1:
+        q_id_map = make_het_call_map_from_regions(
+            ref_seq, bam_fn, ctg_id, vmap_w, vpos_f, n_proc, region_size, depth_cap)
+    else:
+        with io.AlignmentFile(bam_fn, 'rb') as bam_f:
+            q_id_map = make_het_call_map_from_bam(ref_seq, bam_f.fetch(ctg_id), vmap_w, vpos_f, depth_cap)
+    depth_cap.report(ctg_id)
+    vmap = vmap_w.finish()
+    return q_id_map, vmap
 
-    with open(vmap_fn, "w") as vmap_f, open(vpos_fn, "w") as vpos_f:
-        q_id_map = make_het_call_map(ref_seq, p.stdout, vmap_f, vpos_f)
-    q_id_list = list(sorted(q_id_map.items()))
 
+def write_q_id_map(q_id_map_fn, q_id_map):
+    """q_id_map is a list of read names, indexed by q_id.
+    """
     # By serializing, we have a built-in check for completeness.
-    io.serialize(q_id_map_fn, q_id_list)
-    io.serialize(q_id_map_fn + '.json', q_id_list)
+    io.serialize(q_id_map_fn, list(q_id_map))
+
+
+def load_q_id_map(q_id_map_fn):
+    """Return something indexable by q_id, giving the read name.
+    Older runs wrote a list of (q_id, name) pairs, with q_id = hash(name).
+    """
+    q_id_map = io.deserialize(q_id_map_fn)
+    if q_id_map and isinstance(q_id_map[0], (list, tuple)):
+        return dict(q_id_map)
+    return q_id_map
+
+
+def make_het_call(bam_fn, fasta_fn, vmap_fn, vpos_fn, q_id_map_fn, ctg_id, n_proc=1, region_size=1000000,
+                  vmap_format='binary', max_depth=0):
+    """bam_fn must be sorted and indexed.
+    Writes into vmap_fn, vpos_fn, q_id_map_fn.
+    If n_proc > 1, call regions of region_size in parallel. The output is the same.
+    vmap_format is 'binary' (see variant_map.py) or 'text'.
+    If max_depth > 0, subsample deeper regions (see DepthCap).
+    """
+    ref_seq = get_ref_seq(fasta_fn, ctg_id)
+    with variant_map.open_writer(vmap_fn, vmap_format) as vmap_w, open(vpos_fn, "w") as vpos_f:
+        q_id_map, _ = het_call(ref_seq, bam_fn, ctg_id, vmap_w, vpos_f, n_proc, region_size, max_depth)
+    write_q_id_map(q_id_map_fn, q_id_map)
 
 
 def make_het_call_map(ref_seq, samtools_view_bam_ctg_f, vmap_f, vpos_f):
     """Given lines of samtools-view and a reference sequence,
     stream into vmap and vpos, and return the q_id_map.
+    (This is the original SAM-text engine. make_het_call_map_from_bam()
+    produces identical output from pysam alignments.)
 
-    q_id_map is q_id -> QNAME
-    where q_id is hash(QNAME)
+    q_id_map is a list, q_id -> QNAME,
+    where q_id is the index of QNAME in order of first appearance
     and QNAME is the first field of each line from samtools-view (i.e. read names).
     """
-    q_id_map = {}
+    q_id_map = []
     q_name_to_id = {}  # reverse of q_id_map
     pileup = {}
-    q_max_id = 0
-    #q_id = 0
     cigar_re = re.compile(r"(\d+)([MIDNSHP=X])")
 
     print('#POS\tREFB\tB0|1\tqid', file=vmap_f)
@@ -61,13 +115,10 @@ def make_het_call_map(ref_seq, samtools_view_bam_ctg_f, vmap_f, vpos_f):
 
         QNAME = l[0]
         if QNAME not in q_name_to_id:
-            q_id = hash(QNAME)
-            q_name_to_id[QNAME] = q_id
-            assert q_id not in q_id_map, 'hash collision for QNAME={} -> {}'.format(QNAME, q_id)
-            #q_max_id += 1
+            q_name_to_id[QNAME] = len(q_id_map)
+            q_id_map.append(QNAME)
 
         q_id = q_name_to_id[QNAME]
-        q_id_map[q_id] = QNAME
         FLAG = int(l[1])
         RNAME = l[2]
         POS = int(l[3]) - 1  # convert to zero base
@@ -156,6 +207,404 @@ def make_het_call_map(ref_seq, samtools_view_bam_ctg_f, vmap_f, vpos_f):
     return q_id_map
 
 
+def get_aligned_bases(ref_start, cigartuples, seq):
+    """Return (ref_pos, base_code) arrays for the M/=/X columns of one alignment,
+    or None if the alignment is too short or too clipped to be used.
+    The rules (including not advancing on N/H/P) match make_het_call_map().
+    """
+    total_aln_pos = 0
+    skip_base = 0
+    for op, adv in cigartuples:
+        if op in CIGAR_SPAN_OPS:
+            total_aln_pos += adv
+        if op == cigartools.CIGAR_OP_S:
+            skip_base += adv
+    if total_aln_pos < MIN_ALN_SPAN:
+        return None
+    if 1.0 - 1.0 * skip_base / total_aln_pos < 0.1:
+        return None
+
+    ref_starts = []
+    query_starts = []
+    block_lens = []
+    rp = ref_start
+    qp = 0
+    for op, adv in cigartuples:
+        if op in (cigartools.CIGAR_OP_S, cigartools.CIGAR_OP_I):
+            qp += adv
+        elif op in CIGAR_MATCH_OPS:
+            ref_starts.append(rp)
+            query_starts.append(qp)
+            block_lens.append(adv)
+            rp += adv
+            qp += adv
+        elif op == cigartools.CIGAR_OP_D:
+            rp += adv
+    block_lens = np.array(block_lens, dtype=np.int64)
+    # Offset of each column within its match block, without a per-base loop.
+    within = np.arange(block_lens.sum()) - np.repeat(np.cumsum(block_lens) - block_lens, block_lens)
+    ref_pos = np.repeat(np.array(ref_starts, dtype=np.int64), block_lens) + within
+    query_pos = np.repeat(np.array(query_starts, dtype=np.int64), block_lens) + within
+    seq_codes = BASE_TO_CODE[np.frombuffer(seq.encode('ascii'), dtype=np.uint8)]
+    return ref_pos, seq_codes[query_pos]
+
+
+def read_priority(q_name):
+    """A number in [0, 1) from the read name, the same in every run and process.
+    """
+    return zlib.crc32(q_name.encode('utf-8')) / float(1 << 32)
+
+
+class DepthCap(object):
+    """
+    Deterministic subsampling of sorted alignments, to about max_depth.
+    Each alignment is decided on its own: where the depth D at its start
+    exceeds max_depth, it is kept only if read_priority(name) * D < max_depth.
+    So the same alignments are kept regardless of BAM order or of how the
+    contig is split into regions, but alignments of one read may differ:
+    one in a shallow region is always kept, while one in a deep region may be dropped.
+    D counts every alignment covering the start (kept or not), including
+    any which start at the same position.
+    max_depth <= 0 means no cap.
+
+    The counts cover the alignments starting in the filtered range.
+    """
+
+    def __init__(self, max_depth=0):
+        self.max_depth = max_depth
+        self.n_alignments = 0
+        self.n_dropped = 0
+        self.capped_bp = 0  # reference positions with D > max_depth
+
+    def merge(self, other):
+        self.n_alignments += other.n_alignments
+        self.n_dropped += other.n_dropped
+        self.capped_bp += other.capped_bp
+
+    def keep(self, q_name, depth):
+        return depth <= self.max_depth or read_priority(q_name) * depth < self.max_depth
+
+    def filter(self, alignments, start=0, end=None, depth_at=None):
+        """Yield (aln, keep) for sorted alignments.
+        Alignments which start before start must come with depth_at(pos),
+        the number of alignments covering pos. Positions are counted in [start, end).
+        """
+        if self.max_depth <= 0:
+            for aln in alignments:
+                yield aln, True
+            return
+        ends = []  # heap of the ends of the alignments covering the sweep
+        swept = [start]
+
+        def advance(to):
+            while ends and ends[0] <= to:
+                if ends[0] > swept[0]:
+                    if len(ends) > self.max_depth:
+                        self.capped_bp += ends[0] - swept[0]
+                    swept[0] = ends[0]
+                heapq.heappop(ends)
+            if to > swept[0]:
+                if len(ends) > self.max_depth:
+                    self.capped_bp += to - swept[0]
+                swept[0] = to
+
+        for aln_start, group in itertools.groupby(alignments, key=lambda aln: aln.reference_start):
+            group = list(group)
+            covering = [aln.reference_end for aln in group
+                        if aln.reference_end is not None and aln.reference_end > aln_start]
+            if aln_start < start:
+                depth = depth_at(aln_start)
+            else:
+                advance(aln_start)
+                depth = len(ends) + len(covering)
+            for end_ in covering:
+                heapq.heappush(ends, end_)
+            for aln in group:
+                if aln.reference_end is None or aln.reference_end <= aln_start:
+                    yield aln, True
+                    continue
+                keep = self.keep(aln.query_name, depth)
+                if aln_start >= start:
+                    self.n_alignments += 1
+                    self.n_dropped += not keep
+                yield aln, keep
+        advance(end if end is not None else max(ends) if ends else start)
+
+    def report(self, ctg_id):
+        if self.max_depth <= 0:
+            return
+        LOG.info('Depth cap {} on {!r}: dropped {} of {} alignments; {} bp had depth above the cap.'.format(
+            self.max_depth, ctg_id, self.n_dropped, self.n_alignments, self.capped_bp))
+
+
+class PileupWindow(object):
+    """
+    A/C/G/T counts for the reference positions not yet flushed, in a
+    preallocated NumPy array, plus the alignments which still cover them.
+    Positions are flushed (het-called and dropped) as sorted alignments move past.
+    """
+
+    def __init__(self, capacity=1 << 16):
+        self.counts = np.zeros((capacity, len(BASES)), dtype=np.int32)
+        self.base = 0  # ref position of counts[0]
+        self.lo = 0  # first row not yet flushed
+        self.hi = 0  # one past the last row with any counts
+        self.active = []  # (q_id, ref_pos, base_code) for each kept alignment
+
+    def add(self, q_id, ref_pos, base_code):
+        if len(ref_pos) == 0:
+            return
+        if self.lo == self.hi:
+            # Nothing pending, so simply re-anchor the window.
+            self.base = int(ref_pos[0]) - self.lo
+        self._reserve(int(ref_pos[-1]) + 1 - self.base)
+        counted = base_code < len(BASES)
+        rows = ref_pos[counted] - self.base
+        # Each position appears at most once per alignment, so no np.add.at().
+        self.counts[rows, base_code[counted]] += 1
+        self.hi = max(self.hi, int(ref_pos[-1]) + 1 - self.base)
+        self.active.append((q_id, ref_pos, base_code))
+
+    def _reserve(self, n_rows):
+        if n_rows <= len(self.counts):
+            return
+        n_live = self.hi - self.lo
+        capacity = len(self.counts)
+        while capacity < n_rows - self.lo:
+            capacity *= 2
+        counts = np.zeros((capacity, len(BASES)), dtype=np.int32)
+        counts[:n_live] = self.counts[self.lo:self.hi]
+        self.counts = counts
+        self.base += self.lo
+        self.hi -= self.lo
+        self.lo = 0
+
+    def flush(self, upto):
+        """Het-call and drop all positions < upto.
+        Return a list of (pos, [(count, base), ...] in descending order, q_ids_b0, q_ids_b1).
+        """
+        stop = min(upto - self.base, self.hi)
+        if stop <= self.lo:
+            return []
+        block = self.counts[self.lo:stop]
+        total = block.sum(axis=1)
+        # Descending by (count, base), exactly like sorting (count, base) tuples.
+        order = np.argsort(-(block * len(BASES) + np.arange(len(BASES))), axis=1)
+        ranked = np.take_along_axis(block, order, axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p0 = 1.0 * ranked[:, 0] / total
+            p1 = 1.0 * ranked[:, 1] / total
+        het_rows = np.flatnonzero((total >= MIN_HET_DEPTH) & (p0 < 1.0 - HET_THRESHOLD) & (p1 > HET_THRESHOLD))
+        het_pos = het_rows + (self.base + self.lo)
+        members = self._collect_members(het_pos)
+        calls = []
+        for i, row in enumerate(het_rows):
+            base_count = [(int(ranked[row, k]), BASES[order[row, k]]) for k in range(len(BASES))]
+            q_ids = members[i]
+            calls.append((int(het_pos[i]), base_count,
+                          q_ids.get(int(order[row, 0]), []), q_ids.get(int(order[row, 1]), [])))
+        self.lo = stop
+        self.active = [a for a in self.active if a[1][-1] >= upto]
+        return calls
+
+    def _collect_members(self, het_pos):
+        """For each het position, return {base_code: sorted q_ids}.
+        Read lists are built only here, for the positions which passed the test.
+        """
+        members = [dict() for _ in range(len(het_pos))]
+        if len(het_pos) == 0:
+            return members
+        het_idx = []
+        codes = []
+        q_ids = []
+        for q_id, ref_pos, base_code in self.active:
+            if ref_pos[0] > het_pos[-1] or ref_pos[-1] < het_pos[0]:
+                continue
+            idx = np.searchsorted(ref_pos, het_pos)
+            np.minimum(idx, len(ref_pos) - 1, out=idx)
+            hit = np.flatnonzero(ref_pos[idx] == het_pos)
+            het_idx.append(hit)
+            codes.append(base_code[idx[hit]])
+            q_ids.append(np.full(len(hit), q_id, dtype=np.int64))
+        if not het_idx:
+            return members
+        het_idx = np.concatenate(het_idx)
+        codes = np.concatenate(codes)
+        q_ids = np.concatenate(q_ids)
+        perm = np.lexsort((q_ids, codes, het_idx))
+        for i, code, q_id in zip(het_idx[perm].tolist(), codes[perm].tolist(), q_ids[perm].tolist()):
+            members[i].setdefault(code, []).append(q_id)
+        return members
+
+
+def write_het_calls(ref_seq, calls, vmap_w, vpos_f):
+    """vmap_w is a variant_map writer."""
+    for pos, base_count, q_ids_b0, q_ids_b1 in calls:
+        b0 = base_count[0][1]
+        b1 = base_count[1][1]
+        total_count = sum(x[0] for x in base_count)
+        ref_base = ref_seq[pos]
+        print('{}\t{}\t{}\t{}'.format(
+            pos + 1, ref_base, total_count,
+            " ".join(["%s %d" % (x[1], x[0]) for x in base_count])), file=vpos_f)
+        vmap_w.add(pos + 1, ref_base, b0, q_ids_b0)
+        vmap_w.add(pos + 1, ref_base, b1, q_ids_b1)
+
+
+def make_het_call_map_from_bam(ref_seq, alignments, vmap_w, vpos_f, depth_cap=None):
+    """Like make_het_call_map(), but from sorted pysam alignments (e.g. AlignmentFile.fetch()),
+    with per-position counts accumulated in a PileupWindow.
+    vmap_w is a variant_map writer (TextWriter or BinaryWriter), which the caller must finish.
+    With a TextWriter and no depth_cap (a DepthCap), the vmap/vpos output and the returned q_id_map are identical.
+    """
+    q_id_map = []
+    q_name_to_id = {}  # reverse of q_id_map
+    window = PileupWindow()
+    if depth_cap is None:
+        depth_cap = DepthCap()
+
+    print('#POS\tREFB\ttotal\t(B N)*', file=vpos_f)
+
+    for aln, keep in depth_cap.filter(alignments):
+        QNAME = aln.query_name
+        if QNAME not in q_name_to_id:
+            q_name_to_id[QNAME] = len(q_id_map)
+            q_id_map.append(QNAME)
+
+        q_id = q_name_to_id[QNAME]
+        if not keep:
+            continue
+        SEQ = aln.query_sequence
+        if not SEQ:
+            continue
+        aligned = get_aligned_bases(aln.reference_start, aln.cigartuples or (), SEQ)
+        if aligned is None:
+            continue
+        window.add(q_id, *aligned)
+        # As in make_het_call_map(), positions at or past the start of
+        # the last used alignment are never flushed.
+        write_het_calls(ref_seq, window.flush(aln.reference_start), vmap_w, vpos_f)
+    # We do not serialize variant_pos because it is streamed.
+    # But we can add an end-of-file marker. (The vmap writer adds its own, on finish().)
+    print('#EOF', file=vpos_f)
+
+    return q_id_map
+
+
+def depths_at_starts(alignments):
+    """Return {pos: depth} for the start of each of sorted alignments,
+    with depth the number of them covering pos, as DepthCap counts D.
+    """
+    ends = []  # heap of the ends of the alignments covering pos
+    depths = {}
+    for aln in alignments:
+        pos = aln.reference_start
+        while ends and ends[0] <= pos:
+            heapq.heappop(ends)
+        if aln.reference_end is not None and aln.reference_end > pos:
+            heapq.heappush(ends, aln.reference_end)
+        depths[pos] = len(ends)
+    return depths
+
+
+def call_region(input_):
+    """Het-call the positions in [start, end) of one contig.
+    The index fetch brings in every alignment overlapping the region, including
+    those which start up to a read-length before it, so counts are complete.
+    Read ids are local to this region: indices into the returned q_names.
+    Also return the start of the last used alignment which starts in the region,
+    and the DepthCap with the counts for the region.
+    """
+    bam_fn, ctg_id, start, end, max_depth = input_
+    q_names = []
+    q_name_to_local = {}
+    window = PileupWindow()
+    depth_cap = DepthCap(max_depth)
+    calls = []
+    last_start = -1
+    with io.AlignmentFile(bam_fn, 'rb') as bam_f:
+        # The depths at the starts of the alignments which cover start but start before it,
+        # from one sweep over all those from the first of them to start.
+        depths = {}
+        if max_depth > 0 and start > 0:
+            first = min([aln.reference_start for aln in bam_f.fetch(ctg_id, start, start + 1)] or [start])
+            if first < start:
+                depths = depths_at_starts(bam_f.fetch(ctg_id, first, start))
+
+        def depth_at(pos):
+            return depths.get(pos, 0)
+
+        alignments = depth_cap.filter(bam_f.fetch(ctg_id, start, end), start, end, depth_at)
+        for aln, keep in alignments:
+            QNAME = aln.query_name
+            if QNAME not in q_name_to_local:
+                q_name_to_local[QNAME] = len(q_names)
+                q_names.append(QNAME)
+            if not keep:
+                continue
+            SEQ = aln.query_sequence
+            if not SEQ:
+                continue
+            aligned = get_aligned_bases(aln.reference_start, aln.cigartuples or (), SEQ)
+            if aligned is None:
+                continue
+            ref_pos, base_code = aligned
+            if aln.reference_start >= start:
+                last_start = aln.reference_start
+            else:
+                # Positions before the region belong to the previous one.
+                in_region = ref_pos >= start
+                ref_pos, base_code = ref_pos[in_region], base_code[in_region]
+            window.add(q_name_to_local[QNAME], ref_pos, base_code)
+            calls.extend(window.flush(aln.reference_start))
+    calls.extend(window.flush(end))
+    return calls, q_names, last_start, depth_cap
+
+
+def make_het_call_map_from_regions(ref_seq, bam_fn, ctg_id, vmap_w, vpos_f, n_proc, region_size, depth_cap=None):
+    """Like make_het_call_map_from_bam(), but split the contig into regions,
+    het-called in a Pool and merged in region order.
+    The workers return their read names in order of appearance, so assigning the
+    new names of each region in turn gives the same q_ids as the serial engines.
+    """
+    with io.AlignmentFile(bam_fn, 'rb') as bam_f:
+        ctg_len = bam_f.get_reference_length(ctg_id)
+    if depth_cap is None:
+        depth_cap = DepthCap()
+    inputs = [(bam_fn, ctg_id, start, min(start + region_size, ctg_len), depth_cap.max_depth)
+              for start in range(0, ctg_len, region_size)]
+    LOG.info('Het-calling {} regions of {!r} with {} processes.'.format(len(inputs), ctg_id, n_proc))
+
+    q_id_map = []
+    q_name_to_id = {}  # reverse of q_id_map
+    all_calls = []
+    last_start = -1
+    exe_pool = Pool(n_proc)
+    try:
+        for calls, q_names, region_last_start, region_depth_cap in exe_pool.imap(call_region, inputs):
+            depth_cap.merge(region_depth_cap)
+            for QNAME in q_names:
+                if QNAME not in q_name_to_id:
+                    q_name_to_id[QNAME] = len(q_id_map)
+                    q_id_map.append(QNAME)
+            to_q_id = [q_name_to_id[QNAME] for QNAME in q_names]
+            for pos, base_count, q_ids_b0, q_ids_b1 in calls:
+                all_calls.append((pos, base_count,
+                                  sorted(to_q_id[i] for i in q_ids_b0),
+                                  sorted(to_q_id[i] for i in q_ids_b1)))
+            last_start = max(last_start, region_last_start)
+    finally:
+        exe_pool.close()
+        exe_pool.join()
+
+    print('#POS\tREFB\ttotal\t(B N)*', file=vpos_f)
+    # As in the serial engines, nothing at or past the start of the last used alignment.
+    write_het_calls(ref_seq, (c for c in all_calls if c[0] < last_start), vmap_w, vpos_f)
+    print('#EOF', file=vpos_f)
+
+    return q_id_map
+
+
 ######
 import argparse
 import sys
@@ -186,6 +635,22 @@ def parse_args(argv):
         '--q-id-map-fn', required=True,
         help='an output'
     )
+    parser.add_argument(
+        '--n-proc', type=int, default=1,
+        help='If >1, het-call regions of the contig in parallel, with this many processes'
+    )
+    parser.add_argument(
+        '--region-size', type=int, default=1000000,
+        help='Size of each region, for --n-proc>1'
+    )
+    parser.add_argument(
+        '--max-depth', type=int, default=0,
+        help='Subsample the alignments (by read name) where the depth exceeds this, e.g. in collapsed repeats. 0 means no cap.'
+    )
+    parser.add_argument(
+        '--vmap-format', choices=['binary', 'text'], default='binary',
+        help='Format of the vmap output. "python3 -m falcon_unzip.mains.phasing_export_vmap" converts binary to text.'
+    )
     args = parser.parse_args(argv[1:])
     return args
 
@@ -0,0 +1,131 @@
+"""Phase the reads of one contig, in one process.
+
+This runs phasing_make_het_call, phasing_generate_association_table,
+phasing_get_phased_blocks, and phasing_get_phased_reads, passing the
+variant map, association table, and phase blocks in memory.
+The intermediate files are written only if requested, for debugging.
+"""
+from .. import variant_map
+from . import (
+    phasing_make_het_call,
+    phasing_generate_association_table,
+    phasing_get_phased_blocks,
+    phasing_get_phased_reads,
+)
+import contextlib
+import logging
+import os
+
+LOG = logging.getLogger(__name__)
+
+
+def phasing_run(ctg_id, bam_fn, fasta_fn, p_variant_fn, phased_reads_fn,
+                n_proc=1, region_size=1000000, max_depth=0,
+                chunk_size=phasing_generate_association_table.CHUNK_SIZE,
+                vmap_fn=None, vpos_fn=None, q_id_map_fn=None, atable_fn=None):
+    """bam_fn must be sorted and indexed.
+    Writes p_variant_fn and phased_reads_fn, plus any of the optional intermediate files.
+    """
+    ref_seq = phasing_make_het_call.get_ref_seq(fasta_fn, ctg_id)
+    vmap_w = variant_map.BinaryWriter(vmap_fn) if vmap_fn else variant_map.ArrayWriter()
+    with open(vpos_fn if vpos_fn else os.devnull, 'w') as vpos_f:
+        q_id_map, vmap = phasing_make_het_call.het_call(
+            ref_seq, bam_fn, ctg_id, vmap_w, vpos_f, n_proc, region_size, max_depth)
+    if q_id_map_fn:
+        phasing_make_het_call.write_q_id_map(q_id_map_fn, q_id_map)
+    LOG.info('{} het-call rows for {!r}'.format(len(vmap.pos), ctg_id))
+
+    with contextlib.ExitStack() as stack:
+        rows = phasing_generate_association_table.get_association_rows(vmap, chunk_size)
+        if atable_fn:
+            rows = tee_rows(rows, stack.enter_context(open(atable_fn, 'w')))
+        phase_blocks = phasing_get_phased_blocks.get_phased_variants(rows)
+    LOG.info('{} phase blocks for {!r}'.format(len(phase_blocks), ctg_id))
+
+    ref_base = phasing_get_phased_blocks.get_ref_bases(vmap)
+    with open(p_variant_fn, 'w') as out_f:
+        phasing_get_phased_blocks.write_phased_variants(phase_blocks, ref_base, out_f)
+
+    variant_to_phase = phasing_get_phased_reads.get_variant_to_phase(phase_blocks, ref_base)
+    with open(phased_reads_fn, 'w') as out_f:
+        phasing_get_phased_reads.write_phased_reads(vmap, variant_to_phase, q_id_map, ctg_id, out_f)
+
+
+def tee_rows(rows, out_f):
+    for row in rows:
+        print(*row, file=out_f)
+        yield row
+
+
+######
+import argparse
+import sys
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(
+        description='Phase the reads of a contig: het calls, association table, phased blocks, and phased reads.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        '--ctg-id', required=True,
+    )
+    parser.add_argument(
+        '--bam-fn', required=True,
+        help='an input, sorted and indexed'
+    )
+    parser.add_argument(
+        '--fasta-fn', required=True,
+        help='an input'
+    )
+    parser.add_argument(
+        '--p-variant-fn', required=True,
+        help='an output, the phased variants'
+    )
+    parser.add_argument(
+        '--phased-reads-fn', required=True,
+        help='an output'
+    )
+    parser.add_argument(
+        '--n-proc', type=int, default=1,
+        help='If >1, het-call regions of the contig in parallel, with this many processes'
+    )
+    parser.add_argument(
+        '--region-size', type=int, default=1000000,
+        help='Size of each region, for --n-proc>1'
+    )
+    parser.add_argument(
+        '--max-depth', type=int, default=0,
+        help='Subsample the alignments (by read name) where the depth exceeds this, e.g. in collapsed repeats. 0 means no cap.'
+    )
+    parser.add_argument(
+        '--chunk-size', type=int, default=phasing_generate_association_table.CHUNK_SIZE,
+        help='Link the variants in chunks of this many bp, to bound memory on long contigs. 0 means the whole contig at once.'
+    )
+    parser.add_argument(
+        '--vmap-fn',
+        help='an optional output, for debugging (binary; see phasing_export_vmap)'
+    )
+    parser.add_argument(
+        '--vpos-fn',
+        help='an optional output, for debugging'
+    )
+    parser.add_argument(
+        '--q-id-map-fn',
+        help='an optional output, for debugging'
+    )
+    parser.add_argument(
+        '--atable-fn',
+        help='an optional output, for debugging'
+    )
+    args = parser.parse_args(argv[1:])
+    return args
+
+
+def main(argv=sys.argv):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    phasing_run(**vars(args))
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
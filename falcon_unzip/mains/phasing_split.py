@@ -14,7 +14,8 @@ def read_ctg_ids(stream):
     for line in stream:
         yield line.strip()
 
-def run(base_dir, ctg_list_fn, rawread_ids_fn, pread_ids_fn, pread_to_contigs_fn, split_fn, bash_template_fn):
+def run(base_dir, ctg_list_fn, rawread_ids_fn, pread_ids_fn, pread_to_contigs_fn, split_fn, bash_template_fn,
+        max_depth=0):
     LOG.info('Splitting ctg_ids from {!r} into {!r}.'.format(
         ctg_list_fn, split_fn))
     with open(bash_template_fn, 'w') as stream:
@@ -41,6 +42,7 @@ def run(base_dir, ctg_list_fn, rawread_ids_fn, pread_ids_fn, pread_to_contigs_fn
         job['params'] = dict(
                 ctg_id=ctg_id,
                 base_dir=base_dir,
+                max_depth=max_depth,
         )
         job['wildcards'] = dict(
                 ctg_id=ctg_id, # This should match the wildcard used in the pattern elsewhere.
@@ -80,6 +82,9 @@ def parse_args(argv):
     parser.add_argument(
         '--base-dir', required=True,
         help='Path to run-dir. (Parent of 3-unzip/) We need this because we have under-specified some inputs.')
+    parser.add_argument(
+        '--max-depth', type=int, default=0,
+        help='Propagated to phasing-run-script: subsample collapsed repeats to about this depth; 0 for no cap.')
     parser.add_argument(
         '--split-fn',
         help='Output. JSON list of units of work.')
@@ -6,8 +6,10 @@ import sys
 import glob
 import os
 from heapq import heappush, heappop, heappushpop
+from .. import overlaps
 
 Reader = io.CapturedProcessReaderContext
+LAS_READER = 'la4falcon'
 
 
 def get_rid_to_ctg(fn):
@@ -22,29 +24,30 @@ def get_rid_to_ctg(fn):
 
 
 def run_tr_stage1(db_fn, fn, min_len, bestn, rid_to_ctg):
-    cmd = "LA4Falcon -m %s %s" % (db_fn, fn)
-    reader = Reader(cmd)
-    with reader:
-        return fn, tr_stage1(reader.readlines, min_len, bestn, rid_to_ctg)
+    if LAS_READER == 'la4falcon':
+        cmd = "LA4Falcon -m %s %s" % (db_fn, fn)
+        reader = Reader(cmd)
+        with reader:
+            ovls = overlaps.parse_m4(reader.readlines())
+    else:
+        ovls = overlaps.decode_las(db_fn, fn, proper_only=False, reader=LAS_READER)
+    return fn, tr_stage1(ovls, min_len, bestn, rid_to_ctg)
 
 
-def tr_stage1(readlines, min_len, bestn, rid_to_ctg):
+def tr_stage1(ovls, min_len, bestn, rid_to_ctg):
     """
     for each read in the b-read column inside the LAS files, we
     keep top `bestn` hits with a priority queue through all overlaps
     """
     rtn = {}
-    for l in readlines():
-        l = l.strip().split()
-        q_id, t_id = l[:2]
-        overlap_len = -int(l[2])
-        idt = float(l[3])
-        q_s, q_e, q_l = int(l[5]), int(l[6]), int(l[7])
-        t_s, t_e, t_l = int(l[9]), int(l[10]), int(l[11])
+    for q, t, score, t_l in zip(*overlaps.columns(ovls, 'q_id', 't_id', 'score', 't_l')):
         if t_l < min_len:
             continue
+        q_id = '%09d' % q
         if q_id not in rid_to_ctg:
             continue
+        t_id = '%09d' % t
+        overlap_len = -score
         rtn.setdefault(t_id, [])
         if len(rtn[t_id]) < bestn:
             heappush(rtn[t_id], (overlap_len, q_id))
@@ -140,7 +143,7 @@ def try_run_track_reads(
 
 
 def track_reads(
-        n_core, min_len, bestn, debug, silent, stream,
+        n_core, min_len, bestn, debug, silent, stream, las_reader,
         base_dir, db_fn, las_fofn_fn,
         output_fn,
 ):
@@ -152,6 +155,8 @@ def track_reads(
     if stream:
         global Reader
         Reader = io.StreamedProcessReaderContext
+    global LAS_READER
+    LAS_READER = las_reader
 
     try_run_track_reads(n_core, min_len, bestn, db_fn, las_fofn_fn, output_fn)
 
@@ -181,9 +186,13 @@ to the contigs with file generated by `fc_get_read_ctg_map` in `./get_read_ctg_m
     parser.add_argument(
         '--min-len', type=int, default=2500,
         help="min length of the reads")
+    parser.add_argument(
+        '--las-reader', choices=overlaps.READERS, default='la4falcon',
+        help="read the .las files directly, or through LA4Falcon, or both, to check that they agree")
     parser.add_argument(
         '--stream', action='store_true',
-        help='stream from LA4Falcon, instead of slurping all at once; can save memory for large data')
+        help='stream from LA4Falcon, instead of slurping all at once; can save memory for large data'
+        ' (only with --las-reader=la4falcon)')
     parser.add_argument(
         '--debug', '-g', action='store_true',
         help="single-threaded, plus other aids to debugging")
@@ -8,8 +8,10 @@ import glob
 import msgpack  # for serdes
 import os
 from heapq import heappush, heappop, heappushpop
+from .. import overlaps
 
 Reader = io.CapturedProcessReaderContext
+LAS_READER = 'la4falcon'
 
 # GLOBALS rid_to_ctg, rid_to_phase
 
@@ -34,38 +36,39 @@ def get_rid_to_ctg(fn):
 
 
 def run_tr_stage1(db_fn, fn, min_len, bestn):
-    cmd = 'LA4Falcon -m %s %s' % (db_fn, fn)
-    reader = Reader(cmd)
-    with reader:
-        rtn = tr_stage1(reader.readlines, min_len, bestn)
+    if LAS_READER == 'la4falcon':
+        cmd = 'LA4Falcon -m %s %s' % (db_fn, fn)
+        reader = Reader(cmd)
+        with reader:
+            ovls = overlaps.parse_m4(reader.readlines())
+    else:
+        ovls = overlaps.decode_las(db_fn, fn, proper_only=False, reader=LAS_READER)
+    rtn = tr_stage1(ovls, min_len, bestn)
     fn_rtn = '{}.rr_hctg_track.partial.msgpack'.format(os.path.basename(fn))
     serialize(fn_rtn, rtn)
     return fn_rtn
 
 
-def tr_stage1(readlines, min_len, bestn):
+def tr_stage1(ovls, min_len, bestn):
     """
     for each read in the b-read column inside the LAS files, we
     keep top `bestn` hits with a priority queue through all overlaps
     """
     rtn = {}
-    for l in readlines():
-        l = l.strip().split()
-        q_id, t_id = l[:2]
-        overlap_len = -int(l[2])
-        idt = float(l[3])
-        q_s, q_e, q_l = int(l[5]), int(l[6]), int(l[7])
-        t_s, t_e, t_l = int(l[9]), int(l[10]), int(l[11])
+    for q, t, score, t_l in zip(*overlaps.columns(ovls, 'q_id', 't_id', 'score', 't_l')):
         if t_l < min_len:
             continue
+        q_id = '%09d' % q
         if q_id not in rid_to_ctg:
             continue
+        t_id = '%09d' % t
+        overlap_len = -score
 
-        t_phase = rid_to_phase[int(t_id)]
+        t_phase = rid_to_phase[t]
         if t_phase != None:
             ctg_id, block, phase = t_phase
             if block != -1:
-                q_phase = rid_to_phase[int(q_id)]
+                q_phase = rid_to_phase[q]
                 if q_phase != None:
                     if q_phase[0] == ctg_id and q_phase[1] == block and q_phase[2] != phase:
                         continue
@@ -282,9 +285,13 @@ but that is now handled in `rr_hctg_track.nim`.)
         help='Output of stage1, consumed by stage2. This is a list of the (msgpack) partials.')
     parser.add_argument(
         '--min-len', type=int, default=2500, help='min length of the reads')
+    parser.add_argument(
+        '--las-reader', choices=overlaps.READERS, default='la4falcon',
+        help='read the .las files directly, or through LA4Falcon, or both, to check that they agree')
     parser.add_argument(
         '--stream', action='store_true',
-        help='stream from LA4Falcon, instead of slurping all at once; can save memory for large data')
+        help='stream from LA4Falcon, instead of slurping all at once; can save memory for large data'
+        ' (only with --las-reader=la4falcon)')
     parser.add_argument(
         '--debug', '-g', action='store_true', help='single-threaded, plus other aids to debugging')
     parser.add_argument(
@@ -301,7 +308,7 @@ but that is now handled in `rr_hctg_track.nim`.)
     return args
 
 
-def setup(debug, silent, stream, **kwds):
+def setup(debug, silent, stream, las_reader, **kwds):
     if debug:
         silent = False
     if silent:
@@ -309,6 +316,8 @@ def setup(debug, silent, stream, **kwds):
     if stream:
         global Reader
         Reader = io.StreamedProcessReaderContext
+    global LAS_READER
+    LAS_READER = las_reader
 
 
 def main(argv=sys.argv):
@@ -0,0 +1,248 @@
+"""
+Overlaps of reads, as decoded from DALIGNER LAS files.
+
+Each row is one overlap, in the columns of the M4 text format of 'LA4Falcon -m':
+    q_id t_id score idt q_strand q_s q_e q_l t_strand t_s t_e t_l type
+with score = -(overlap length) and type in OVERLAP_TYPES.
+Read ids are the integer DAZZ_DB ids, which LA4Falcon prints as '%09d'.
+
+There are two readers:
+    'direct' reads the LAS file (and the read lengths from the DAZZ_DB index) itself;
+    'la4falcon' runs LA4Falcon and parses its text.
+They should give the same rows. 'check' runs both, and raises if they differ.
+'la4falcon' is the default, until the direct reader has been checked against
+a real DALIGNER fixture; so far it is tested only on LAS files we write ourselves.
+
+We can also cache the rows as a .npy file (numpy's own format), so later passes
+can memory-map them instead of decoding the LAS file again.
+The cache is written under a temporary name and renamed, so a cache file
+that exists is complete.
+"""
+import mmap
+import os
+import shlex
+import struct
+import subprocess
+
+import numpy as np
+
+READERS = ('direct', 'la4falcon', 'check')
+
+OVERLAP_TYPES = ('overlap', 'contains', 'contained', 'none')
+OVERLAP_TYPE_CODE = {name: code for code, name in enumerate(OVERLAP_TYPES)}
+
+OVERLAP_DTYPE = np.dtype([
+    ('q_id', '<i4'),
+    ('t_id', '<i4'),
+    ('score', '<i4'),
+    ('idt', '<f4'),
+    ('q_s', '<i4'),
+    ('q_e', '<i4'),
+    ('q_l', '<i4'),
+    ('t_s', '<i4'),
+    ('t_e', '<i4'),
+    ('t_l', '<i4'),
+    ('q_strand', 'u1'),
+    ('t_strand', 'u1'),
+    ('type', 'u1'),
+])
+
+
+def parse_m4(lines):
+    """Return an OVERLAP_DTYPE array for lines of 'LA4Falcon -mo' output.
+    """
+    rows = []
+    for l in lines:
+        l = l.split()
+        if not l:
+            continue
+        code = OVERLAP_TYPE_CODE.get(l[12])
+        if code is None:
+            raise Exception('Unknown overlap type {!r} in {!r}'.format(l[12], ' '.join(l)))
+        rows.append((int(l[0]), int(l[1]), int(l[2]), float(l[3]),
+                     int(l[5]), int(l[6]), int(l[7]), int(l[9]), int(l[10]), int(l[11]),
+                     int(l[4]), int(l[8]), code))
+    return np.array(rows, dtype=OVERLAP_DTYPE)
+
+
+def format_m4(ovl):
+    """Return the 'LA4Falcon -mo' fields of one overlap (an element of an OVERLAP_DTYPE array),
+    as a list of str.
+    """
+    return ['%09d' % ovl['q_id'], '%09d' % ovl['t_id'], str(ovl['score']), '%.2f' % ovl['idt'],
+            str(ovl['q_strand']), str(ovl['q_s']), str(ovl['q_e']), str(ovl['q_l']),
+            str(ovl['t_strand']), str(ovl['t_s']), str(ovl['t_e']), str(ovl['t_l']),
+            OVERLAP_TYPES[ovl['type']]]
+
+
+def decode_las(db_fn, las_fn, proper_only=True, reader='la4falcon'):
+    """Return the overlaps of las_fn as an OVERLAP_DTYPE array, in file order.
+    If proper_only, skip the local alignments, as 'LA4Falcon -mo' does.
+    """
+    if reader == 'direct':
+        return read_las(db_fn, las_fn, proper_only)
+    elif reader == 'la4falcon':
+        return run_la4falcon(db_fn, las_fn, proper_only)
+    elif reader == 'check':
+        ovls = read_las(db_fn, las_fn, proper_only)
+        expected = run_la4falcon(db_fn, las_fn, proper_only)
+        if ovls.tolist() != expected.tolist():
+            raise Exception('Reading {!r} directly does not match LA4Falcon ({} vs {} overlaps)'.format(
+                las_fn, len(ovls), len(expected)))
+        return ovls
+    else:
+        raise Exception('Unknown LAS reader {!r}'.format(reader))
+
+
+def run_la4falcon(db_fn, las_fn, proper_only=True):
+    cmd = 'LA4Falcon {} {} {}'.format('-mo' if proper_only else '-m', db_fn, las_fn)
+    return parse_m4(subprocess.check_output(shlex.split(cmd), encoding='ascii').splitlines())
+
+
+# The DAZZ_DB index, '.<root>.idx' next to '<root>.db', is a DAZZ_DB struct
+# followed by a DAZZ_READ struct for each read of the untrimmed DB.
+DB_HEADER = struct.Struct('<iiii16x4x4xq')  # ureads, treads, cutoff, allarr, ..., totlen
+DB_HEADER_SIZE = 112
+DB_READ_DTYPE = np.dtype({
+    'names': ['origin', 'rlen', 'fpulse', 'boff', 'coff', 'flags'],
+    'formats': ['<i4', '<i4', '<i4', '<i8', '<i8', '<i4'],
+    'offsets': [0, 4, 8, 16, 24, 32],
+    'itemsize': 40,
+})
+DB_ALL = 0x1
+DB_BEST = 0x800
+
+# A LAS file is a header (number of overlaps, trace spacing), then
+# each overlap as the Overlap struct without its trace pointer, followed by its trace.
+LAS_HEADER = struct.Struct('<qi')
+LAS_OVL_DTYPE = np.dtype({
+    'names': ['tlen', 'diffs', 'abpos', 'bbpos', 'aepos', 'bepos', 'flags', 'aread', 'bread'],
+    'formats': ['<i4', '<i4', '<i4', '<i4', '<i4', '<i4', '<u4', '<i4', '<i4'],
+    'offsets': [0, 4, 8, 12, 16, 20, 24, 28, 32],
+    'itemsize': 40,
+})
+LAS_TLEN = struct.Struct('<i')
+TRACE_XOVR = 125  # Trace values are uint8 up to this spacing, else uint16.
+COMP_FLAG = 0x1
+
+
+def get_db_idx_fn(db_fn):
+    dn, bn = os.path.split(db_fn)
+    root = bn[:-3] if bn.endswith('.db') else bn
+    return os.path.join(dn, '.{}.idx'.format(root))
+
+
+def read_db_lengths(db_fn):
+    """Return the read lengths of the DAZZ_DB db_fn, indexed by read id,
+    i.e. after trimming by DBsplit's cutoff and -a, as LA4Falcon sees them.
+    """
+    idx_fn = get_db_idx_fn(db_fn)
+    with open(idx_fn, 'rb') as stream:
+        buf = stream.read()
+    ureads, treads, cutoff, allarr, totlen = DB_HEADER.unpack_from(buf)
+    if len(buf) != DB_HEADER_SIZE + ureads * DB_READ_DTYPE.itemsize:
+        raise Exception('Unexpected size of DAZZ_DB index {!r} for {} reads'.format(
+            os.path.abspath(idx_fn), ureads))
+    reads = np.frombuffer(buf, dtype=DB_READ_DTYPE, count=ureads, offset=DB_HEADER_SIZE)
+    if cutoff <= 0 and allarr & DB_ALL:
+        return reads['rlen'].copy()
+    kept = reads['rlen'] >= max(cutoff, 0)
+    if not allarr & DB_ALL:
+        kept &= (reads['flags'] & DB_BEST) != 0
+    return reads['rlen'][kept]
+
+
+def read_las_records(las_fn):
+    """Return the overlap records of las_fn, as a LAS_OVL_DTYPE array, without their traces.
+    """
+    size = os.path.getsize(las_fn)
+    if size < LAS_HEADER.size:
+        raise Exception('No LAS header in {!r}'.format(os.path.abspath(las_fn)))
+    if size == LAS_HEADER.size:
+        return np.zeros(0, dtype=LAS_OVL_DTYPE)
+    with open(las_fn, 'rb') as stream:
+        buf = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    novl, tspace = LAS_HEADER.unpack_from(buf)
+    tbytes = 1 if tspace <= TRACE_XOVR else 2
+    # Records vary in length, so find each one's offset first.
+    offsets = np.empty(novl, dtype=np.int64)
+    offset = LAS_HEADER.size
+    rsize = LAS_OVL_DTYPE.itemsize
+    unpack_tlen = LAS_TLEN.unpack_from
+    for i in range(novl):
+        offsets[i] = offset
+        offset += rsize + unpack_tlen(buf, offset)[0] * tbytes
+    if offset != size:
+        raise Exception('Expected {} overlaps in {!r} of {} bytes, but they end at byte {}'.format(
+            novl, os.path.abspath(las_fn), size, offset))
+    raw = np.frombuffer(buf, dtype=np.uint8)
+    return raw[offsets[:, None] + np.arange(rsize)].view(LAS_OVL_DTYPE).reshape(-1)
+
+
+def format_idt(acc):
+    """Return acc as rounded by '%.2f', as a float32 array.
+    """
+    x = acc * 100
+    rounded = np.round(x)
+    # np.round() rounds half to even on the scaled value, which can differ from
+    # printf on the exact value when we are this close to a tie.
+    tie = np.flatnonzero(np.abs(np.abs(x - np.floor(x)) - 0.5) < 1e-6)
+    rounded[tie] = [round(float('%.2f' % a) * 100) for a in acc[tie].tolist()]
+    return (rounded / 100).astype('<f4')
+
+
+def read_las(db_fn, las_fn, proper_only=True):
+    """Return the overlaps of las_fn as an OVERLAP_DTYPE array,
+    with the fields 'LA4Falcon -m' (or -mo, if proper_only) would print.
+    """
+    rlen = read_db_lengths(db_fn)
+    recs = read_las_records(las_fn)
+    alen = rlen[recs['aread']]
+    blen = rlen[recs['bread']]
+    abpos, aepos = recs['abpos'], recs['aepos']
+    bbpos, bepos = recs['bbpos'], recs['bepos']
+    if proper_only:
+        proper = ((abpos == 0) | (bbpos == 0)) & ((aepos == alen) | (bepos == blen))
+        recs, alen, blen = recs[proper], alen[proper], blen[proper]
+        abpos, aepos, bbpos, bepos = abpos[proper], aepos[proper], bbpos[proper], bepos[proper]
+    comp = (recs['flags'] & COMP_FLAG) != 0
+    acc = 100 - (200.0 * recs['diffs']) / ((aepos - abpos) + (bepos - bbpos))
+
+    ovls = np.zeros(len(recs), dtype=OVERLAP_DTYPE)
+    ovls['q_id'] = recs['aread']
+    ovls['t_id'] = recs['bread']
+    ovls['score'] = bbpos - bepos
+    ovls['idt'] = format_idt(acc)
+    ovls['q_s'] = abpos
+    ovls['q_e'] = aepos
+    ovls['q_l'] = alen
+    ovls['t_s'] = np.where(comp, blen - bepos, bbpos)
+    ovls['t_e'] = np.where(comp, blen - bbpos, bepos)
+    ovls['t_l'] = blen
+    ovls['t_strand'] = comp
+    contains = (blen < alen) & (bbpos < 1) & (blen - bepos < 1)
+    contained = (alen < blen) & (abpos < 1) & (alen - aepos < 1)
+    ovls['type'] = np.where(contains, OVERLAP_TYPE_CODE['contains'],
+                            np.where(contained, OVERLAP_TYPE_CODE['contained'], OVERLAP_TYPE_CODE['overlap']))
+    return ovls
+
+
+def write_cache(fn, ovls):
+    tmp_fn = fn + '.tmp.npy'
+    np.save(tmp_fn, np.ascontiguousarray(ovls, dtype=OVERLAP_DTYPE))
+    os.rename(tmp_fn, fn)
+
+
+def load_cache(fn):
+    """Return a read-only memory-map of the overlaps cached in fn.
+    """
+    ovls = np.load(fn, mmap_mode='r')
+    if ovls.dtype != OVERLAP_DTYPE:
+        raise Exception('Unexpected overlap columns {!r} in {!r}'.format(ovls.dtype, os.path.abspath(fn)))
+    return ovls
+
+
+def columns(ovls, *names):
+    """Return the named columns of ovls as lists, for fast iteration in Python.
+    """
+    return [ovls[name].tolist() for name in names]
@@ -4,16 +4,14 @@ import os
 import sys
 import argparse
 from falcon_kit.FastaReader import FastaReader
+from .. import rid_to_phase
 
-def load_rid_to_phase(rid_phase_map, ctg_id):
-    arid2phase = {}
-    with open(rid_phase_map) as f:
-        for row in f:
-            row = row.strip().split()
-            pread_id, phase_ctg_id, phase_blk_id, phase_id = row[0:4]
-            if phase_ctg_id == ctg_id:
-                arid2phase[pread_id] = (phase_ctg_id, phase_blk_id, phase_id)
-    return arid2phase
+def load_pread_ids(rid_phase_map, ctg_id):
+    """Return the set of pread names ('%09d') phased on ctg_id,
+    from a rid_to_phase table in either format.
+    """
+    table = rid_to_phase.load(rid_phase_map)
+    return set('%09d' % rid for rid in table.rids(ctg_id).tolist())
 
 def extract_preads(preads_paths, header_set, out_path):
     """
@@ -33,8 +31,7 @@ def extract_preads(preads_paths, header_set, out_path):
                 fp_out.write('>%s\n%s\n' % (header, seq))
 
 def run(ctg_id, rid_phase_map, preads, out):
-    rid2phase = load_rid_to_phase(rid_phase_map, ctg_id)
-    pread_header_set = set(rid2phase.keys())
+    pread_header_set = load_pread_ids(rid_phase_map, ctg_id)
     extract_preads(preads, pread_header_set, out)
 
 def parse_args(argv):
@@ -0,0 +1,206 @@
+"""
+The rid-to-phase table: the contig, phase block and phase of each phased pread,
+as written by phasing_readmap and gathered by phasing_gather.
+
+The text format (rid_to_phase, rid_to_phase.all) has one line per read:
+    pread_id ctg_id block phase
+with the pread id as '%09d', and block -1 for a read in no phase block.
+
+The binary format is indexed by pread id (little-endian):
+    MAGIC
+    ctg   int32[n]  (index into the contig names, or -1 for a read not in the table)
+    block int32[n]
+    phase int32[n]
+    zero-padding to a multiple of 8 bytes
+    contig names, '\\n'-separated (ASCII), zero-padded to a multiple of 8 bytes
+    FOOTER: n (uint64), length of the names (uint64),
+            crc32 of everything between MAGIC and FOOTER (uint32), b'#EOF'
+where n is one more than the largest pread id.
+
+load() memory-maps the binary format, so a lookup needs no parsing,
+and forked workers share the pages of the file.
+load() also accepts the text format, for old runs and for debugging.
+"""
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b'FURID2P1'
+FOOTER = struct.Struct('<QQI4s')
+FOOTER_TAG = b'#EOF'
+
+
+def _padding(nbytes):
+    return -nbytes % 8
+
+
+class RidToPhase(object):
+    """Mapping of pread id (int, or str as in the text format)
+    to (ctg_id, block, phase), like the dicts we used to build from the text format.
+    The arrays are indexed by pread id.
+    """
+
+    def __init__(self, ctg_names, ctg, block, phase):
+        self.ctg_names = list(ctg_names)
+        self.ctg = ctg
+        self.block = block
+        self.phase = phase
+
+    def __len__(self):
+        return int(np.count_nonzero(self.ctg >= 0))
+
+    def __contains__(self, rid):
+        try:
+            rid = int(rid)
+        except (TypeError, ValueError):
+            return False  # e.g. None, as for a dict
+        return 0 <= rid < len(self.ctg) and self.ctg[rid] >= 0
+
+    def __getitem__(self, rid):
+        if rid not in self:
+            raise KeyError(rid)
+        rid = int(rid)
+        return (self.ctg_names[self.ctg[rid]], int(self.block[rid]), int(self.phase[rid]))
+
+    def get(self, rid, default=None):
+        if rid not in self:
+            return default
+        return self[rid]
+
+    def contigs(self):
+        """Return the set of contigs with at least one read."""
+        present = np.unique(self.ctg[self.ctg >= 0])
+        return set(self.ctg_names[i] for i in present.tolist())
+
+    def rids(self, ctg_id=None):
+        """Return the pread ids in the table (of ctg_id, if given), in order."""
+        if ctg_id is None:
+            return np.flatnonzero(self.ctg >= 0)
+        if ctg_id not in self.ctg_names:
+            return np.zeros(0, dtype=np.int64)
+        return np.flatnonzero(self.ctg == self.ctg_names.index(ctg_id))
+
+    def lookup(self, rids):
+        """Return the (ctg, block, phase) arrays for an array of pread ids,
+        with ctg = -1 (and block = phase = 0) for the reads not in the table.
+        """
+        rids = np.asarray(rids, dtype=np.int64)
+        known = np.flatnonzero((rids >= 0) & (rids < len(self.ctg)))
+        ctg = np.full(len(rids), -1, dtype='<i4')
+        block = np.zeros(len(rids), dtype='<i4')
+        phase = np.zeros(len(rids), dtype='<i4')
+        ctg[known] = self.ctg[rids[known]]
+        block[known] = self.block[rids[known]]
+        phase[known] = self.phase[rids[known]]
+        return ctg, block, phase
+
+
+def from_rows(rows):
+    """Return a RidToPhase for rows of (rid, ctg_id, block, phase).
+    As for a dict, the last row of a rid wins.
+    """
+    ctg_index = {}
+    rid_list = []
+    ctg_list = []
+    block_list = []
+    phase_list = []
+    for rid, ctg_id, block, phase in rows:
+        rid_list.append(int(rid))
+        ctg_list.append(ctg_index.setdefault(ctg_id, len(ctg_index)))
+        block_list.append(int(block))
+        phase_list.append(int(phase))
+    rids = np.array(rid_list, dtype=np.int64)
+    n = int(rids.max()) + 1 if len(rids) else 0
+    ctg = np.full(n, -1, dtype='<i4')
+    block = np.zeros(n, dtype='<i4')
+    phase = np.zeros(n, dtype='<i4')
+    # Fancy assignment does not promise which of repeated indices wins, so keep the last ourselves.
+    last = len(rids) - 1 - np.unique(rids[::-1], return_index=True)[1]
+    ctg[rids[last]] = np.array(ctg_list, dtype='<i4')[last]
+    block[rids[last]] = np.array(block_list, dtype='<i4')[last]
+    phase[rids[last]] = np.array(phase_list, dtype='<i4')[last]
+    names = sorted(ctg_index, key=ctg_index.get)
+    return RidToPhase(names, ctg, block, phase)
+
+
+def load_text(fn):
+    rows = []
+    with open(fn) as f:
+        for row in f:
+            row = row.strip().split()
+            if not row:
+                continue
+            rows.append((int(row[0]), row[1], int(row[2]), int(row[3])))
+    return from_rows(rows)
+
+
+def write_text(table, stream):
+    """Export in the text format, in pread id order."""
+    for rid in table.rids().tolist():
+        print('{:09d} {} {} {}'.format(rid, *table[rid]), file=stream)
+
+
+def write_binary(fn, table):
+    n = len(table.ctg)
+    names = '\n'.join(table.ctg_names).encode('ascii')
+    body = [
+        np.ascontiguousarray(table.ctg, dtype='<i4').tobytes(),
+        np.ascontiguousarray(table.block, dtype='<i4').tobytes(),
+        np.ascontiguousarray(table.phase, dtype='<i4').tobytes(),
+        b'\0' * _padding(12 * n),
+        names,
+        b'\0' * _padding(len(names)),
+    ]
+    crc = 0
+    for chunk in body:
+        crc = zlib.crc32(chunk, crc)
+    # Write under a temporary name, so a file that exists is complete.
+    tmp_fn = fn + '.tmp'
+    with open(tmp_fn, 'wb') as stream:
+        stream.write(MAGIC)
+        for chunk in body:
+            stream.write(chunk)
+        stream.write(FOOTER.pack(n, len(names), crc, FOOTER_TAG))
+    os.rename(tmp_fn, fn)
+
+
+def is_binary(fn):
+    with open(fn, 'rb') as stream:
+        return stream.read(len(MAGIC)) == MAGIC
+
+
+def load(fn):
+    """Return a RidToPhase.
+    For the binary format, its arrays are read-only views of a memory-map of the file.
+    """
+    if is_binary(fn):
+        return load_binary(fn)
+    return load_text(fn)
+
+
+def load_binary(fn):
+    size = os.path.getsize(fn)
+    if size < len(MAGIC) + FOOTER.size:
+        raise Exception('No footer found in {!r}'.format(os.path.abspath(fn)))
+    with open(fn, 'rb') as stream:
+        buf = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    n, names_len, crc, tag = FOOTER.unpack_from(buf, size - FOOTER.size)
+    body_size = size - len(MAGIC) - FOOTER.size
+    arrays_size = 12 * n + _padding(12 * n)
+    if tag != FOOTER_TAG or body_size != arrays_size + names_len + _padding(names_len):
+        raise Exception('No valid footer found in {!r}'.format(os.path.abspath(fn)))
+    body = memoryview(buf)[len(MAGIC):len(MAGIC) + body_size]
+    if zlib.crc32(body) != crc:
+        raise Exception('Checksum mismatch in {!r}'.format(os.path.abspath(fn)))
+    offset = len(MAGIC)
+    ctg = np.frombuffer(buf, dtype='<i4', count=n, offset=offset)
+    offset += 4 * n
+    block = np.frombuffer(buf, dtype='<i4', count=n, offset=offset)
+    offset += 4 * n
+    phase = np.frombuffer(buf, dtype='<i4', count=n, offset=offset)
+    offset = len(MAGIC) + arrays_size
+    names = bytes(buf[offset:offset + names_len]).decode('ascii')
+    return RidToPhase(names.split('\n') if names else [], ctg, block, phase)
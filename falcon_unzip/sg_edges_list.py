@@ -0,0 +1,248 @@
+"""
+The edges of the string graph, as written by phased_ovlp_to_graph.
+
+The text format (sg_edges_list) has one line per edge:
+    v w rid b e score identity type
+for the edge from node v to node w, each named 'pread_id:B' or 'pread_id:E' with the pread id as '%09d',
+which reads pread rid from b to e, and of type G, TR, R, S, C or CP.
+
+The binary format (sg_edges_list.bin) is sorted by edge (little-endian):
+    MAGIC
+    key      uint64[n]  (v << 32) | w, in order, with node v = 2 * pread id + (1 for E, 0 for B)
+    line     int64[n]   the line of the edge in the text format
+    identity float64[n]
+    rid      int32[n]
+    b        int32[n]
+    e        int32[n]
+    score    int32[n]
+    type     uint8[n]   (index into TYPES)
+    zero-padding to a multiple of 8 bytes
+    FOOTER: n (uint64), crc32 of everything between MAGIC and FOOTER (uint32), b'#EOF'
+where the attribute columns are in the order of the lines.
+
+load() memory-maps the binary format, so looking up an edge bisects the keys
+and reads only the pages of that edge, and forked workers share the pages of the file.
+load() also accepts the text format, for old runs and for debugging.
+"""
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b'FUSGEL01'
+FOOTER = struct.Struct('<QI4s')
+FOOTER_TAG = b'#EOF'
+TYPES = ['G', 'TR', 'R', 'S', 'C', 'CP']
+
+
+def _padding(nbytes):
+    return -nbytes % 8
+
+
+def node_id(node_name):
+    """'000000012:E' -> 25"""
+    rid, end = node_name.split(':')
+    return 2 * int(rid) + (1 if end == 'E' else 0)
+
+
+def node_name(v):
+    return '{:09d}:{}'.format(v >> 1, 'E' if v & 1 else 'B')
+
+
+def pread_ids(read_names):
+    """Return the pread ids of read_names, or None unless each is a pread id as '%09d'."""
+    ids = []
+    for name in read_names:
+        if not (name.isdigit() and len(name) == 9):
+            return None
+        ids.append(int(name))
+    return np.array(ids, dtype=np.int64)
+
+
+class SgEdges(object):
+    """Mapping of edge (v, w), by node names (or ids), to the fields of its line in the text format,
+    like the dict that graphs_to_h_tigs_2 used to build from it.
+    key is sorted, and the edge with key[i] is line[i] in the text format,
+    with the attributes of line j in identity[j], rid[j], and so on.
+    For an edge in more than one line, the last wins, as in a dict.
+    """
+
+    def __init__(self, key, line, identity, rid, b, e, score, type_):
+        self.key = key
+        self.line = line
+        self.identity = identity
+        self.rid = rid
+        self.b = b
+        self.e = e
+        self.score = score
+        self.type = type_
+
+    def __len__(self):
+        return len(self.key)
+
+    def _index(self, v, w):
+        key = (v << 32) | w
+        i = int(np.searchsorted(self.key, np.uint64(key), side='right')) - 1
+        if i < 0 or int(self.key[i]) != key:
+            return -1
+        return i
+
+    def find(self, v, w):
+        """Return the line of edge (v, w), by node ids, or -1."""
+        i = self._index(v, w)
+        return int(self.line[i]) if i >= 0 else -1
+
+    def _fields(self, edge):
+        try:
+            v, w = (node_id(x) if isinstance(x, str) else int(x) for x in edge)
+        except (TypeError, ValueError):
+            return None  # not an edge, as for a dict
+        i = self._index(v, w)
+        if i < 0:
+            return None
+        return self.fields(int(self.line[i]), v, w)
+
+    def __contains__(self, edge):
+        return self._fields(edge) is not None
+
+    def __getitem__(self, edge):
+        fields = self._fields(edge)
+        if fields is None:
+            raise KeyError(edge)
+        return fields
+
+    def get(self, edge, default=None):
+        fields = self._fields(edge)
+        if fields is None:
+            return default
+        return fields
+
+    def fields(self, j, v, w):
+        """Return the fields of line j, the edge (v, w), as split from the text format."""
+        return [node_name(v), node_name(w), '{:09d}'.format(int(self.rid[j])),
+                str(int(self.b[j])), str(int(self.e[j])), str(int(self.score[j])),
+                str(float(self.identity[j])), TYPES[self.type[j]]]
+
+    def edges(self):
+        """Return the (v, w) node id arrays of the edges, by line."""
+        v = np.empty(len(self.key), dtype=np.int64)
+        w = np.empty(len(self.key), dtype=np.int64)
+        v[self.line] = self.key >> np.uint64(32)
+        w[self.line] = self.key & np.uint64(0xffffffff)
+        return v, w
+
+
+def from_arrays(v, w, rid, b, e, score, identity, type_):
+    """Return the SgEdges of the edges in lines of (v, w, rid, b, e, score, identity, type),
+    with the nodes by id and the types by index into TYPES.
+    """
+    key = (np.asarray(v, dtype=np.uint64) << np.uint64(32)) | np.asarray(w, dtype=np.uint64)
+    line = np.argsort(key, kind='stable')
+    return SgEdges(key[line], line,
+                   np.asarray(identity, dtype='<f8'), np.asarray(rid, dtype='<i4'),
+                   np.asarray(b, dtype='<i4'), np.asarray(e, dtype='<i4'),
+                   np.asarray(score, dtype='<i4'), np.asarray(type_, dtype=np.uint8))
+
+
+def subset(table, edges):
+    """Return the SgEdges of those of edges, each (v, w) by node ids, which are in table, in that order."""
+    found = [(v, w, table.find(v, w)) for v, w in edges]
+    found = [edge for edge in found if edge[2] >= 0]
+    v = [edge[0] for edge in found]
+    w = [edge[1] for edge in found]
+    lines = np.array([edge[2] for edge in found], dtype=np.int64)
+    return from_arrays(v, w, table.rid[lines], table.b[lines], table.e[lines],
+                       table.score[lines], table.identity[lines], table.type[lines])
+
+
+def concatenate(tables):
+    """Return the SgEdges with the lines of each of tables in turn."""
+    columns = [table.edges() + (table.rid, table.b, table.e, table.score, table.identity, table.type)
+               for table in tables]
+    return from_arrays(*(np.concatenate([c[k] for c in columns]) for k in range(8)))
+
+
+def load_text(fn):
+    types = dict((t, i) for i, t in enumerate(TYPES))
+    columns = [[] for _ in range(8)]
+    with open(fn) as f:
+        for row in f:
+            row = row.split()
+            if not row:
+                continue
+            for column, value in zip(columns, (node_id(row[0]), node_id(row[1]), int(row[2]), int(row[3]),
+                                               int(row[4]), int(row[5]), float(row[6]), types[row[7]])):
+                column.append(value)
+    return from_arrays(*columns)
+
+
+def write_text(table, stream):
+    """Export in the text format, in line order."""
+    v, w = table.edges()
+    for j, (vj, wj) in enumerate(zip(v.tolist(), w.tolist())):
+        stream.write(' '.join(table.fields(j, vj, wj)) + '\n')
+
+
+def write_binary(fn, table):
+    n = len(table.key)
+    body = [
+        np.ascontiguousarray(table.key, dtype='<u8').tobytes(),
+        np.ascontiguousarray(table.line, dtype='<i8').tobytes(),
+        np.ascontiguousarray(table.identity, dtype='<f8').tobytes(),
+        np.ascontiguousarray(table.rid, dtype='<i4').tobytes(),
+        np.ascontiguousarray(table.b, dtype='<i4').tobytes(),
+        np.ascontiguousarray(table.e, dtype='<i4').tobytes(),
+        np.ascontiguousarray(table.score, dtype='<i4').tobytes(),
+        np.ascontiguousarray(table.type, dtype=np.uint8).tobytes(),
+        b'\0' * _padding(n),
+    ]
+    crc = 0
+    for chunk in body:
+        crc = zlib.crc32(chunk, crc)
+    # Write under a temporary name, so a file that exists is complete.
+    tmp_fn = fn + '.tmp'
+    with open(tmp_fn, 'wb') as stream:
+        stream.write(MAGIC)
+        for chunk in body:
+            stream.write(chunk)
+        stream.write(FOOTER.pack(n, crc, FOOTER_TAG))
+    os.rename(tmp_fn, fn)
+
+
+def is_binary(fn):
+    with open(fn, 'rb') as stream:
+        return stream.read(len(MAGIC)) == MAGIC
+
+
+def load(fn, check=True):
+    """Return a SgEdges.
+    For the binary format, its arrays are read-only views of a memory-map of the file,
+    and unless check is False, we verify its checksum, which reads the whole file once.
+    """
+    if is_binary(fn):
+        return load_binary(fn, check)
+    return load_text(fn)
+
+
+def load_binary(fn, check=True):
+    size = os.path.getsize(fn)
+    if size < len(MAGIC) + FOOTER.size:
+        raise Exception('No footer found in {!r}'.format(os.path.abspath(fn)))
+    with open(fn, 'rb') as stream:
+        buf = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    n, crc, tag = FOOTER.unpack_from(buf, size - FOOTER.size)
+    body_size = size - len(MAGIC) - FOOTER.size
+    if tag != FOOTER_TAG or body_size != 41 * n + _padding(n):
+        raise Exception('No valid footer found in {!r}'.format(os.path.abspath(fn)))
+    if check and zlib.crc32(memoryview(buf)[len(MAGIC):len(MAGIC) + body_size]) != crc:
+        raise Exception('Checksum mismatch in {!r}'.format(os.path.abspath(fn)))
+    columns = []
+    offset = len(MAGIC)
+    for dtype in ('<u8', '<i8', '<f8', '<i4', '<i4', '<i4', '<i4', np.uint8):
+        column = np.frombuffer(buf, dtype=dtype, count=n, offset=offset)
+        offset += column.nbytes
+        columns.append(column)
+    key, line, identity, rid, b, e, score, type_ = columns
+    return SgEdges(key, line, identity, rid, b, e, score, type_)
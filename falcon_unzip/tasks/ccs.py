@@ -103,7 +103,7 @@ TASK_GRAPH_TO_H_TIGS_SCRIPT = """\
 asm_dir=$(dirname {input.falcon_asm_done})
 hasm_dir=$(dirname {input.p_ctg})
 
-python3 -m falcon_unzip.mains.graphs_to_h_tigs_2 --gathered-rid-to-phase={input.gathered_rid_to_phase} --base-dir={params.topdir} --fc-asm-path ${{asm_dir}} --fc-hasm-path ${{hasm_dir}} --ctg-id all --rid-phase-map {input.rid_to_phase_all} --fasta {input.preads4falcon}
+python3 -m falcon_unzip.mains.graphs_to_h_tigs_2 --gathered-rid-to-phase={input.gathered_rid_to_phase} --base-dir={params.topdir} --fc-asm-path ${{asm_dir}} --fc-hasm-path ${{hasm_dir}} --ctg-id all --rid-phase-map {input.rid_to_phase_bin} --fasta {input.preads4falcon}
 
 # more script -- a little bit hacky here, we should improve
 
@@ -134,7 +134,7 @@ hasm_dir=$(dirname {input.p_ctg})
 python3 -m falcon_unzip.mains.graphs_to_h_tigs_2 split \
         --gathered-rid-to-phase={input.gathered_rid_json} --base-dir={params.topdir} \
         --fc-asm-path ${{asm_dir}} --fc-hasm-path ${{hasm_dir}} \
-        --rid-phase-map {input.rid_to_phase_all} --fasta {input.preads4falcon} \
+        --rid-phase-map {input.rid_to_phase_bin} --fasta {input.preads4falcon} \
         --split-fn={output.split} --bash-template-fn={output.bash_template}
 
 # The bash-template is just a dummy, for now.
@@ -148,8 +148,8 @@ rm -f ./ctg_paths
 python3 -m falcon_unzip.mains.ovlp_filter_with_phase_strict \
         --fofn {input.las_fofn} --max-diff 120 --max-cov 120 --min-cov 1 \
         --n-core {params.pypeflow_nproc} --min-len 2500 --db {input.preads_db} \
-        --rid-phase-map {input.rid_to_phase_all} > preads.p_ovl
-python3 -m falcon_unzip.mains.phased_ovlp_to_graph preads.p_ovl --min-len 2500 > fc.log
+        --rid-phase-map {input.rid_to_phase_bin} > preads.p_ovl
+python3 -m falcon_unzip.mains.phased_ovlp_to_graph preads.p_ovl --min-len 2500 --n-core {params.pypeflow_nproc} > fc.log
 
 if [[ ! -e ./ctg_paths ]]; then
     exit 1
@@ -176,6 +176,8 @@ fi
 TASK_PHASING_GATHER_SCRIPT = """\
 # creates a master table of rid to phase
 cat {input.ctg*} > {output.rid_to_phase_all}
+# and the same table in binary, indexed by pread id, for the consumers to memory-map
+python3 -m falcon_unzip.mains.phasing_convert_rid_to_phase --rid-phase-map {output.rid_to_phase_all} --out-fn {output.rid_to_phase_bin}
 
 # creates the needed gathering JSON
 find {input.ctg*} | xargs -I [] readlink -f [] | python3 -m falcon_unzip.mains.gen_rid_gathered_json > {output.gathered_rid_json}
@@ -185,10 +187,7 @@ TASK_READ_PHASING = """
 
         #TODO: break up command, and maybe remove some deps.
 
-        python3 -m falcon_unzip.mains.phasing_make_het_call --ctg-id {params.ctg} --bam-fn {input.BAM} --fasta-fn {input.T} --vmap-fn het_calls.ctg.vmap --vpos-fn het_calls.ctg.vpos --q-id-map-fn het_calls.ctg.msgpack
-        python3 -m falcon_unzip.mains.phasing_generate_association_table --ctg-id {params.ctg} --vmap=het_calls.ctg.vmap --atable=association_table.ctg.astab
-        python3 -m falcon_unzip.mains.phasing_get_phased_blocks --vmap=het_calls.ctg.vmap --atable=association_table.ctg.astab --p-variant=phased_vars.ctg.phased.txt
-        python3 -m falcon_unzip.mains.phasing_get_phased_reads --ctg-id={params.ctg} --vmap=het_calls.ctg.vmap --p-variant=phased_vars.ctg.phased.txt --q-id-map=het_calls.ctg.msgpack --phased-reads=phased_reads.ctg.phased.txt
+        python3 -m falcon_unzip.mains.phasing_run --ctg-id {params.ctg} --bam-fn {input.BAM} --fasta-fn {input.T} --p-variant-fn phased_vars.ctg.phased.txt --phased-reads-fn phased_reads.ctg.phased.txt --max-depth {params.max_depth}
 
         #reformats the data keeping the last, second..forth columns
         cat phased_reads.ctg.phased.txt | perl -lane 'print "$F[-1] $F[1] $F[2] $F[3]"' >|   phased_reads.ctg.phased.reads.reformat.txt
@@ -383,6 +382,7 @@ def run_workflow(wf, config, unzip_config_fn):
             },
             parameters={
                 'ctg': ctg,
+                'max_depth': Unzip_config['phasing_max_depth'],
             },
             dist=dist_one,
         ))
@@ -396,12 +396,14 @@ def run_workflow(wf, config, unzip_config_fn):
     '''
 
     concatenated_rid_to_phase_fn = "3-unzip/0-phasing/gathered-rid-to-phase/rid_to_phase.all"
+    concatenated_rid_to_phase_bin_fn = "3-unzip/0-phasing/gathered-rid-to-phase/rid_to_phase.bin"
     gathered_rid_to_phase_json   = "3-unzip/0-phasing/gathered-rid-to-phase/gathered.json"
 
     wf.addTask(gen_task(
         script=TASK_PHASING_GATHER_SCRIPT,
         inputs=collected,
         outputs={'rid_to_phase_all'  : concatenated_rid_to_phase_fn,
+                 'rid_to_phase_bin'  : concatenated_rid_to_phase_bin_fn,
                  'gathered_rid_json' : gathered_rid_to_phase_json,
         },
         parameters={},
@@ -419,7 +421,7 @@ def run_workflow(wf, config, unzip_config_fn):
                 'preads_db': preads_db_fn,
                 'preads4falcon': preads4falcon_fn,
                 'las_fofn': p_las_fofn_fn,
-                'rid_to_phase_all': concatenated_rid_to_phase_fn,
+                'rid_to_phase_bin': concatenated_rid_to_phase_bin_fn,
                 'gathered_rid_json' : gathered_rid_to_phase_json,
             },
             outputs={
@@ -436,7 +438,7 @@ def run_workflow(wf, config, unzip_config_fn):
             inputs={
                 'falcon_asm_done': falcon_asm_done_fn,
                 'preads4falcon': preads4falcon_fn,
-                'rid_to_phase_all': concatenated_rid_to_phase_fn,
+                'rid_to_phase_bin': concatenated_rid_to_phase_bin_fn,
                 'gathered_rid_json': gathered_rid_to_phase_json,
                 'p_ctg': hasm_p_ctg_fn,
             },
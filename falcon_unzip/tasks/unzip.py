@@ -46,27 +46,14 @@ rm tmp_aln.sam
 bam_fn=${{ctg_aln_out}}
 fasta_fn={input.ref_fasta}
 
-# MAKE_HET_CALL
-vmap_fn='het_call/variant_map'
-vpos_fn='het_call/variant_pos'
-q_id_map_fn='het_call/q_id_map.msgpack'
-mkdir -p het_call
-python3 -m falcon_unzip.mains.phasing_make_het_call --bam ${{bam_fn}} --fasta ${{fasta_fn}} --ctg-id {params.ctg_id} --vmap=${{vmap_fn}} --vpos=${{vpos_fn}} --q-id-map=${{q_id_map_fn}}
-
-# GENERATE ASSOCIATION TABLE
-atable_fn='g_atable/atable'
-mkdir -p g_atable
-python3 -m falcon_unzip.mains.phasing_generate_association_table --ctg-id {params.ctg_id} --vmap=${{vmap_fn}} --atable=${{atable_fn}}
-
-# GET PHASED BLOCKS
+# HET CALL, ASSOCIATION TABLE, PHASED BLOCKS, PHASED READS
+# (To keep the intermediate files, add --vmap-fn, --vpos-fn, --q-id-map-fn, --atable-fn.)
+# Collapsed repeats are subsampled to about max_depth ([Unzip] phasing_max_depth; 0 for no cap).
+max_depth={params.max_depth}
 phased_variant_fn='get_phased_blocks/phased_variants'
-mkdir -p get_phased_blocks
-python3 -m falcon_unzip.mains.phasing_get_phased_blocks --vmap=${{vmap_fn}} --atable=${{atable_fn}} --p-variant=${{phased_variant_fn}}
-
-# GET PHASED READS
 phased_reads_fn='get_phased_reads/phased_reads'
-mkdir -p get_phased_reads
-python3 -m falcon_unzip.mains.phasing_get_phased_reads --ctg-id={params.ctg_id} --vmap=${{vmap_fn}} --p-variant=${{phased_variant_fn}} --q-id-map=${{q_id_map_fn}} --phased-reads=${{phased_reads_fn}}
+mkdir -p get_phased_blocks get_phased_reads
+python3 -m falcon_unzip.mains.phasing_run --bam ${{bam_fn}} --fasta ${{fasta_fn}} --ctg-id {params.ctg_id} --p-variant=${{phased_variant_fn}} --phased-reads=${{phased_reads_fn}} --n-proc=${{threads_aln}} --max-depth=${{max_depth}}
 
 # PHASING READMAP
 # TODO: read-map-dir/* as inputs
@@ -104,19 +91,19 @@ mv {output.rid_to_phase_out}.tmp {output.rid_to_phase_out}
 """
 
 TASK_PHASING_SPLIT_SCRIPT = """\
-python3 -m falcon_unzip.mains.phasing_split --base-dir={params.topdir} --ctg-list-fn={input.ctg_list} --rawread-ids-fn={input.rawread_ids} --pread-ids-fn={input.pread_ids} --pread-to-contigs-fn={input.pread_to_contigs} --split-fn={output.split} --bash-template-fn={output.bash_template}
+python3 -m falcon_unzip.mains.phasing_split --base-dir={params.topdir} --ctg-list-fn={input.ctg_list} --rawread-ids-fn={input.rawread_ids} --pread-ids-fn={input.pread_ids} --pread-to-contigs-fn={input.pread_to_contigs} --max-depth={params.max_depth} --split-fn={output.split} --bash-template-fn={output.bash_template}
 """
 
 TASK_PHASING_GATHER_SCRIPT = """\
-python3 -m falcon_unzip.mains.phasing_gather --gathered={input.gathered} --rid-to-phase-all={output.rid_to_phase_all}
+python3 -m falcon_unzip.mains.phasing_gather --gathered={input.gathered} --rid-to-phase-all={output.rid_to_phase_all} --rid-to-phase-bin-fn={output.rid_to_phase_bin}
 """
 
 TASK_HASM_SCRIPT = """\
 # TODO: Needs preads.db
 
 rm -f ./ctg_paths
-python3 -m falcon_unzip.mains.ovlp_filter_with_phase_strict --fofn {input.las_fofn} --max-diff 120 --max-cov 120 --min-cov 1 --n-core 48 --min-len 2500 --db {input.preads_db} --rid-phase-map {input.rid_to_phase_all} > preads.p_ovl
-python3 -m falcon_unzip.mains.phased_ovlp_to_graph preads.p_ovl --min-len 2500 > fc.log
+python3 -m falcon_unzip.mains.ovlp_filter_with_phase_strict --fofn {input.las_fofn} --max-diff 120 --max-cov 120 --min-cov 1 --n-core 48 --min-len 2500 --db {input.preads_db} --rid-phase-map {input.rid_to_phase_bin} > preads.p_ovl
+python3 -m falcon_unzip.mains.phased_ovlp_to_graph preads.p_ovl --min-len 2500 --n-core 48 > fc.log
 
 if [[ ! -e ./ctg_paths ]]; then
     exit 1
@@ -140,13 +127,50 @@ if [[ ! -e {output.p_ctg} ]]; then
 fi
 """
 
+TASK_HASM_SPLIT_SCRIPT = """\
+# The filtered overlaps of each contig, in their own bucket.
+rm -rf ./buckets
+python3 -m falcon_unzip.mains.ovlp_filter_with_phase_strict --fofn {input.las_fofn} --max-diff 120 --max-cov 120 --min-cov 1 --n-core {params.pypeflow_nproc} --min-len 2500 --db {input.preads_db} --rid-phase-map {input.rid_to_phase_bin} --bucket-dir ./buckets
+python3 -m falcon_unzip.mains.hasm_buckets split --buckets-fn ./buckets/buckets.json --min-len 2500 --split-fn={output.split} --bash-template-fn={output.bash_template}
+
+# The bash-template is just a dummy, for now.
+"""
+
+TASK_HASM_APPLY_SCRIPT = """\
+python3 -m falcon_unzip.mains.hasm_buckets apply --units-of-work-fn={input.units_of_work} --results-fn={output.results}
+"""
+
+TASK_HASM_MERGE_SCRIPT = """\
+rm -f ./ctg_paths
+python3 -m falcon_unzip.mains.hasm_buckets merge --results-fn={input.results}
+
+if [[ ! -e ./ctg_paths ]]; then
+    exit 1
+fi
+
+# Create haplotigs in a safe manner.
+
+ln -sf {input.preads4falcon} .
+
+rm -f {output.p_ctg}
+
+# Given sg_edges_list, utg_data, ctg_paths, preads4falcon.fasta,
+# write p_ctg.fasta and a_ctg_all.fasta,
+# plus p_ctg_tiling_path, a_ctg_tiling_path:
+time python3 -m falcon_kit.mains.graph_to_contig
+
+if [[ ! -e {output.p_ctg} ]]; then
+    exit 1
+fi
+"""
+
 TASK_GRAPH_TO_H_TIGS_SPLIT_SCRIPT = """\
 asm_dir=$(dirname {input.falcon_asm_done})
 hasm_dir=$(dirname {input.p_ctg})
 
 # TODO: Should we look at ../reads/ctg_list ?
 
-python3 -m falcon_unzip.mains.graphs_to_h_tigs_2 split --gathered-rid-to-phase={input.gathered_rid_to_phase} --base-dir={params.topdir} --fc-asm-path ${{asm_dir}} --fc-hasm-path ${{hasm_dir}} --rid-phase-map {input.rid_to_phase_all} --fasta {input.preads4falcon} --split-fn={output.split} --bash-template-fn={output.bash_template}
+python3 -m falcon_unzip.mains.graphs_to_h_tigs_2 split --gathered-rid-to-phase={input.gathered_rid_to_phase} --base-dir={params.topdir} --fc-asm-path ${{asm_dir}} --fc-hasm-path ${{hasm_dir}} --rid-phase-map {input.rid_to_phase_bin} --fasta {input.preads4falcon} --split-fn={output.split} --bash-template-fn={output.bash_template}
 
 # The bash-template is just a dummy, for now.
 """
@@ -155,7 +179,7 @@ TASK_GRAPH_TO_H_TIGS_SCRIPT = """\
 asm_dir=$(dirname {input.falcon_asm_done})
 hasm_dir=$(dirname {input.p_ctg})
 
-python3 -m falcon_unzip.mains.graphs_to_h_tigs_2 --gathered-rid-to-phase={input.gathered_rid_to_phase} --base-dir={params.topdir} --fc-asm-path ${{asm_dir}} --fc-hasm-path ${{hasm_dir}} --ctg-id all --rid-phase-map {input.rid_to_phase_all} --fasta {input.preads4falcon}
+python3 -m falcon_unzip.mains.graphs_to_h_tigs_2 --gathered-rid-to-phase={input.gathered_rid_to_phase} --base-dir={params.topdir} --fc-asm-path ${{asm_dir}} --fc-hasm-path ${{hasm_dir}} --ctg-id all --rid-phase-map {input.rid_to_phase_bin} --fasta {input.preads4falcon}
 
 # more script -- a little bit hacky here, we should improve
 
@@ -376,6 +400,65 @@ def create_tasks_read_to_contig_map(wf, falcon_asm_done, raw_reads_db, preads_db
     ))
 
 
+def create_tasks_hasm_by_contig(wf, config, preads_db_fn, preads4falcon_fn, p_las_fofn_fn, rid_to_phase_bin_fn, hasm_p_ctg_fn):
+    """Filter the overlaps into a bucket per contig, build the string graph of each
+    in parallel, and merge the graphs for graph_to_contig, which writes hasm_p_ctg_fn.
+    """
+    hasm_dir = os.path.dirname(hasm_p_ctg_fn)
+    hasm_all_units_fn = os.path.join(hasm_dir, 'split', 'all-units-of-work.json')
+    dummy_fn = os.path.join(hasm_dir, 'split', 'dummy.sh')
+    wf.addTask(gen_task(
+            script=TASK_HASM_SPLIT_SCRIPT,
+            inputs={
+                'preads_db': preads_db_fn,
+                'las_fofn': p_las_fofn_fn,
+                'rid_to_phase_bin': rid_to_phase_bin_fn,
+            },
+            outputs={
+                'split': hasm_all_units_fn,
+                'bash_template': dummy_fn,
+            },
+            parameters={},
+            dist=Dist(NPROC=48, job_dict=config['job.step.unzip.hasm']),
+    ))
+
+    gathered_hasm_fn = os.path.join(hasm_dir, 'gathered', 'gathered.json')
+    gen_parallel_tasks(
+        wf,
+        hasm_all_units_fn, gathered_hasm_fn,
+        run_dict=dict(
+            bash_template_fn=dummy_fn,
+            script='DUMMY',
+            inputs={
+                'units_of_work': os.path.join(hasm_dir, 'chunks', '{chunk_id}', 'some-units-of-work.json'),
+            },
+            outputs={
+                'results': os.path.join(hasm_dir, '{chunk_id}', 'result-list.json'),
+            },
+            parameters={},
+        ),
+        dist=Dist(
+            NPROC=1,
+            job_dict=config['job.step.unzip.hasm'],
+            use_tmpdir=False,
+        ),
+        run_script=TASK_HASM_APPLY_SCRIPT,
+    )
+
+    wf.addTask(gen_task(
+            script=TASK_HASM_MERGE_SCRIPT,
+            inputs={
+                'preads4falcon': preads4falcon_fn,
+                'results': gathered_hasm_fn,
+            },
+            outputs={
+                'p_ctg': hasm_p_ctg_fn,
+            },
+            parameters={},
+            dist=Dist(NPROC=1, job_dict=config['job.step.unzip.hasm']),
+    ))
+
+
 def run_workflow(wf, config, unzip_config_fn):
     default_njobs = int(config['job.defaults']['njobs'])
     wf.max_jobs = default_njobs
@@ -444,7 +527,9 @@ def run_workflow(wf, config, unzip_config_fn):
             split=phasing_all_units_fn,
             bash_template=phasing_run_bash_template_fn,
         ),
-        parameters={},
+        parameters=dict(
+            max_depth=Unzip_config['phasing_max_depth'],
+        ),
         dist=Dist(local=True),
     ))
 
@@ -468,12 +553,14 @@ def run_workflow(wf, config, unzip_config_fn):
     )
 
     concatenated_rid_to_phase_fn = './3-unzip/1-hasm/concatenated-rid-to-phase/rid_to_phase.all'
+    concatenated_rid_to_phase_bin_fn = './3-unzip/1-hasm/concatenated-rid-to-phase/rid_to_phase.bin'
 
     wf.addTask(gen_task(
         script=TASK_PHASING_GATHER_SCRIPT,
         inputs={'gathered': gathered_rid_to_phase_fn,
         },
         outputs={'rid_to_phase_all': concatenated_rid_to_phase_fn,
+                 'rid_to_phase_bin': concatenated_rid_to_phase_bin_fn,
         },
         parameters={},
         dist=Dist(local=True),
@@ -482,20 +569,24 @@ def run_workflow(wf, config, unzip_config_fn):
     preads4falcon_fn = './1-preads_ovl/db2falcon/preads4falcon.fasta'
 
     hasm_p_ctg_fn = './3-unzip/1-hasm/p_ctg.fasta'
-    wf.addTask(gen_task(
+    if Unzip_config['hasm_by_contig']:
+        create_tasks_hasm_by_contig(wf, config, preads_db_fn, preads4falcon_fn, p_las_fofn_fn,
+                concatenated_rid_to_phase_bin_fn, hasm_p_ctg_fn)
+    else:
+        wf.addTask(gen_task(
             script=TASK_HASM_SCRIPT,
             inputs={
                 'preads_db': preads_db_fn,
                 'preads4falcon': preads4falcon_fn,
                 'las_fofn': p_las_fofn_fn,
-                'rid_to_phase_all': concatenated_rid_to_phase_fn,
+                'rid_to_phase_bin': concatenated_rid_to_phase_bin_fn,
             },
             outputs={
                 'p_ctg': hasm_p_ctg_fn,
             },
             parameters={},
             dist=Dist(NPROC=1, job_dict=config['job.step.unzip.hasm']),
-    ))
+        ))
 
     # Note: "graphs_to_h_tigs_2.py split" implicitly requires 2-asm-falcon/p_ctg.fasta.fai
 
@@ -507,7 +598,7 @@ def run_workflow(wf, config, unzip_config_fn):
             inputs={
                 'falcon_asm_done': falcon_asm_done_fn,
                 'preads4falcon': preads4falcon_fn,
-                'rid_to_phase_all': concatenated_rid_to_phase_fn,
+                'rid_to_phase_bin': concatenated_rid_to_phase_bin_fn,
                 'gathered_rid_to_phase': gathered_rid_to_phase_fn,
                 'p_ctg': hasm_p_ctg_fn,
             },
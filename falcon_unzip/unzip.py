@@ -76,15 +76,24 @@ def update_defaults(config):
     set_default('Unzip', 'polish_vc_ignore_error', False)
     set_default('Unzip', 'polish_use_blasr', False)
     set_default('Unzip', 'polish_include_zmw_all_subreads', False)
+    set_default('Unzip', 'hasm_by_contig', False)
+    set_default('Unzip', 'phasing_max_depth', 0) # 0 for no cap
 
     # Fix up known boolean config-values, which could be strings.
     for section, bool_key in (
             ('Unzip', 'polish_vc_ignore_error'),
             ('Unzip', 'polish_use_blasr'),
             ('Unzip', 'polish_include_zmw_all_subreads'),
+            ('Unzip', 'hasm_by_contig'),
             ):
         cfg = config[section]
         cfg[bool_key] = falcon_kit.functional.cfg_tobool(cfg[bool_key])
+    # And integers.
+    for section, int_key in (
+            ('Unzip', 'phasing_max_depth'),
+            ):
+        cfg = config[section]
+        cfg[int_key] = int(cfg[int_key])
 
 def parse_cfg_file(config_fn):
     """Return as dict.
@@ -0,0 +1,236 @@
+"""
+The variant_map ("vmap") of het calls, written by phasing_make_het_call
+and read by the later phasing stages.
+
+Each row is one read supporting one allele of a het site:
+    pos (1-based), ref_base, allele, q_id
+Rows are grouped by site, in position order, with the b0 rows before the b1 rows.
+
+The binary format is columnar (little-endian):
+    MAGIC
+    pos      int64[n]
+    q_id     int64[n]
+    ref_base uint8[n]  (ASCII)
+    allele   uint8[n]  (ASCII)
+    zero-padding to a multiple of 8 bytes
+    FOOTER: n (uint64), crc32 of everything between MAGIC and FOOTER (uint32), b'#EOF'
+
+The footer plays the role of the '#EOF' line of the text format:
+a file without a valid footer and checksum was not completely written.
+load() also accepts the text format, for old runs and for debugging.
+"""
+import collections
+import contextlib
+import mmap
+import os
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b'FUVMAP01'
+FOOTER = struct.Struct('<QI4s')
+FOOTER_TAG = b'#EOF'
+TEXT_HEADER = '#POS\tREFB\tB0|1\tqid'
+
+VariantMap = collections.namedtuple('VariantMap', ['pos', 'ref_base', 'allele', 'q_id'])
+
+
+def _padding(nbytes):
+    return -nbytes % 8
+
+
+class TextWriter(object):
+    """Write rows in the original tab-separated format."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        print(TEXT_HEADER, file=self.stream)
+
+    def add(self, pos, ref_base, allele, q_ids):
+        for q_id in q_ids:
+            print('{}\t{}\t{}\t{}'.format(pos, ref_base, allele, q_id), file=self.stream)
+
+    def finish(self):
+        print('#EOF', file=self.stream)
+
+
+class ArrayWriter(object):
+    """Collect rows, and return them as a VariantMap on finish()."""
+
+    def __init__(self):
+        self.pos = []
+        self.q_id = []
+        self.ref_base = []
+        self.allele = []
+
+    def add(self, pos, ref_base, allele, q_ids):
+        n = len(q_ids)
+        self.pos.append(np.full(n, pos, dtype='<i8'))
+        self.q_id.append(np.asarray(q_ids, dtype='<i8'))
+        self.ref_base.append(np.full(n, ord(ref_base), dtype=np.uint8))
+        self.allele.append(np.full(n, ord(allele), dtype=np.uint8))
+
+    def finish(self):
+        return VariantMap(
+            pos=_concat(self.pos, '<i8'),
+            ref_base=_concat(self.ref_base, np.uint8),
+            allele=_concat(self.allele, np.uint8),
+            q_id=_concat(self.q_id, '<i8'),
+        )
+
+
+class BinaryWriter(ArrayWriter):
+    """Collect rows, and write the columnar file on finish()."""
+
+    def __init__(self, fn):
+        super(BinaryWriter, self).__init__()
+        self.fn = fn
+
+    def finish(self):
+        vmap = super(BinaryWriter, self).finish()
+        write_binary(self.fn, vmap)
+        return vmap
+
+
+@contextlib.contextmanager
+def open_writer(fn, fmt='binary'):
+    """Yield a writer for fn, in 'binary' or 'text' format.
+    The caller must call finish() once, after the last add().
+    (phasing_make_het_call.het_call() does; its engines do not.)
+    """
+    if fmt == 'text':
+        with open(fn, 'w') as stream:
+            yield TextWriter(stream)
+    elif fmt == 'binary':
+        yield BinaryWriter(fn)
+    else:
+        raise Exception('Unknown vmap format {!r}'.format(fmt))
+
+
+def _concat(arrays, dtype):
+    if not arrays:
+        return np.zeros(0, dtype=dtype)
+    return np.concatenate(arrays).astype(dtype, copy=False)
+
+
+def write_binary(fn, vmap):
+    n = len(vmap.pos)
+    body = [
+        np.ascontiguousarray(vmap.pos, dtype='<i8').tobytes(),
+        np.ascontiguousarray(vmap.q_id, dtype='<i8').tobytes(),
+        np.ascontiguousarray(vmap.ref_base, dtype=np.uint8).tobytes(),
+        np.ascontiguousarray(vmap.allele, dtype=np.uint8).tobytes(),
+        b'\0' * _padding(2 * n),
+    ]
+    crc = 0
+    for chunk in body:
+        crc = zlib.crc32(chunk, crc)
+    # Write under a temporary name, so a file that exists is complete.
+    tmp_fn = fn + '.tmp'
+    with open(tmp_fn, 'wb') as stream:
+        stream.write(MAGIC)
+        for chunk in body:
+            stream.write(chunk)
+        stream.write(FOOTER.pack(n, crc, FOOTER_TAG))
+    os.rename(tmp_fn, fn)
+
+
+def is_binary(fn):
+    with open(fn, 'rb') as stream:
+        return stream.read(len(MAGIC)) == MAGIC
+
+
+def load(fn):
+    """Return a VariantMap of column arrays.
+    For the binary format, these are read-only views of a memory-map of the file.
+    """
+    if is_binary(fn):
+        return load_binary(fn)
+    return load_text(fn)
+
+
+def load_binary(fn):
+    size = os.path.getsize(fn)
+    if size < len(MAGIC) + FOOTER.size:
+        raise Exception('No footer found in {!r}'.format(os.path.abspath(fn)))
+    with open(fn, 'rb') as stream:
+        buf = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    n, crc, tag = FOOTER.unpack_from(buf, size - FOOTER.size)
+    body_size = size - len(MAGIC) - FOOTER.size
+    if tag != FOOTER_TAG or body_size != 18 * n + _padding(2 * n):
+        raise Exception('No valid footer found in {!r}'.format(os.path.abspath(fn)))
+    body = memoryview(buf)[len(MAGIC):len(MAGIC) + body_size]
+    if zlib.crc32(body) != crc:
+        raise Exception('Checksum mismatch in {!r}'.format(os.path.abspath(fn)))
+    offset = len(MAGIC)
+    pos = np.frombuffer(buf, dtype='<i8', count=n, offset=offset)
+    offset += 8 * n
+    q_id = np.frombuffer(buf, dtype='<i8', count=n, offset=offset)
+    offset += 8 * n
+    ref_base = np.frombuffer(buf, dtype=np.uint8, count=n, offset=offset)
+    offset += n
+    allele = np.frombuffer(buf, dtype=np.uint8, count=n, offset=offset)
+    return VariantMap(pos=pos, ref_base=ref_base, allele=allele, q_id=q_id)
+
+
+def load_text(fn):
+    pos = []
+    ref_base = []
+    allele = []
+    q_id = []
+    with open(fn) as f:
+        for l in f:
+            if l.startswith('#EOF'):  # prove file is complete
+                break
+            if l.startswith('#'):  # skip comments
+                continue
+            l = l.strip().split()
+            pos.append(int(l[0]))
+            ref_base.append(ord(l[1]))
+            allele.append(ord(l[2]))
+            q_id.append(int(l[3]))
+        else:
+            raise Exception('No EOF found in {!r}'.format(os.path.abspath(fn)))
+    return VariantMap(
+        pos=np.array(pos, dtype='<i8'),
+        ref_base=np.array(ref_base, dtype=np.uint8),
+        allele=np.array(allele, dtype=np.uint8),
+        q_id=np.array(q_id, dtype='<i8'),
+    )
+
+
+def write_text(vmap, stream):
+    """Export in the original tab-separated format, e.g. for debugging."""
+    writer = TextWriter(stream)
+    for pos, ref_base, allele, q_id in zip(vmap.pos.tolist(), vmap.ref_base.tolist(),
+                                           vmap.allele.tolist(), vmap.q_id.tolist()):
+        writer.add(pos, chr(ref_base), chr(allele), (q_id,))
+    writer.finish()
+
+
+def site_bounds(vmap):
+    """Return the start index of each site's rows, plus len(rows) at the end."""
+    change = np.flatnonzero(np.diff(vmap.pos)) + 1
+    return np.concatenate(([0], change, [len(vmap.pos)])).astype(np.int64)
+
+
+def iter_sites(vmap):
+    """Yield (pos, ref_base, [(allele, q_ids), ...]) per site, alleles in order of appearance.
+    Bases are returned as str, and q_ids as arrays.
+    """
+    bounds = site_bounds(vmap).tolist()
+    for beg, end in zip(bounds[:-1], bounds[1:]):
+        if beg == end:
+            continue
+        alleles = vmap.allele[beg:end]
+        allele_change = (np.flatnonzero(alleles[1:] != alleles[:-1]) + 1).tolist()
+        groups = collections.OrderedDict()
+        for a_beg, a_end in zip([0] + allele_change, allele_change + [end - beg]):
+            b = chr(alleles[a_beg])
+            q_ids = vmap.q_id[beg + a_beg:beg + a_end]
+            if b in groups:
+                groups[b] = np.concatenate((groups[b], q_ids))
+            else:
+                groups[b] = q_ids
+        yield int(vmap.pos[beg]), chr(vmap.ref_base[beg]), list(groups.items())
@@ -1,5 +1,42 @@
+import falcon_unzip.overlaps as mod_ovl
+import numpy as np
 import os.path
+import struct
 
 
 def get_test_data_dir():
     return os.path.join(os.path.dirname(__file__), '..', 'test_data')
+
+
+def write_db(db_fn, lengths, cutoff=-1, allarr=1, flags=None):
+    """Write the index of a DAZZ_DB (without the bases, which we never read).
+    """
+    if flags is None:
+        flags = [mod_ovl.DB_BEST] * len(lengths)
+    with open(db_fn, 'w') as stream:
+        stream.write('files =         1\n')
+    reads = np.zeros(len(lengths), dtype=mod_ovl.DB_READ_DTYPE)
+    reads['rlen'] = lengths
+    reads['flags'] = flags
+    header = struct.pack('<iiii16x4x4xq', len(lengths), len(lengths), cutoff, allarr, sum(lengths))
+    header += b'\0' * (mod_ovl.DB_HEADER_SIZE - len(header))
+    with open(mod_ovl.get_db_idx_fn(db_fn), 'wb') as stream:
+        stream.write(header + reads.tobytes())
+
+
+def write_las(las_fn, lines, lengths, tspace=100):
+    """Write the overlaps of M4 lines as a LAS file, with made-up traces.
+    """
+    with open(las_fn, 'wb') as stream:
+        stream.write(struct.pack('<qi', len(lines), tspace))
+        for line in lines:
+            f = line.split()
+            aread, bread, idt = int(f[0]), int(f[1]), float(f[3])
+            abpos, aepos, comp, t_s, t_e = int(f[5]), int(f[6]), int(f[8]), int(f[9]), int(f[10])
+            blen = lengths[bread]
+            bbpos, bepos = (blen - t_e, blen - t_s) if comp else (t_s, t_e)
+            diffs = int(round((100 - idt) * ((aepos - abpos) + (bepos - bbpos)) / 200))
+            tlen = 2 * ((aepos - abpos) // tspace + 1)
+            stream.write(struct.pack('<iiiiiiIii4x', tlen, diffs, abpos, bbpos, aepos, bepos, comp, aread, bread))
+            stream.write(struct.pack('<{}H'.format(tlen), *range(tlen)) if tspace > mod_ovl.TRACE_XOVR else
+                         bytes(i % 256 for i in range(tlen)))
@@ -41,3 +41,11 @@ baz.bam
 """)
         M.validate_input_bam_fofn(cfg, 'dummy')
         # It does not actually validate existence.
+
+def test_update_defaults():
+    cfg = {'Unzip': {}}
+    M.update_defaults(cfg)
+    assert cfg['Unzip']['phasing_max_depth'] == 0 # no cap
+    cfg = {'Unzip': {'phasing_max_depth': '200'}}
+    M.update_defaults(cfg)
+    assert cfg['Unzip']['phasing_max_depth'] == 200
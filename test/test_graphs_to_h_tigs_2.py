@@ -1,6 +1,7 @@
 import falcon_unzip.mains.graphs_to_h_tigs_2 as mod
 import helpers
 import pytest
+import json
 import os
 import sys
 import networkx as nx
@@ -2411,3 +2412,144 @@ def test_filter_haplotigs_by_len():
         for key, result_htig in result.items():
             msg = 'test_id = {}, key = {}'.format(test_id, key)
             assert result_htig.__dict__ == expected[key].__dict__, msg
+
+
+#####################################
+### Bundles of per-contig inputs. ###
+#####################################
+# Primary contigs, with a 6-base first read.
+P_CTG_TILING_PATH = """\
+000000F 000000001:E 000000002:E 000000002 6 10 100 99.5
+000000F 000000002:E 000000003:E 000000003 10 14 100 99.5
+000001F 000000004:E 000000005:E 000000005 6 10 100 99.5
+"""
+P_CTG_FASTA = '>000000F\nACGTACGTACGTAC\n>000001F\nTTTTTTTTTT\n'
+
+# 1-hasm haplotigs: two in phase block 1 of 000000F, one in 000001F.
+HASM_TILING_PATH = """\
+000000F 000000011:E 000000012:E 000000012 6 10 100 99.0
+000000F 000000012:E 000000013:E 000000013 10 14 100 99.0
+000001F 000000021:B 000000022:B 000000022 4 0 100 98.0
+000002F 000000031:E 000000032:E 000000032 6 10 100 97.0
+"""
+HASM_P_CTG_FASTA = '>000000F\nACGTACGTACGTAC\n>000001F\nCCCCCCCCCC\n>000002F\nGGGGGGGGGG\n'
+RID_TO_PHASE = """\
+000000011 000000F 1 0
+000000012 000000F 1 0
+000000013 000000F 1 0
+000000021 000000F 1 1
+000000022 000000F 1 1
+000000031 000001F 2 0
+000000032 000001F 2 0
+"""
+
+# The reverse of each haplotig edge (one TR), and some others.
+SG_EDGES_LIST = """\
+000000011:E 000000012:E 000000012 6 10 100 99.0 G
+000000012:B 000000011:B 000000011 4 0 100 99.0 G
+000000013:B 000000012:B 000000012 4 0 100 99.0 TR
+000000022:E 000000021:E 000000021 6 10 100 98.0 G
+000000032:B 000000031:B 000000031 4 0 100 97.0 G
+000000001:E 000000002:E 000000002 6 10 100 99.5 G
+"""
+
+
+def define_bundle_globals(tmpdir):
+    """Write the inputs of define_globals, and call it."""
+    from falcon_unzip import sg_edges_list
+    fc_asm = tmpdir.mkdir('2-asm-falcon')
+    fc_asm.join('p_ctg_tiling_path').write(P_CTG_TILING_PATH)
+    fc_asm.join('p_ctg.fasta').write(P_CTG_FASTA)
+    fc_hasm = tmpdir.mkdir('1-hasm')
+    fc_hasm.join('p_ctg_tiling_path').write(HASM_TILING_PATH)
+    fc_hasm.join('p_ctg.fasta').write(HASM_P_CTG_FASTA)
+    fc_hasm.join('sg_edges_list').write(SG_EDGES_LIST)
+    sg_edges_list.write_binary(str(fc_hasm.join('sg_edges_list.bin')),
+                               sg_edges_list.load(str(fc_hasm.join('sg_edges_list'))))
+    tmpdir.join('rid_to_phase.all').write(RID_TO_PHASE)
+    args = lambda: None # for attribute storage
+    args.fc_asm_path = str(fc_asm)
+    args.fc_hasm_path = str(fc_hasm)
+    args.base_dir = str(tmpdir)
+    args.fasta = str(tmpdir.join('preads4falcon.fasta'))
+    args.rid_phase_map = str(tmpdir.join('rid_to_phase.all'))
+    mod.define_globals(args)
+
+
+def test_write_and_load_bundle(tmpdir):
+    define_bundle_globals(tmpdir)
+    bundle_dir = str(tmpdir.join('bundles', '000000F'))
+    mod.write_bundle(bundle_dir, '000000F')
+
+    bundle = mod.io.deserialize(os.path.join(bundle_dir, mod.BUNDLE_FN))
+    assert bundle['p_ctg_seq'] == 'ACGTACGTACGTAC'
+    # Only the tiling path of this contig, and only its haplotigs.
+    assert bundle['p_ctg_tiling_path'] == [line.split() for line in P_CTG_TILING_PATH.splitlines()[:2]]
+    assert [htig['name'] for htig in bundle['snp_haplotigs']] == [
+        '000000F-HAP000000F-000000F.1.0', '000000F-HAP000001F-000000F.1.1']
+    htig = bundle['snp_haplotigs'][1]
+    assert htig['phase'] == ['000000F', 1, 1]
+    assert htig['seq'] == 'CCCCCCCCCC'
+    assert htig['path'] == [HASM_TILING_PATH.splitlines()[2].split()]
+
+    p_ctg_seq, p_ctg_tiling_path, snp_haplotigs, sg_edges = mod.load_bundle(bundle_dir, '000000F')
+    assert p_ctg_seq == 'ACGTACGTACGTAC'
+    assert p_ctg_tiling_path.dump_as_split_lines() == mod.p_ctg_tiling_paths['000000F'].dump_as_split_lines()
+    expected = mod.all_haplotigs_for_ctg['000000F']
+    assert list(snp_haplotigs) == list(expected)
+    for name, htig in snp_haplotigs.items():
+        assert htig.__dict__ == expected[name].__dict__
+        assert isinstance(htig.phase, tuple)
+    # Just the reverse edges of the haplotig paths (TR included), which reverse them as all the edges do.
+    assert len(sg_edges) == 3
+    assert ('000000012:B', '000000011:B') in sg_edges
+    assert ('000000013:B', '000000012:B') in sg_edges
+    assert ('000000011:E', '000000012:E') not in sg_edges
+    for htig in snp_haplotigs.values():
+        assert mod.reverse_sg_path(htig.path, sg_edges) == mod.reverse_sg_path(htig.path, mod.sg_edges)
+    assert mod.reverse_sg_path(snp_haplotigs['000000F-HAP000000F-000000F.1.0'].path, sg_edges) == [
+        ['000000F', '000000013:B', '000000012:B', '000000012', '4', '0', '100', '99.0'],
+        ['000000F', '000000012:B', '000000011:B', '000000011', '4', '0', '100', '99.0']]
+
+
+def test_apply_from_bundles(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    define_bundle_globals(tmpdir)
+
+    def fake_generate_haplotigs_for_ctg(ctg_id, p_ctg_seq, p_ctg_tiling_path, sg_edges,
+                                        snp_haplotigs, allow_multiple_primaries, out_dir,
+                                        proto_dir, min_query_span, min_target_span, logger):
+        """Write the inputs (and the reversed haplotig paths) instead of the haplotigs."""
+        with open(os.path.join(out_dir, 'h_ctg.{}.fasta'.format(ctg_id)), 'w') as stream:
+            stream.write(json.dumps([ctg_id, p_ctg_seq, p_ctg_tiling_path.dump_as_split_lines(),
+                                     [(name, htig.__dict__, mod.reverse_sg_path(htig.path, sg_edges))
+                                      for name, htig in snp_haplotigs.items()],
+                                     proto_dir, min_query_span, min_target_span]))
+    monkeypatch.setattr(mod, 'generate_haplotigs_for_ctg', fake_generate_haplotigs_for_ctg)
+
+    # The old path, from the globals of define_globals.
+    expected = {}
+    uows = []
+    for ctg_id in ['000000F', '000001F']:
+        out_dir = str(tmpdir.mkdir('expected-{}'.format(ctg_id)))
+        fake_generate_haplotigs_for_ctg(
+                ctg_id, mod.falcon_p_ctg_fa_obj.fetch(ctg_id), mod.p_ctg_tiling_paths[ctg_id], mod.sg_edges,
+                mod.all_haplotigs_for_ctg.get(ctg_id, {}), False, out_dir, 'proto', 100, 200, None)
+        expected[ctg_id] = open(os.path.join(out_dir, 'h_ctg.{}.fasta'.format(ctg_id))).read()
+        bundle_dir = str(tmpdir.join('bundles', ctg_id))
+        mod.write_bundle(bundle_dir, ctg_id)
+        uows.append(dict(input=dict(base_dir=str(tmpdir), bundle_dir=bundle_dir),
+                         params=dict(ctg_id=ctg_id, proto_dir='proto')))
+    assert '000000F-HAP000000F' in expected['000000F'] and '[]' in expected['000001F']
+
+    # Apply needs only the bundles.
+    for name in ['all_rid_to_phase', 'all_flat_rid_to_phase', 'all_haplotigs_for_ctg', 'sg_edges',
+                 'p_ctg_tiling_paths', 'falcon_p_ctg_fa_obj']:
+        monkeypatch.setattr(mod, name, None)
+    mod.io.serialize('uows.json', uows)
+    mod.main(['prog', 'apply', '--units-of-work-fn', 'uows.json', '--results-fn', 'results.json',
+              '--min-query-span', '100', '--min-target-span', '200'])
+    results = mod.io.deserialize('results.json')
+    assert [result['ctg_id'] for result in results] == ['000000F', '000001F']
+    for result in results:
+        assert open(result['h_ctg']).read() == expected[result['ctg_id']]
@@ -0,0 +1,77 @@
+import falcon_unzip.mains.hasm_buckets as mod
+import falcon_unzip.io as mod_io
+import falcon_unzip.sg_edges_list as sg_edges_list
+import io
+import os
+
+
+def chain(rids, ctg_id):
+    """Return the p_ovl lines of reads overlapping each next one by half."""
+    phase = '{}.1.0'.format(ctg_id)
+    lines = []
+    for a, b in zip(rids, rids[1:]):
+        lines.append('{:09d} {:09d} -5000 99.00 0 5000 10000 10000 0 0 5000 10000 overlap {} {}\n'.format(
+            a, b, phase, phase))
+        lines.append('{:09d} {:09d} -5000 99.00 0 0 5000 10000 0 5000 10000 10000 overlap {} {}\n'.format(
+            b, a, phase, phase))
+    return ''.join(lines)
+
+
+def test_merge_ctg_paths(tmpdir):
+    fn0 = tmpdir.join('0.ctg_paths')
+    fn0.write("""\
+000000F ctg_linear a
+000000R ctg_linear b
+000001F ctg_linear c
+""")
+    fn1 = tmpdir.join('1.ctg_paths')
+    fn1.write("""\
+     0 ctg_circular d
+000001F ctg_linear e
+000001R ctg_linear f
+""")
+    out = io.StringIO()
+    assert mod.merge_ctg_paths([str(fn0), str(fn1)], out) == 4
+    assert out.getvalue() == """\
+000000F ctg_linear a
+000000R ctg_linear b
+000001F ctg_linear c
+     2 ctg_circular d
+000003F ctg_linear e
+000003R ctg_linear f
+"""
+
+
+def test_split_apply_merge(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    buckets = {'000001F': '000001F/preads.p_ovl', '000000F': '000000F/preads.p_ovl'}
+    tmpdir.mkdir('buckets')
+    for ctg_id, rids in (('000000F', [1, 2, 3, 4]), ('000001F', [11, 12, 13])):
+        tmpdir.mkdir('buckets', ctg_id).join('preads.p_ovl').write(chain(rids, ctg_id))
+    mod_io.serialize('buckets/buckets.json', buckets)
+
+    mod.main(['prog', 'split', '--buckets-fn', 'buckets/buckets.json',
+              '--split-fn', 'split.json', '--bash-template-fn', 'template.sh'])
+    uows = mod_io.deserialize('split.json')
+    assert [uow['wildcards']['chunk_id'] for uow in uows] == ['chunk_000000F', 'chunk_000001F']
+
+    # Apply in reverse order, as separate chunks would be gathered in any order.
+    for i, uow in enumerate(reversed(uows)):
+        mod_io.serialize('uow{}.json'.format(i), [uow])
+        mod.main(['prog', 'apply', '--units-of-work-fn', 'uow{}.json'.format(i),
+                  '--results-fn', 'result{}.json'.format(i)])
+    mod_io.serialize('results.json', mod_io.deserialize('result0.json') + mod_io.deserialize('result1.json'))
+
+    mod.main(['prog', 'merge', '--results-fn', 'results.json'])
+    ctg_paths = [line.split() for line in tmpdir.join('ctg_paths').read().splitlines()]
+    # The contigs of 000001F are numbered after those of 000000F. (Which reads a path skips may vary.)
+    assert [(ctg_id, sorted(set(int(node[:9]) // 10 for node in path.split('~'))))
+            for ctg_id, _, path, _, _, _, _ in ctg_paths] == [
+        ('000000F', [0]), ('000000R', [0]), ('000001F', [1]), ('000001R', [1])]
+    for fn in mod.GRAPH_FNS:
+        expected = ''.join(tmpdir.join('uow-{}'.format(ctg_id), fn).read() for ctg_id in ['000000F', '000001F'])
+        assert tmpdir.join(fn).read() == expected
+    # The merged binary sg_edges_list exports the merged text.
+    stream = io.StringIO()
+    sg_edges_list.write_text(sg_edges_list.load(str(tmpdir.join(mod.SG_EDGES_BIN_FN))), stream)
+    assert stream.getvalue() == tmpdir.join('sg_edges_list').read()
@@ -9,9 +9,13 @@ import pytest
     'get_read2ctg',
     'get_read_hctg_map',
     'graphs_to_h_tigs_2',
+    'hasm_buckets',
     'ovlp_filter_with_phase',
     'phased_ovlp_to_graph',
+    'phasing_convert_rid_to_phase',
+    'phasing_gather',
     'phasing_readmap',
+    'phasing_run',
     'rr_hctg_track',
     'start_unzip',
 
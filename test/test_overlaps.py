@@ -0,0 +1,108 @@
+import falcon_unzip.overlaps as mod
+from helpers import (write_db, write_las)
+import numpy as np
+import os
+import pytest
+
+
+# Read lengths, by DAZZ_DB read id.
+LENGTHS = [10000, 10000, 10000, 10000, 10000, 10000, 3000]
+
+# Proper overlaps, as 'LA4Falcon -mo' prints them.
+M4 = """\
+000000001 000000002 -5000 99.00 0 5000 10000 10000 0 0 5000 10000 overlap
+000000001 000000003 -5000 99.00 0 5000 10000 10000 0 0 5000 10000 overlap
+000000001 000000004 -4000 98.50 0 0 4000 10000 1 0 4000 10000 overlap
+000000001 000000005 -4000 98.50 0 0 4000 10000 0 6000 10000 10000 overlap
+000000001 000000006 -3000 99.00 0 2000 5000 10000 0 0 3000 3000 contains
+000000002 000000001 -5000 99.00 0 0 5000 10000 0 5000 10000 10000 overlap
+000000002 000000004 -3000 89.00 0 7000 10000 10000 0 0 3000 10000 overlap
+000000004 000000001 -4000 98.50 0 0 4000 10000 1 0 4000 10000 overlap
+000000004 000000006 -3000 100.00 0 1000 4000 10000 1 0 3000 3000 contains
+000000006 000000001 -3000 99.00 0 0 3000 3000 0 2000 5000 10000 contained
+"""
+
+# A local alignment, which only 'LA4Falcon -m' (without -o) prints.
+M4_LOCAL = '000000002 000000003 -3000 99.00 0 2000 5000 10000 0 1000 4000 10000 overlap'
+
+
+def test_parse_m4():
+    lines = M4.splitlines()
+    ovls = mod.parse_m4(lines)
+    assert len(ovls) == 10
+    assert ovls['q_id'].tolist() == [1, 1, 1, 1, 1, 2, 2, 4, 4, 6]
+    assert [' '.join(mod.format_m4(ovl)) for ovl in ovls] == lines
+    with pytest.raises(Exception) as excinfo:
+        mod.parse_m4(['000000001 000000002 -5000 99.00 0 0 5000 10000 0 0 5000 10000 ovrlap'])
+    assert 'ovrlap' in str(excinfo.value)
+
+
+def test_cache(tmpdir):
+    ovls = mod.parse_m4(M4.splitlines())
+    fn = str(tmpdir.join('a.npy'))
+    mod.write_cache(fn, ovls)
+    assert os.listdir(str(tmpdir)) == ['a.npy']
+    got = mod.load_cache(fn)
+    assert got.tolist() == ovls.tolist()
+
+
+@pytest.mark.parametrize('tspace', [100, 500])
+def test_read_las(tmpdir, tspace):
+    db_fn = str(tmpdir.join('preads.db'))
+    las_fn = str(tmpdir.join('preads.1.las'))
+    write_db(db_fn, LENGTHS)
+    lines = M4.splitlines()
+    write_las(las_fn, lines[:6] + [M4_LOCAL] + lines[6:], LENGTHS, tspace)
+
+    assert mod.read_las(db_fn, las_fn).tolist() == mod.parse_m4(lines).tolist()
+    got = mod.read_las(db_fn, las_fn, proper_only=False)
+    assert [' '.join(mod.format_m4(ovl)) for ovl in got] == lines[:6] + [M4_LOCAL] + lines[6:]
+
+    # A truncated file is an error.
+    with open(las_fn, 'rb') as stream:
+        data = stream.read()
+    with open(las_fn, 'wb') as stream:
+        stream.write(data[:-1])
+    with pytest.raises(Exception) as excinfo:
+        mod.read_las(db_fn, las_fn)
+    assert 'Expected 11 overlaps' in str(excinfo.value)
+
+
+def test_read_las_empty(tmpdir):
+    db_fn = str(tmpdir.join('preads.db'))
+    las_fn = str(tmpdir.join('preads.1.las'))
+    write_db(db_fn, LENGTHS)
+    write_las(las_fn, [], LENGTHS)
+    assert len(mod.read_las(db_fn, las_fn)) == 0
+
+
+def test_read_db_lengths(tmpdir):
+    db_fn = str(tmpdir.join('raw_reads.db'))
+    write_db(db_fn, LENGTHS)
+    assert mod.get_db_idx_fn(db_fn) == str(tmpdir.join('.raw_reads.idx'))
+    assert mod.read_db_lengths(db_fn).tolist() == LENGTHS
+
+    # Trimmed, as by 'DBsplit -x5000' (without -a, so only the best read of each well).
+    write_db(db_fn, [100, 6000, 7000, 8000], cutoff=5000, allarr=0, flags=[mod.DB_BEST, mod.DB_BEST, 0, mod.DB_BEST])
+    assert mod.read_db_lengths(db_fn).tolist() == [6000, 8000]
+    write_db(db_fn, [100, 6000, 7000, 8000], cutoff=5000, allarr=1, flags=[mod.DB_BEST, mod.DB_BEST, 0, mod.DB_BEST])
+    assert mod.read_db_lengths(db_fn).tolist() == [6000, 7000, 8000]
+
+
+def test_format_idt():
+    acc = np.array([99.0, 98.5, 95.125, 95.135, 100 - 200.0 * 7 / 999, 89.994999])
+    assert mod.format_idt(acc).tolist() == [np.float32(float('%.2f' % a)) for a in acc.tolist()]
+
+
+def test_decode_las_check(tmpdir, monkeypatch):
+    db_fn = str(tmpdir.join('preads.db'))
+    las_fn = str(tmpdir.join('preads.1.las'))
+    write_db(db_fn, LENGTHS)
+    write_las(las_fn, M4.splitlines(), LENGTHS)
+    m4 = M4
+    monkeypatch.setattr(mod, 'run_la4falcon', lambda db_fn, las_fn, proper_only: mod.parse_m4(m4.splitlines()))
+    assert len(mod.decode_las(db_fn, las_fn, reader='check')) == 10
+    m4 = M4.replace('99.00', '99.01', 1)
+    with pytest.raises(Exception) as excinfo:
+        mod.decode_las(db_fn, las_fn, reader='check')
+    assert 'does not match LA4Falcon' in str(excinfo.value)
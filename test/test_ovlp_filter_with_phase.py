@@ -0,0 +1,161 @@
+import falcon_unzip.mains.ovlp_filter_with_phase as mod
+import falcon_unzip.io as mod_io
+import falcon_unzip.overlaps as mod_ovl
+import falcon_unzip.rid_to_phase as mod_rid_to_phase
+from helpers import (write_db, write_las)
+import os
+import pytest
+
+
+RID_TO_PHASE = """\
+000000001 000000F 1000001 0
+000000002 000000F 1000001 0
+000000003 000000F 1000001 1
+000000004 000000F -1 0
+000000005 000001F -1 0
+000000006 000000F -1 0
+"""
+
+LENGTHS = [10000, 10000, 10000, 10000, 10000, 10000, 3000]
+
+LAS = {
+    'a.las': """\
+000000001 000000002 -5000 99.00 0 5000 10000 10000 0 0 5000 10000 overlap
+000000001 000000003 -5000 99.00 0 5000 10000 10000 0 0 5000 10000 overlap
+000000001 000000004 -4000 98.50 0 0 4000 10000 1 0 4000 10000 overlap
+000000001 000000005 -4000 98.50 0 0 4000 10000 0 6000 10000 10000 overlap
+000000001 000000006 -3000 99.00 0 2000 5000 10000 0 0 3000 3000 contains
+000000002 000000001 -5000 99.00 0 0 5000 10000 0 5000 10000 10000 overlap
+000000002 000000004 -3000 89.00 0 7000 10000 10000 0 0 3000 10000 overlap
+""",
+    'b.las': """\
+000000004 000000001 -4000 98.50 0 0 4000 10000 1 0 4000 10000 overlap
+000000004 000000006 -3000 100.00 0 1000 4000 10000 1 0 3000 3000 contains
+000000006 000000001 -3000 99.00 0 0 3000 3000 0 2000 5000 10000 contained
+""",
+}
+
+EXPECTED = """\
+000000001 000000004 -4000 98.50 0 0 4000 10000 1 0 4000 10000 overlap 000000F.1000001.0 000000F.-1.0
+000000001 000000002 -5000 99.00 0 5000 10000 10000 0 0 5000 10000 overlap 000000F.1000001.0 000000F.1000001.0
+000000002 000000001 -5000 99.00 0 0 5000 10000 0 5000 10000 10000 overlap 000000F.1000001.0 000000F.1000001.0
+000000004 000000001 -4000 98.50 0 0 4000 10000 1 0 4000 10000 overlap 000000F.-1.0 000000F.1000001.0
+"""
+
+
+def write_inputs(tmpdir):
+    """Write the LAS files and DB, plus a fake LA4Falcon which cats the text
+    of the LAS files and logs its calls.
+    """
+    bin_dir = tmpdir.mkdir('bin')
+    la4falcon = bin_dir.join('LA4Falcon')
+    la4falcon.write('#!/bin/sh\necho "$3" >> {}\ncat "$3.txt"\n'.format(tmpdir.join('calls')))
+    la4falcon.chmod(0o755)
+    las_fns = []
+    for name, text in sorted(LAS.items()):
+        write_las(str(tmpdir.join(name)), text.splitlines(), LENGTHS)
+        tmpdir.join(name + '.txt').write(text)
+        las_fns.append(str(tmpdir.join(name)))
+    tmpdir.join('las.fofn').write('\n'.join(las_fns) + '\n')
+    write_db(str(tmpdir.join('preads.db')), LENGTHS)
+    tmpdir.join('rid_to_phase.all').write(RID_TO_PHASE)
+    mod_rid_to_phase.write_binary(str(tmpdir.join('rid_to_phase.bin')),
+                                  mod_rid_to_phase.load_text(str(tmpdir.join('rid_to_phase.all'))))
+    return str(bin_dir)
+
+
+@pytest.mark.parametrize('las_reader, rid_phase_map', [
+    ('direct', 'rid_to_phase.all'),
+    ('la4falcon', 'rid_to_phase.all'),
+    ('direct', 'rid_to_phase.bin'),
+])
+def test_main(tmpdir, monkeypatch, capsys, las_reader, rid_phase_map):
+    bin_dir = write_inputs(tmpdir)
+    monkeypatch.setenv('PATH', bin_dir + os.pathsep + os.environ['PATH'])
+    monkeypatch.chdir(str(tmpdir))
+    monkeypatch.setattr(mod, 'arid2phase', mod.arid2phase)
+    argv = ['prog',
+            '--fofn', 'las.fofn', '--db', 'preads.db', '--rid-phase-map', rid_phase_map,
+            '--max-diff', '120', '--max-cov', '120', '--min-cov', '1', '--n-core', '1',
+            '--cache-dir', 'cache', '--las-reader', las_reader,
+            ]
+    mod.main(argv)
+    # Read 6 is contained, so its overlaps were dropped, as was the low-identity 2-4.
+    assert capsys.readouterr().out == EXPECTED
+
+    # Each LAS was decoded once, and its cache kept.
+    if las_reader == 'la4falcon':
+        assert sorted(os.path.basename(l) for l in tmpdir.join('calls').read().split()) == ['a.las', 'b.las']
+    else:
+        assert not tmpdir.join('calls').exists()
+    assert sorted(os.listdir('cache')) == ['000000.a.las.npy', '000000.a.las.p_ovl',
+                                           '000001.b.las.npy', '000001.b.las.p_ovl',
+                                           'contained.bitmap.npy', 'ignore.bitmap.npy']
+    # stdout is the shards, in the order of the fofn.
+    assert ''.join(tmpdir.join('cache', fn).read() for fn in ['000000.a.las.p_ovl', '000001.b.las.p_ovl']) == EXPECTED
+    # Read 6 is contained in read 1.
+    contained = mod.load_id_bitmap(os.path.join('cache', 'contained.bitmap.npy'))
+    assert mod.is_in(range(8), contained).tolist() == [False] * 6 + [True, False]
+    # Only overlaps within a contig, and not across the phases of a block, are cached.
+    cached = mod_ovl.load_cache(os.path.join('cache', '000000.a.las.npy'))
+    assert list(zip(cached['q_id'].tolist(), cached['t_id'].tolist())) == [(1, 2), (1, 4), (1, 6), (2, 1), (2, 4)]
+
+
+def test_main_bucket_dir(tmpdir, monkeypatch, capsys):
+    bin_dir = write_inputs(tmpdir)
+    monkeypatch.setenv('PATH', bin_dir + os.pathsep + os.environ['PATH'])
+    monkeypatch.chdir(str(tmpdir))
+    monkeypatch.setattr(mod, 'arid2phase', mod.arid2phase)
+    argv = ['prog',
+            '--fofn', 'las.fofn', '--db', 'preads.db', '--rid-phase-map', 'rid_to_phase.bin',
+            '--max-diff', '120', '--max-cov', '120', '--min-cov', '1', '--n-core', '1',
+            '--bucket-dir', 'buckets',
+            ]
+    mod.main(argv)
+    assert capsys.readouterr().out == ''
+    # Read 5, alone on 000001F, has no overlaps within its contig.
+    assert mod_io.deserialize(os.path.join('buckets', 'buckets.json')) == {'000000F': '000000F/preads.p_ovl'}
+    assert tmpdir.join('buckets', '000000F', 'preads.p_ovl').read() == EXPECTED
+
+
+# Overlaps on the 5' end of read 1, then one on its 3' end.
+STAGE3_M4 = """\
+000000001 000000002 -5000 99.50 0 0 5000 10000 0 5000 10000 10000 overlap
+000000001 000000002 -5000 100.00 0 0 5000 10000 0 5000 10000 10000 overlap
+000000001 000000004 -6000 99.00 0 0 6000 10000 0 4000 10000 10000 overlap
+000000001 000000005 -4000 99.00 0 0 4000 10000 0 6000 10000 10000 overlap
+000000001 000000006 -7000 99.00 0 0 7000 10000 0 3000 10000 10000 overlap
+000000001 000000005 -3000 99.00 0 7000 10000 10000 0 0 3000 10000 overlap
+"""
+
+
+def test_filter_stage3(tmpdir, monkeypatch):
+    monkeypatch.setattr(mod, 'arid2phase', mod_rid_to_phase.from_rows(
+        [(rid, '000000F', 1, 0) for rid in range(1, 6)] + [(6, '000000F', 2, 1)]))
+    cache_fn = str(tmpdir.join('a.npy'))
+    mod_ovl.write_cache(cache_fn, mod_ovl.parse_m4(STAGE3_M4.splitlines()))
+    empty_fn = str(tmpdir.join('empty.bitmap.npy'))
+    mod.write_id_bitmap(empty_fn, set())
+    out_fn = str(tmpdir.join('a.p_ovl'))
+    assert mod.filter_stage3(('a.las', cache_fn, empty_fn, empty_fn, out_fn, 2500, 2, 0, False)) == ('a.las', 4, [])
+    got = [l.split() for l in open(out_fn).read().splitlines()]
+    lines = STAGE3_M4.splitlines()
+    # In phase first, then longest, then least overhang, then by the text of the line
+    # ('100.00' < '99.50'). Past bestn, we stop after the first overhang of more than 1000.
+    assert [' '.join(l[:13]) for l in got] == [lines[2], lines[1], lines[0], lines[5]]
+    assert got[0][13:] == ['000000F.1.0', '000000F.1.0']
+
+    # By contig, the same lines, all of read 1, on 000000F.
+    text = open(out_fn).read()
+    assert mod.filter_stage3(('a.las', cache_fn, empty_fn, empty_fn, out_fn, 2500, 2, 0, True)) == (
+        'a.las', 4, [['000000F', len(text)]])
+    assert open(out_fn).read() == text
+
+
+def test_id_bitmap(tmpdir):
+    fn = str(tmpdir.join('ids.bitmap.npy'))
+    ids = set([0, 3, 8, 9, 17])
+    mod.write_id_bitmap(fn, ids)
+    bitmap = mod.load_id_bitmap(fn)
+    assert len(bitmap) == 3
+    assert mod.is_in(range(100), bitmap).tolist() == [i in ids for i in range(100)]
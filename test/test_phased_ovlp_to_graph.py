@@ -0,0 +1,209 @@
+import falcon_unzip.mains.phased_ovlp_to_graph as mod
+import falcon_unzip.sg_edges_list as mod_sg_edges_list
+import io
+import numpy as np
+
+
+# Reads 1, 2, 3 tile forward, 3000 apart, so 1-3 is transitive.
+# Read 4 is in the other phase of the block.
+P_OVL = """\
+000000001 000000002 -7000 99.00 0 3000 10000 10000 0 0 7000 10000 overlap 000000F.1.0 000000F.1.0
+000000001 000000003 -4000 99.00 0 6000 10000 10000 0 0 4000 10000 overlap 000000F.1.0 000000F.1.0
+000000001 000000004 -5000 99.00 0 5000 10000 10000 0 0 5000 10000 overlap 000000F.1.0 000000F.1.1
+000000002 000000001 -7000 99.00 0 0 7000 10000 0 3000 10000 10000 overlap 000000F.1.0 000000F.1.0
+000000002 000000003 -7000 99.50 0 3000 10000 10000 0 0 7000 10000 overlap 000000F.1.0 000000F.1.0
+"""
+
+# The edges in the order added, then those across phases.
+SG_EDGES_LIST = """\
+000000002:B 000000001:B 000000001 3000 0 7000 99.0 G
+000000001:E 000000002:E 000000002 7000 10000 7000 99.0 G
+000000003:B 000000001:B 000000001 6000 0 4000 99.0 TR
+000000001:E 000000003:E 000000003 4000 10000 4000 99.0 TR
+000000003:B 000000002:B 000000002 3000 0 7000 99.5 G
+000000002:E 000000003:E 000000003 7000 10000 7000 99.5 G
+000000004:B 000000001:B 000000001 5000 0 5000 99.0 CP
+000000001:E 000000004:E 000000004 5000 10000 5000 99.0 CP
+"""
+
+
+def test_main(tmpdir, monkeypatch):
+    monkeypatch.chdir(str(tmpdir))
+    tmpdir.join('preads.p_ovl').write(P_OVL)
+    mod.main(['prog', 'preads.p_ovl', '--min-len', '2500'])
+    assert tmpdir.join('sg_edges_list').read() == SG_EDGES_LIST
+    table = mod_sg_edges_list.load(str(tmpdir.join('sg_edges_list.bin')))
+    assert table[('000000001:E', '000000003:E')][7] == 'TR'
+    out = io.StringIO()
+    mod_sg_edges_list.write_text(table, out)
+    assert out.getvalue() == SG_EDGES_LIST
+    # One contig, in either direction.
+    ctg_paths = sorted(line.split()[1:] for line in tmpdir.join('ctg_paths').read().splitlines())
+    assert ctg_paths == [
+        ['ctg_linear', '000000001:E~000000002:E~000000003:E', '000000003:E', '6000', '14000',
+         '000000001:E~000000002:E~000000003:E'],
+        ['ctg_linear', '000000003:B~000000002:B~000000001:B', '000000001:B', '6000', '14000',
+         '000000003:B~000000002:B~000000001:B'],
+    ]
+
+
+# Read 5 is contained in read 1, read 6 overlaps read 3 in reverse, and the rest are skipped.
+P_OVL_MORE = """\
+000000005 000000001 -3000 99.00 0 0 3000 3000 0 1000 4000 10000 contained 000000F.1.0 000000F.1.0
+000000003 000000005 -2000 99.00 0 8000 10000 10000 0 0 2000 3000 overlap 000000F.1.0 000000F.1.0
+000000003 000000006 -5000 99.00 0 5000 10000 10000 1 5000 10000 10000 overlap 000000F.1.0 000000F.1.0
+000000003 000000007 -5000 99.00 0 5000 10000 10000 0 0 5000 10000 none 000000F.1.0 000000F.1.0
+000000003 000000007 -5000 90.00 0 5000 10000 10000 0 0 5000 10000 overlap 000000F.1.0 000000F.1.0
+000000003 000000003 -5000 99.00 0 5000 10000 10000 0 0 5000 10000 overlap 000000F.1.0 000000F.1.0
+000000006 000000003 -5000 99.00 1 0 5000 10000 0 5000 10000 10000 overlap 000000F.1.0 000000F.1.0
+"""
+
+
+def test_load_overlaps(tmpdir):
+    tmpdir.join('preads.p_ovl').write(P_OVL + P_OVL_MORE)
+    overlaps, read_names = mod.load_overlaps(str(tmpdir.join('preads.p_ovl')), 96, 2500)
+    assert [(read_names[o['f']], read_names[o['g']]) for o in overlaps] == [
+        ('000000001', '000000002'), ('000000001', '000000003'), ('000000001', '000000004'),
+        ('000000002', '000000003'), ('000000003', '000000006')]
+    # g ahead of f, forward: (f.E, g.E) along g to its end.
+    assert overlaps[['ahead', 'forward', 'b1', 'e1', 'b2', 'e2']][0].tolist() == (True, True, 3000, 0, 7000, 10000)
+    # in reverse: (f.E, g.B) along g to its begin.
+    assert overlaps[['ahead', 'forward', 'b1', 'e1', 'b2', 'e2']][4].tolist() == (True, False, 5000, 0, 5000, 0)
+
+
+def add_pair(sg, v, w, length, score, phase=(0, 0)):
+    """Add edge (v, w) and its reverse."""
+    sg.add_edge(v, w, label=(w >> 1, 0, length), length=length, score=score, identity=99.0, phase=phase)
+    sg.add_edge(w ^ 1, v ^ 1, label=(v >> 1, 0, length), length=length, score=score, identity=99.0,
+                phase=phase[::-1])
+
+
+def test_string_graph():
+    sg = mod.StringGraph()
+    for name in ['a', 'b', 'c', 'd']:
+        sg.add_read(name)
+    assert sg.add_read('c') == 2
+    a, b, c, d = 0, 2, 4, 6  # the B ends
+    add_pair(sg, a, c, 6000, 4000)
+    add_pair(sg, a, b, 3000, 7000)
+    add_pair(sg, b, c, 3000, 7000)
+    add_pair(sg, a, d, 5000, 5000, phase=(0, 1))
+    assert sg.remove_cross_phase_edges().tolist() == [6, 7]
+    sg.init_reduce_dict()
+
+    assert sg.node_name(b ^ 1) == 'b:E'
+    assert sg.node_id('b:E') == 3
+    assert sg.rev[:6].tolist() == [1, 0, 3, 2, 5, 4]
+    # Out-edges by length.
+    assert sg.out_edge[sg.out_ptr[a]:sg.out_ptr[a + 1]].tolist() == [2, 0]
+    assert sg.find_edge(a, c) == 0
+    assert sg.out_degrees().tolist() == [2, 0, 1, 1, 0, 2, 0, 0]
+
+    sg.mark_tr_edges()
+    assert np.flatnonzero(sg.e_reduce).tolist() == [0, 1]
+    assert sg.get_out_edges_for_node(a).tolist() == [2]
+    assert sg.out_degrees(reduced=False).tolist() == [1, 0, 1, 1, 0, 1, 0, 0]
+    assert sg.mark_best_overlap().tolist() == []
+    assert sg.mark_spur_edge().tolist() == []
+
+
+def test_mark_best_overlap():
+    sg = mod.StringGraph()
+    for name in ['a', 'b', 'c', 'd']:
+        sg.add_read(name)
+    a, b, c, d = 0, 2, 4, 6
+    # a-c is neither the best out-edge of a nor the best in-edge of c.
+    add_pair(sg, a, b, 3000, 8000)
+    add_pair(sg, a, c, 4000, 4000)
+    add_pair(sg, d, c, 3000, 9000)
+    sg.remove_cross_phase_edges()
+    sg.init_reduce_dict()
+    assert sg.get_best_out_edge_for_node(a) == 0
+    assert sg.mark_best_overlap().tolist() == [2, 3]
+    assert sg.get_in_edges_for_node(c).tolist() == [4]
+
+
+def test_mark_tr_edges():
+    sg = mod.StringGraph()
+    for name in ['n', 'w', 'x', 'y']:
+        sg.add_read(name)
+    n, w, x, y = 0, 2, 4, 6
+    add_pair(sg, n, w, 1000, 9000)
+    add_pair(sg, n, x, 1200, 9000)
+    add_pair(sg, n, y, 1300, 9000)
+    # n-w-x is much longer than n-x, but x is the nearest out-neighbor of w.
+    add_pair(sg, w, x, 5000, 5000)
+    # n-w-y is too, but in reverse n^1 is the nearest out-neighbor of w^1, so y^1-n^1 goes.
+    add_pair(sg, w, y, 6000, 4000)
+    sg.remove_cross_phase_edges()
+    sg.init_reduce_dict()
+    sg.mark_tr_edges()
+    assert np.flatnonzero(sg.e_reduce).tolist() == [2, 3, 4, 5]
+
+
+def random_graph(n_reads, n_pairs, seed):
+    rng = np.random.RandomState(seed)
+    sg = mod.StringGraph()
+    for i in range(n_reads):
+        sg.add_read('%09d' % i)
+    pairs = set()
+    while len(pairs) < n_pairs:
+        v, w = rng.randint(2 * n_reads, size=2)
+        if v >> 1 != w >> 1 and (v, w) not in pairs and (w ^ 1, v ^ 1) not in pairs:
+            pairs.add((v, w))
+    for v, w in sorted(pairs):
+        add_pair(sg, int(v), int(w), int(rng.randint(100, 3000)), int(rng.randint(1000, 9000)))
+    sg.remove_cross_phase_edges()
+    sg.init_reduce_dict()
+    return sg
+
+
+def test_mark_tr_edges_parallel():
+    serial = random_graph(200, 1500, 1)
+    serial.mark_tr_edges()
+    parallel = random_graph(200, 1500, 1)
+    parallel.mark_tr_edges(n_core=3)
+    assert 0 < np.count_nonzero(serial.e_reduce) < len(serial.e_reduce)
+    assert parallel.e_reduce.tolist() == serial.e_reduce.tolist()
+    # The ranges cover every node, once.
+    ranges = serial._partition_nodes(7)
+    assert ranges[0][0] == 0 and ranges[-1][1] == serial.n_nodes
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+
+
+def test_unitig_graph():
+    sg = mod.StringGraph()
+    for name in ['a', 'b', 'c', 'd', 'e']:
+        sg.add_read(name)
+    a, b, c, d, e = 0, 2, 4, 6, 8
+    # A bubble a-b-d, a-c-d, then d-e.
+    add_pair(sg, a, b, 3000, 7000)
+    add_pair(sg, b, d, 3000, 7000)
+    add_pair(sg, a, c, 3500, 6500)
+    add_pair(sg, c, d, 3000, 7000)
+    add_pair(sg, d, e, 2000, 8000)
+    sg.remove_cross_phase_edges()
+    sg.init_reduce_dict()
+
+    ug = mod.construct_simple_paths(sg)
+    # Each simple path, then its reverse.
+    assert ug.keys == [(a, d, b), (d ^ 1, a ^ 1, b ^ 1), (a, d, c), (d ^ 1, a ^ 1, c ^ 1),
+                       (d, e, e), (e ^ 1, d ^ 1, e ^ 1)]
+    assert ug.path[:2] == [[a, b, d], [d ^ 1, b ^ 1, a ^ 1]]
+    assert ug.length[:2] == [6000, 6000] and ug.score[:2] == [14000, 14000]
+    assert ug.reverse(2) == 3
+    assert ug.out_edges(a) == [0, 2] and ug.in_degree(d) == 2
+    assert ug.shortest_path(a, e) == [a, d, e]
+    assert ug.bfs(a, 1) == [a, d]
+    assert ug.reached(d) and not ug.reached(e)
+    # A search to depth 2 reaches e, but not a^1, from either side.
+    ug.start_bfs(a, 2)
+    assert ug.in_reach(e) and not ug.in_reach(a ^ 1)
+    assert ug.in_edges_from(d, {a}) == [0, 2] and ug.in_edges_from(e, {a}) == []
+
+    assert mod.construct_compound_paths(ug) == {
+        (a, mod.NA, d): (2.0, 6000, 14000, [(a, d, b), (a, d, c)]),
+        (d ^ 1, mod.NA, a ^ 1): (2.0, 6000, 14000, [(d ^ 1, a ^ 1, b ^ 1), (d ^ 1, a ^ 1, c ^ 1)]),
+    }
+    ug.unlink(0)
+    assert ug.out_edges(a) == [2] and ug.in_degree(d) == 1
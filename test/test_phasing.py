@@ -1,8 +1,415 @@
-#import falcon_unzip.phasing as M
+import falcon_unzip.mains.phasing_make_het_call as mod_het
+import falcon_unzip.mains.phasing_generate_association_table as mod_atable
+import falcon_unzip.mains.phasing_get_phased_blocks as mod_blocks
+import falcon_unzip.mains.phasing_get_phased_reads as mod_reads
+import falcon_unzip.mains.phasing_run as mod_run
+import falcon_unzip.variant_map as mod_vmap
+import pysam
+import pytest
+import random
 import io
 import collections
 import os
 
 
-def test_make_het_call_map():
-    pass
+def make_diploid_bam(bam_fn, ctg_id='000000F', ref_len=30000, n_reads=120, seed=42):
+    """Write a sorted, indexed BAM of two haplotypes of a random reference,
+    with SNPs, indels, clipping, and some short or unusable alignments.
+    Return the reference sequence.
+    """
+    rng = random.Random(seed)
+    ref = ''.join(rng.choice('ACGT') for _ in range(ref_len))
+    snps = {pos: rng.choice([b for b in 'ACGT' if b != ref[pos]]) for pos in range(50, ref_len, 173)}
+    header = {'HD': {'VN': '1.0', 'SO': 'coordinate'}, 'SQ': [{'SN': ctg_id, 'LN': ref_len}]}
+    alns = []
+    for i in range(n_reads):
+        hap = i % 2
+        start = rng.randrange(0, ref_len - 1500)
+        length = min(rng.randrange(1500, 6000), ref_len - start)
+        seq = []
+        cigar = []
+        clip = rng.choice([0, 0, 30, 300])
+        if clip:
+            seq.append(''.join(rng.choice('ACGT') for _ in range(clip)))
+            cigar.append((4, clip))
+        pos = start
+        while pos < start + length:
+            run = min(rng.randrange(100, 800), start + length - pos)
+            for p in range(pos, pos + run):
+                b = snps[p] if (hap and p in snps) else ref[p]
+                if rng.random() < 0.02:
+                    b = rng.choice('ACGTN')
+                seq.append(b)
+            cigar.append((rng.choice([0, 0, 7]), run))
+            pos += run
+            if pos < start + length - 10:
+                if rng.random() < 0.5:
+                    cigar.append((1, 3))
+                    seq.append('ACG')
+                else:
+                    cigar.append((2, 2))
+                    pos += 2
+        if rng.random() < 0.2:
+            cigar.append((5, 50))
+        a = pysam.AlignedSegment()
+        a.query_name = 'read/{}/ccs'.format(i // 3)  # some names repeat
+        a.query_sequence = ''.join(seq)
+        a.flag = 0
+        a.reference_id = 0
+        a.reference_start = start
+        a.mapping_quality = 60
+        a.cigartuples = cigar
+        alns.append(a)
+    alns.sort(key=lambda a: a.reference_start)
+    unsorted_fn = bam_fn + '.unsorted.bam'
+    with pysam.AlignmentFile(unsorted_fn, 'wb', header=header) as out:
+        for a in alns:
+            out.write(a)
+    pysam.sort('-o', bam_fn, unsorted_fn)
+    pysam.index(bam_fn)
+    return ref
+
+
+def test_make_het_call_map_from_bam(tmpdir):
+    bam_fn = str(tmpdir.join('aln.bam'))
+    ref = make_diploid_bam(bam_fn)
+
+    with pysam.AlignmentFile(bam_fn, 'rb') as bam:
+        sam_lines = [a.to_string() for a in bam.fetch('000000F')]
+    vmap_text, vpos_text = io.StringIO(), io.StringIO()
+    expected_q_id_map = mod_het.make_het_call_map(ref, sam_lines, vmap_text, vpos_text)
+
+    vmap_bam, vpos_bam = io.StringIO(), io.StringIO()
+    with pysam.AlignmentFile(bam_fn, 'rb') as bam:
+        vmap_w = mod_vmap.TextWriter(vmap_bam)
+        q_id_map = mod_het.make_het_call_map_from_bam(ref, bam.fetch('000000F'), vmap_w, vpos_bam)
+        vmap_w.finish()
+
+    assert len(vpos_text.getvalue().splitlines()) > 10  # Otherwise, the test proves nothing.
+    assert vmap_text.getvalue() == vmap_bam.getvalue()
+    assert vpos_text.getvalue() == vpos_bam.getvalue()
+    assert expected_q_id_map == q_id_map
+    # Dense q_ids, in order of first appearance.
+    assert q_id_map == list(collections.OrderedDict.fromkeys(l.split()[0] for l in sam_lines))
+
+
+def test_load_q_id_map(tmpdir):
+    fn = str(tmpdir.join('q_id_map.msgpack'))
+    mod_het.write_q_id_map(fn, ['a/1/ccs', 'b/2/ccs'])
+    assert mod_het.load_q_id_map(fn) == ['a/1/ccs', 'b/2/ccs']
+    mod_het.io.serialize(fn, [(-5, 'a/1/ccs'), (77, 'b/2/ccs')])  # from older runs
+    assert mod_het.load_q_id_map(fn) == {-5: 'a/1/ccs', 77: 'b/2/ccs'}
+
+
+def test_pileup_window_grows():
+    window = mod_het.PileupWindow(capacity=4)
+    ref_pos = mod_het.np.arange(100, 120)
+    base_code = mod_het.np.zeros(20, dtype=mod_het.np.uint8)
+    for q_id in range(12):
+        window.add(q_id, ref_pos, base_code)
+    assert window.flush(110) == []  # homozygous
+    window.add(99, ref_pos[10:] + 5, base_code[10:])
+    assert window.counts[window.lo:window.hi, 0].tolist() == [12] * 5 + [13] * 5 + [1] * 5
+
+
+def test_make_het_call_map_from_regions(tmpdir):
+    bam_fn = str(tmpdir.join('aln.bam'))
+    ref = make_diploid_bam(bam_fn)
+
+    vmap_serial, vpos_serial = io.StringIO(), io.StringIO()
+    with pysam.AlignmentFile(bam_fn, 'rb') as bam:
+        vmap_w = mod_vmap.TextWriter(vmap_serial)
+        expected_q_id_map = mod_het.make_het_call_map_from_bam(ref, bam.fetch('000000F'), vmap_w, vpos_serial)
+        vmap_w.finish()
+
+    vmap_par, vpos_par = io.StringIO(), io.StringIO()
+    vmap_w = mod_vmap.TextWriter(vmap_par)
+    q_id_map = mod_het.make_het_call_map_from_regions(
+        ref, bam_fn, '000000F', vmap_w, vpos_par, n_proc=2, region_size=3001)
+    vmap_w.finish()
+
+    assert vmap_serial.getvalue() == vmap_par.getvalue()
+    assert vpos_serial.getvalue() == vpos_par.getvalue()
+    assert expected_q_id_map == q_id_map
+
+
+def make_vmaps(tmpdir):
+    """Het-call a synthetic contig into both a text and a binary vmap.
+    Return (text_fn, binary_fn, q_id_map).
+    """
+    bam_fn = str(tmpdir.join('aln.bam'))
+    ref = make_diploid_bam(bam_fn, n_reads=240)
+    text_fn = str(tmpdir.join('vmap.txt'))
+    binary_fn = str(tmpdir.join('vmap.bin'))
+    for fn, fmt in ((text_fn, 'text'), (binary_fn, 'binary')):
+        with mod_vmap.open_writer(fn, fmt) as vmap_w, pysam.AlignmentFile(bam_fn, 'rb') as bam:
+            q_id_map = mod_het.make_het_call_map_from_bam(ref, bam.fetch('000000F'), vmap_w, io.StringIO())
+            vmap_w.finish()
+    return text_fn, binary_fn, q_id_map
+
+
+def test_variant_map_binary(tmpdir):
+    text_fn, binary_fn, _ = make_vmaps(tmpdir)
+    assert mod_vmap.is_binary(binary_fn)
+    assert not mod_vmap.is_binary(text_fn)
+
+    binary = mod_vmap.load(binary_fn)
+    text = mod_vmap.load(text_fn)
+    assert len(text.pos) > 100
+    for got, expected in zip(binary, text):
+        assert got.tolist() == expected.tolist()
+
+    exported = io.StringIO()
+    mod_vmap.write_text(binary, exported)
+    assert exported.getvalue() == open(text_fn).read()
+
+
+def test_variant_map_incomplete(tmpdir):
+    _, binary_fn, _ = make_vmaps(tmpdir)
+    data = open(binary_fn, 'rb').read()
+
+    truncated_fn = str(tmpdir.join('truncated'))
+    with open(truncated_fn, 'wb') as f:
+        f.write(data[:-5])
+    with pytest.raises(Exception) as excinfo:
+        mod_vmap.load(truncated_fn)
+    assert 'footer' in str(excinfo.value)
+
+    corrupt_fn = str(tmpdir.join('corrupt'))
+    with open(corrupt_fn, 'wb') as f:
+        f.write(data[:20] + bytes([data[20] ^ 1]) + data[21:])
+    with pytest.raises(Exception) as excinfo:
+        mod_vmap.load(corrupt_fn)
+    assert 'Checksum' in str(excinfo.value)
+
+    text_fn = str(tmpdir.join('no-eof'))
+    with open(text_fn, 'w') as f:
+        f.write(mod_vmap.TEXT_HEADER + '\n101\tA\tC\t7\n')
+    with pytest.raises(Exception) as excinfo:
+        mod_vmap.load(text_fn)
+    assert 'No EOF' in str(excinfo.value)
+
+
+def test_phasing_from_binary_vmap(tmpdir):
+    text_fn, binary_fn, q_id_map = make_vmaps(tmpdir)
+    q_id_map_fn = str(tmpdir.join('q_id_map.msgpack'))
+    mod_het.write_q_id_map(q_id_map_fn, q_id_map)
+
+    outputs = []
+    for vmap_fn in (text_fn, binary_fn):
+        atable_fn = vmap_fn + '.atable'
+        p_variant_fn = vmap_fn + '.p_variant'
+        phased_reads_fn = vmap_fn + '.phased_reads'
+        mod_atable.generate_association_table(vmap_fn, atable_fn, '000000F')
+        mod_blocks.get_phased_blocks(vmap_fn, atable_fn, p_variant_fn)
+        mod_reads.get_phased_reads(phased_reads_fn, q_id_map_fn, vmap_fn, p_variant_fn, '000000F')
+        outputs.append([open(fn).read() for fn in (atable_fn, p_variant_fn, phased_reads_fn)])
+
+    assert outputs[0][2]  # Otherwise, the test proves nothing.
+    assert outputs[0] == outputs[1]
+
+
+def association_rows_pairwise(vmap_fn):
+    """The original association table: set intersections for each pair of sites.
+    """
+    sites = list(mod_vmap.iter_sites(mod_vmap.load(vmap_fn)))
+    for i1, (pos1, _, list1) in enumerate(sites):
+        link_count = 0
+        for pos2, _, list2 in sites[i1 + 1:]:
+            if pos2 - pos1 > (1 << 16):
+                continue
+            ct = [len(set(qids1.tolist()) & set(qids2.tolist())) for _, qids1 in list1 for _, qids2 in list2]
+            if sum(ct) < 6:
+                continue
+            yield tuple([pos1, list1[0][0], list1[1][0], pos2, list2[0][0], list2[1][0]] + ct)
+            link_count += 1
+            if link_count > 500:
+                break
+
+
+def test_association_rows(tmpdir):
+    # Dense sites, so some hit the link limit; reads sometimes repeated, or on both alleles.
+    rng = random.Random(7)
+    vmap_fn = str(tmpdir.join('vmap'))
+    read_ids = [r for r in range(1000) if rng.random() < 0.1]  # each starts at r*50, and spans 20kb
+    with mod_vmap.open_writer(vmap_fn) as vmap_w:
+        for pos in range(1000, 25000, 29):
+            bases = rng.sample('ACGT', 2)
+            reads = [r for r in read_ids if 0 <= pos - r * 50 < 20000 and rng.random() < 0.9]
+            vmap_w.add(pos, bases[0], bases[0], [r for r in reads if r % 2 or rng.random() < 0.05])
+            vmap_w.add(pos, bases[0], bases[1], [r for r in reads if not r % 2] + reads[:1])
+        vmap_w.finish()
+
+    rows = list(mod_atable.iter_association_rows(mod_vmap.load(vmap_fn)))
+    expected = list(association_rows_pairwise(vmap_fn))
+    assert len(rows) > 10000
+    assert max(collections.Counter(r[0] for r in rows).values()) == 501
+    assert rows == expected
+    for chunk_size in (100, 3000, 100000):
+        assert rows == list(mod_atable.iter_association_rows_streaming(mod_vmap.load(vmap_fn), chunk_size))
+
+
+def test_association_rows_empty(tmpdir):
+    # A contig with no het sites has an empty vmap, and so an empty atable.
+    for fmt in ('binary', 'text'):
+        vmap_fn = str(tmpdir.join('vmap.' + fmt))
+        with mod_vmap.open_writer(vmap_fn, fmt) as vmap_w:
+            vmap_w.finish()
+        vmap = mod_vmap.load(vmap_fn)
+        assert list(mod_atable.iter_association_rows(vmap)) == []
+        for chunk_size in (0, 100, mod_atable.CHUNK_SIZE):
+            assert list(mod_atable.get_association_rows(vmap, chunk_size)) == []
+            atable_fn = str(tmpdir.join('atable'))
+            mod_atable.generate_association_table(vmap_fn, atable_fn, '000000F', chunk_size)
+            assert open(atable_fn).read() == ''
+
+
+def test_get_phased_variants():
+    # Two blocks of variants with known phases, each linked to its next 5 neighbors.
+    # A few links are wrong, including the first link of a variant.
+    rng = random.Random(3)
+    positions = list(range(1000, 20000, 500)) + list(range(200000, 210000, 500))
+    truth = {p: rng.choice([1, -1]) for p in positions}
+    wrong = set([(3500, 6000), (10000, 11500), (200000, 202000)])
+    rows = []
+    for i, p1 in enumerate(positions):
+        for p2 in positions[i + 1:i + 6]:
+            if p2 - p1 > (1 << 16):
+                continue
+            cis, trans = (20, 2) if (truth[p1] == truth[p2]) != ((p1, p2) in wrong) else (2, 20)
+            rows.append((p1, 'A', 'C', p2, 'A', 'C', cis, trans, 0, 0))
+
+    phase_blocks = mod_blocks.get_phased_variants(rows)
+
+    assert [len(pb) for pb in phase_blocks] == [36, 18]
+    for pb in phase_blocks:
+        phases = set(truth[p] * (1 if b1 == 'A' else -1) for p, b1, _, _, _, _, _ in pb)
+        assert len(phases) == 1
+    assert phase_blocks[0][0] == (1500, 'A', 'C', 1000, 4000, 18, 90)
+
+
+def test_phasing_run(tmpdir):
+    bam_fn = str(tmpdir.join('aln.bam'))
+    ref = make_diploid_bam(bam_fn, n_reads=240)
+    fasta_fn = str(tmpdir.join('ref.fasta'))
+    with open(fasta_fn, 'w') as f:
+        f.write('>000000F\n{}\n'.format(ref))
+
+    def fn(name):
+        return str(tmpdir.join(name))
+    mod_het.make_het_call(bam_fn, fasta_fn, fn('vmap'), fn('vpos'), fn('q_id_map'), '000000F')
+    mod_atable.generate_association_table(fn('vmap'), fn('atable'), '000000F')
+    mod_blocks.get_phased_blocks(fn('vmap'), fn('atable'), fn('p_variant'))
+    mod_reads.get_phased_reads(fn('phased_reads'), fn('q_id_map'), fn('vmap'), fn('p_variant'), '000000F')
+
+    mod_run.phasing_run('000000F', bam_fn, fasta_fn, fn('run.p_variant'), fn('run.phased_reads'))
+    assert open(fn('phased_reads')).read()  # Otherwise, the test proves nothing.
+    for name in ('p_variant', 'phased_reads'):
+        assert open(fn(name)).read() == open(fn('run.' + name)).read()
+    assert not os.path.exists(fn('run.atable'))
+
+    mod_run.phasing_run('000000F', bam_fn, fasta_fn, fn('run.p_variant'), fn('run.phased_reads'),
+                        n_proc=2, region_size=7001, chunk_size=0,
+                        vmap_fn=fn('run.vmap'), vpos_fn=fn('run.vpos'), q_id_map_fn=fn('run.q_id_map'),
+                        atable_fn=fn('run.atable'))
+    for name in ('vmap', 'vpos', 'q_id_map', 'atable', 'p_variant', 'phased_reads'):
+        assert open(fn(name), 'rb').read() == open(fn('run.' + name), 'rb').read()
+
+
+def test_phasing_run_writes_vmap_once(tmpdir, monkeypatch):
+    bam_fn = str(tmpdir.join('aln.bam'))
+    ref = make_diploid_bam(bam_fn, n_reads=60)
+    fasta_fn = str(tmpdir.join('ref.fasta'))
+    with open(fasta_fn, 'w') as f:
+        f.write('>000000F\n{}\n'.format(ref))
+    calls = []
+    write_binary = mod_vmap.write_binary
+
+    def counting_write_binary(fn, vmap):
+        calls.append(fn)
+        write_binary(fn, vmap)
+    monkeypatch.setattr(mod_vmap, 'write_binary', counting_write_binary)
+
+    for n_proc in (1, 2):
+        del calls[:]
+        vmap_fn = str(tmpdir.join('run{}.vmap'.format(n_proc)))
+        mod_run.phasing_run('000000F', bam_fn, fasta_fn,
+                            str(tmpdir.join('p_variant')), str(tmpdir.join('phased_reads')),
+                            n_proc=n_proc, region_size=7001, vmap_fn=vmap_fn)
+        assert calls == [vmap_fn]
+
+
+def test_write_phased_reads():
+    # Random reads over random variants of 3 blocks, with some repeated rows.
+    rng = random.Random(11)
+    sites = sorted(rng.sample(range(1, 100000), 300))
+    vmap_w = mod_vmap.ArrayWriter()
+    variant_to_phase = {}
+    for i, pos in enumerate(sites):
+        b0, b1 = rng.sample('ACGT', 2)
+        reads = rng.sample(range(-50, 150), 40)
+        vmap_w.add(pos, 'A', b0, reads[:20] + reads[:2])
+        vmap_w.add(pos, 'A', b1, reads[20:])
+        if i % 7:
+            variant_to_phase[(pos, 'A', b0)] = (1 + i % 3, i % 2)
+            variant_to_phase[(pos, 'A', b1)] = (1 + i % 3, 1 - i % 2)
+    vmap = vmap_w.finish()
+    rid_map = dict((r, 'read{}'.format(r)) for r in range(-50, 150))
+
+    # The original loop, over sets of variants per read.
+    read_to_variants = collections.OrderedDict()
+    for row in zip(vmap.pos.tolist(), vmap.ref_base.tolist(), vmap.allele.tolist(), vmap.q_id.tolist()):
+        read_to_variants.setdefault(row[3], set()).add((row[0], chr(row[1]), chr(row[2])))
+    expected = io.StringIO()
+    for r, variants in read_to_variants.items():
+        vl = collections.Counter(variant_to_phase[v] for v in variants if v in variant_to_phase)
+        for p in sorted(set(p for p, _ in vl)):
+            if vl[(p, 0)] - vl[(p, 1)] > 1:
+                print(r, 'ctg', p, 0, vl[(p, 0)], vl[(p, 1)], rid_map[r], file=expected)
+            elif vl[(p, 1)] - vl[(p, 0)] > 1:
+                print(r, 'ctg', p, 1, vl[(p, 0)], vl[(p, 1)], rid_map[r], file=expected)
+
+    got = io.StringIO()
+    mod_reads.write_phased_reads(vmap, variant_to_phase, rid_map, 'ctg', got)
+    assert len(got.getvalue().splitlines()) > 100
+    assert got.getvalue() == expected.getvalue()
+
+
+def test_depth_cap(tmpdir):
+    bam_fn = str(tmpdir.join('aln.bam'))
+    ref = make_diploid_bam(bam_fn, n_reads=240)
+
+    caps = []
+    outputs = []
+    for n_proc in (1, 2):
+        depth_cap = mod_het.DepthCap(15)
+        vmap_f, vpos_f = io.StringIO(), io.StringIO()
+        vmap_w = mod_vmap.TextWriter(vmap_f)
+        if n_proc == 1:
+            with pysam.AlignmentFile(bam_fn, 'rb') as bam:
+                q_id_map = mod_het.make_het_call_map_from_bam(
+                    ref, bam.fetch('000000F'), vmap_w, vpos_f, depth_cap)
+        else:
+            q_id_map = mod_het.make_het_call_map_from_regions(
+                ref, bam_fn, '000000F', vmap_w, vpos_f, n_proc, 3001, depth_cap)
+        vmap_w.finish()
+        caps.append((depth_cap.n_alignments, depth_cap.n_dropped, depth_cap.capped_bp))
+        outputs.append((vmap_f.getvalue(), vpos_f.getvalue(), q_id_map))
+
+    assert caps[0] == caps[1]
+    assert outputs[0] == outputs[1]
+    n_alignments, n_dropped, capped_bp = caps[0]
+    assert n_alignments == 240
+    assert 40 < n_dropped < 200
+    assert 0 < capped_bp < 30000
+    # Every read with a name is still in the q_id_map, and the het calls are shallower.
+    assert len(outputs[0][2]) == 80
+    depths = [int(l.split()[2]) for l in outputs[0][1].splitlines() if not l.startswith('#')]
+    assert depths and max(depths) <= 25
+
+
+def test_depths_at_starts():
+    Aln = collections.namedtuple('Aln', ['reference_start', 'reference_end'])
+    alignments = [Aln(0, 10), Aln(2, 5), Aln(2, 3), Aln(5, 8), Aln(6, None), Aln(9, 12)]
+    # Each counts the alignments with start <= pos < end.
+    assert mod_het.depths_at_starts(alignments) == {0: 1, 2: 3, 5: 2, 6: 2, 9: 2}
@@ -0,0 +1,91 @@
+import falcon_unzip.rid_to_phase as mod
+import falcon_unzip.mains.phasing_convert_rid_to_phase as mod_convert
+import io
+import numpy as np
+import pytest
+
+
+RID_TO_PHASE = """\
+000000744 000000F -1 0
+000000003 000000F 1000001 0
+000000005 000001F 2000001 1
+000000004 000000F 1000001 1
+"""
+
+
+def check_table(table):
+    assert len(table) == 4
+    assert '000000744' in table
+    assert 744 in table
+    assert 6 not in table
+    assert 100000 not in table
+    assert None not in table
+    assert table['000000003'] == ('000000F', 1000001, 0)
+    assert table[5] == ('000001F', 2000001, 1)
+    assert table.get(6) is None
+    with pytest.raises(KeyError):
+        table[6]
+    assert table.contigs() == set(['000000F', '000001F'])
+    assert table.rids().tolist() == [3, 4, 5, 744]
+    assert table.rids('000000F').tolist() == [3, 4, 744]
+    assert table.rids('000002F').tolist() == []
+    ctg, block, phase = table.lookup([4, 6, 744, 1000])
+    assert [table.ctg_names[c] if c >= 0 else None for c in ctg.tolist()] == ['000000F', None, '000000F', None]
+    assert block.tolist() == [1000001, 0, -1, 0]
+    assert phase.tolist() == [1, 0, 0, 0]
+
+
+def test_load_text(tmpdir):
+    fn = str(tmpdir.join('rid_to_phase.all'))
+    with open(fn, 'w') as stream:
+        stream.write(RID_TO_PHASE)
+    table = mod.load(fn)
+    check_table(table)
+
+    out = io.StringIO()
+    mod.write_text(table, out)
+    assert sorted(out.getvalue().splitlines()) == sorted(RID_TO_PHASE.splitlines())
+
+
+def test_binary(tmpdir):
+    text_fn = str(tmpdir.join('rid_to_phase.all'))
+    bin_fn = str(tmpdir.join('rid_to_phase.bin'))
+    with open(text_fn, 'w') as stream:
+        stream.write(RID_TO_PHASE)
+    mod_convert.main(['prog', '--rid-phase-map', text_fn, '--out-fn', bin_fn])
+    assert mod.is_binary(bin_fn)
+    assert not mod.is_binary(text_fn)
+    table = mod.load(bin_fn)
+    check_table(table)
+    assert isinstance(table.ctg, np.ndarray) and not table.ctg.flags.writeable  # memory-mapped
+
+    # A truncated or corrupted file is an error.
+    with open(bin_fn, 'rb') as stream:
+        data = stream.read()
+    with open(bin_fn, 'wb') as stream:
+        stream.write(data[:-1])
+    with pytest.raises(Exception) as excinfo:
+        mod.load(bin_fn)
+    assert 'footer' in str(excinfo.value)
+    with open(bin_fn, 'wb') as stream:
+        stream.write(data[:20] + b'\1' + data[21:])
+    with pytest.raises(Exception) as excinfo:
+        mod.load(bin_fn)
+    assert 'Checksum' in str(excinfo.value)
+
+
+def test_empty(tmpdir):
+    fn = str(tmpdir.join('rid_to_phase.bin'))
+    mod.write_binary(fn, mod.from_rows([]))
+    table = mod.load(fn)
+    assert len(table) == 0
+    assert 0 not in table
+    assert table.contigs() == set()
+    assert table.lookup([0, 1])[0].tolist() == [-1, -1]
+
+
+def test_last_row_wins():
+    table = mod.from_rows([(2, 'a', 1, 0), (1, 'b', -1, 0), (2, 'b', 3, 1)])
+    assert table[2] == ('b', 3, 1)
+    assert table[1] == ('b', -1, 0)
+    assert table.contigs() == set(['b'])
@@ -0,0 +1,109 @@
+import falcon_unzip.sg_edges_list as mod
+import io
+import numpy as np
+import pytest
+
+
+# As from phased_ovlp_to_graph, with a duplicate edge at the end.
+SG_EDGES_LIST = """\
+000000002:B 000000001:B 000000001 3000 0 7000 99.0 G
+000000001:E 000000002:E 000000002 7000 10000 7000 99.0 G
+000000003:B 000000001:B 000000001 6000 0 4000 99.0 TR
+000000001:E 000000003:E 000000003 4000 10000 4000 99.0 TR
+000000004:B 000000001:B 000000001 5000 0 5000 99.0 CP
+000000002:B 000000001:B 000000001 3000 0 7000 99.5 R
+"""
+
+
+def check_table(table):
+    assert len(table) == 6
+    assert ('000000001:E', '000000003:E') in table
+    assert (3, 7) in table
+    assert ('000000003:E', '000000001:E') not in table
+    assert (3, 100000) not in table
+    assert None not in table
+    assert ('x', 'y') not in table
+    assert table[('000000003:B', '000000001:B')] == [
+        '000000003:B', '000000001:B', '000000001', '6000', '0', '4000', '99.0', 'TR']
+    # The last line of an edge wins, as in a dict.
+    assert table[(4, 2)][6:] == ['99.5', 'R']
+    assert table.find(4, 2) == 5
+    assert table.find(2, 4) == -1
+    assert table.get((2, 4)) is None
+    with pytest.raises(KeyError):
+        table[('000000001:B', '000000002:B')]
+    v, w = table.edges()
+    assert v.tolist() == [4, 3, 6, 3, 8, 4]
+    assert w.tolist() == [2, 5, 2, 7, 2, 2]
+
+
+def test_load_text(tmpdir):
+    fn = str(tmpdir.join('sg_edges_list'))
+    with open(fn, 'w') as stream:
+        stream.write(SG_EDGES_LIST)
+    table = mod.load(fn)
+    check_table(table)
+
+    out = io.StringIO()
+    mod.write_text(table, out)
+    assert out.getvalue() == SG_EDGES_LIST
+
+
+def test_binary(tmpdir):
+    text_fn = str(tmpdir.join('sg_edges_list'))
+    bin_fn = str(tmpdir.join('sg_edges_list.bin'))
+    with open(text_fn, 'w') as stream:
+        stream.write(SG_EDGES_LIST)
+    mod.write_binary(bin_fn, mod.load(text_fn))
+    assert mod.is_binary(bin_fn)
+    assert not mod.is_binary(text_fn)
+    table = mod.load(bin_fn)
+    check_table(table)
+    assert isinstance(table.key, np.ndarray) and not table.key.flags.writeable  # memory-mapped
+    out = io.StringIO()
+    mod.write_text(table, out)
+    assert out.getvalue() == SG_EDGES_LIST
+
+    # A truncated or corrupted file is an error.
+    with open(bin_fn, 'rb') as stream:
+        data = stream.read()
+    with open(bin_fn, 'wb') as stream:
+        stream.write(data[:-1])
+    with pytest.raises(Exception) as excinfo:
+        mod.load(bin_fn)
+    assert 'footer' in str(excinfo.value)
+    with open(bin_fn, 'wb') as stream:
+        stream.write(data[:20] + b'\1' + data[21:])
+    with pytest.raises(Exception) as excinfo:
+        mod.load(bin_fn)
+    assert 'Checksum' in str(excinfo.value)
+    mod.load(bin_fn, check=False)
+
+
+def test_empty(tmpdir):
+    fn = str(tmpdir.join('sg_edges_list.bin'))
+    mod.write_binary(fn, mod.from_arrays(*([[]] * 8)))
+    table = mod.load(fn)
+    assert len(table) == 0
+    assert (0, 1) not in table
+
+
+def test_concatenate():
+    a = mod.from_arrays([3, 4], [5, 2], [2, 1], [0, 0], [10, 20], [100, 200], [99.0, 98.5], [0, 1])
+    b = mod.from_arrays([3], [5], [2], [1], [11], [101], [97.0], [5])
+    table = mod.concatenate([a, b])
+    assert table.edges()[0].tolist() == [3, 4, 3]
+    assert table[(3, 5)][3:] == ['1', '11', '101', '97.0', 'CP']
+    assert table[(4, 2)][3:] == ['0', '20', '200', '98.5', 'TR']
+
+
+def test_subset(tmpdir):
+    fn = str(tmpdir.join('sg_edges_list'))
+    with open(fn, 'w') as stream:
+        stream.write(SG_EDGES_LIST)
+    table = mod.subset(mod.load(fn), [(8, 2), (2, 4), (4, 2)])
+    out = io.StringIO()
+    mod.write_text(table, out)
+    lines = SG_EDGES_LIST.splitlines(True)
+    assert out.getvalue() == lines[4] + lines[5]
+    assert len(mod.subset(table, [])) == 0